@@ -0,0 +1,213 @@
+"""
+Benchmark end-to-end folder-open latency of addon.run against the local portal emulator
+
+Every action is run with cold caches for each catalogue size and reports the median wall time,
+Python CPU time, portal request count, bytes received after decoding and bytes transferred. The
+emulator runs in a separate process so CPU time covers the addon only.
+
+Usage: python -m benchmarks.bench_folders [--sizes 100 1000] [--repeat 5] [--latency 0] [--compress]
+                                          [--update-baselines | --check [--check-timings] [--tolerance 0.5]]
+
+--check compares the request counts and bytes, which do not depend on the machine. Timings are only
+compared with --check-timings, against baselines recorded on the same machine.
+"""
+from __future__ import absolute_import, division, unicode_literals
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import contextlib
+import statistics
+import subprocess
+from urllib.parse import urlsplit
+import xbmcgui
+from lib.addon import run
+from lib.cache import ResponseCache
+from lib.globals import G
+from lib.session import PortalSession
+
+BASELINES_FILE = os.path.join(os.path.dirname(__file__), 'baselines', 'folders.json')
+PLUGIN_URL = 'plugin://plugin.video.stalkervod/'
+ACTIONS = {
+    'vod_listing': '?action=vod_listing&category=All&category_id=*&page=1&update_listing=False',
+    'series_listing': '?action=series_listing&category=All&category_id=*&page=1&update_listing=False',
+    'tv_listing': '?action=tv_listing&category=All&category_id=*&page=1&update_listing=False',
+    'season_listing': '?action=season_listing&video_id=200000&name=Series+1&poster_url=http%3A%2F%2F127.0.0.1%2Fposter.jpg',
+    'sub_folder': '?action=sub_folder&video_id=200000%3A1&start=1&end=20&name=Series+1+S1&poster_url=http%3A%2F%2F127.0.0.1%2Fposter.jpg'
+}
+# Timings within this many ms of the baseline are noise
+NOISE_FLOOR_MS = 5
+
+
+class StubWindow:
+    """Window properties, missing from the Kodi stubs"""
+
+    def __init__(self, window_id):
+        self.window_id = window_id
+
+    def setProperty(self, key, value):  # pylint: disable=invalid-name
+        """Ignore property"""
+
+    def getProperty(self, key):  # pylint: disable=invalid-name,unused-argument
+        """No property set"""
+        return ''
+
+
+class Counter:
+    """Counts portal responses, their decoded and transferred bytes through a session hook"""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.transferred = 0
+
+    def __call__(self, response, *args, **kwargs):
+        self.requests += 1
+        self.bytes += len(response.content)
+        self.transferred += response.raw.tell()
+
+
+def start_portal(size, latency, compress):
+    """Run the emulator in a child process, returns process and portal url"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-m', 'tests.fake_portal', '--port', str(port), '--catalogue-size', str(size),  # pylint: disable=consider-using-with
+                                '--latency', str(latency)] + (['--gzip'] if compress else []), stdout=subprocess.PIPE, universal_newlines=True)
+    process.stdout.readline()
+    return process, 'http://127.0.0.1:{}/stalker_portal/server/load.php'.format(port)
+
+
+def configure(portal_url):
+    """Point the addon at the emulator"""
+    G.portal_config.portal_url = portal_url
+    G.portal_config.server_address = portal_url.replace('/server/load.php', '/c/')
+    split_url = urlsplit(portal_url)
+    G.portal_config.portal_base_url = '{}://{}'.format(split_url.scheme, split_url.netloc)
+
+
+@contextlib.contextmanager
+def emulated_portal(portal_url):
+    """Keep the addon on the emulator, run reloads the settings on every invocation"""
+    init_globals = G.init_globals
+
+    def reload():
+        init_globals()
+        configure(portal_url)
+
+    G.init_globals = reload
+    try:
+        configure(portal_url)
+        yield
+    finally:
+        del G.init_globals
+
+
+def measure(action, repeat):
+    """Median wall ms, CPU ms, request count and bytes of one action"""
+    argv = [PLUGIN_URL, '1', ACTIONS[action]]
+    counter = Counter()
+    PortalSession.get_session().hooks['response'].append(counter)
+    walls, cpus = [], []
+    try:
+        for _ in range(repeat):
+            ResponseCache.clear_all()
+            counter.requests = counter.bytes = counter.transferred = 0
+            sys.argv = argv[:2]
+            wall, cpu = time.perf_counter(), time.process_time()
+            run(argv)
+            walls.append((time.perf_counter() - wall) * 1000)
+            cpus.append((time.process_time() - cpu) * 1000)
+    finally:
+        PortalSession.get_session().hooks['response'].remove(counter)
+    return {'wall_ms': round(statistics.median(walls), 2), 'cpu_ms': round(statistics.median(cpus), 2),
+            'requests': counter.requests, 'bytes': counter.bytes, 'transferred': counter.transferred}
+
+
+def run_benchmarks(sizes, repeat, latency, compress):
+    """Results keyed by action@size"""
+    results = {}
+    for size in sizes:
+        process, portal_url = start_portal(size, latency, compress)
+        try:
+            with emulated_portal(portal_url):
+                # Handshake outside the measurements, the service keeps the token fresh
+                measure('season_listing', 1)
+                for action in ACTIONS:
+                    results['{}@{}'.format(action, size)] = measure(action, repeat)
+        finally:
+            process.terminate()
+            process.wait()
+            PortalSession.close()
+    return results
+
+
+def check(results, baselines, tolerance=None):
+    """Regressions against the baselines, timings are only compared with a tolerance"""
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        if result['requests'] > baseline['requests']:
+            regressions.append('{} requests {} > {}'.format(key, result['requests'], baseline['requests']))
+        for metric in ('bytes', 'transferred'):
+            if metric in baseline and result[metric] > baseline[metric] * 1.1:
+                regressions.append('{} {} {} > {}'.format(key, metric, result[metric], baseline[metric]))
+        for metric in ('wall_ms', 'cpu_ms') if tolerance is not None else ():
+            limit = max(baseline[metric] * (1 + tolerance), baseline[metric] + NOISE_FLOOR_MS)
+            if result[metric] > limit:
+                regressions.append('{} {} {:.2f} > {:.2f}'.format(key, metric, result[metric], limit))
+    return regressions
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000], help='catalogue sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per action')
+    parser.add_argument('--latency', type=float, default=0, help='emulated portal latency in ms')
+    parser.add_argument('--compress', action='store_true', help='emulated portal gzips responses')
+    parser.add_argument('--update-baselines', action='store_true', help='store results as the new baselines')
+    parser.add_argument('--check', action='store_true', help='fail when results regress against the baselines')
+    parser.add_argument('--check-timings', action='store_true', help='also fail --check on timings, baselines must come from this machine')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative slowdown for --check-timings')
+    args = parser.parse_args()
+
+    if not hasattr(xbmcgui, 'Window'):
+        xbmcgui.Window = StubWindow
+    sys.argv = [PLUGIN_URL, '1']
+    G.init_globals()
+    G.addon_config.token_path = tempfile.mkdtemp()
+    try:
+        # The Kodi stubs print the addon log to stdout
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results = run_benchmarks(args.sizes, args.repeat, args.latency, args.compress)
+    finally:
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+
+    print('{:<24} {:>10} {:>10} {:>9} {:>10} {:>12}'.format('action@size', 'wall ms', 'cpu ms', 'requests', 'bytes', 'transferred'))
+    for key, result in results.items():
+        print('{:<24} {wall_ms:>10.2f} {cpu_ms:>10.2f} {requests:>9} {bytes:>10} {transferred:>12}'.format(key, **result))
+
+    if args.update_baselines:
+        os.makedirs(os.path.dirname(BASELINES_FILE), exist_ok=True)
+        with open(BASELINES_FILE, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Baselines written to {}'.format(BASELINES_FILE))
+    elif args.check:
+        with open(BASELINES_FILE, 'r') as f:
+            regressions = check(results, json.load(f), args.tolerance if args.check_timings else None)
+        for regression in regressions:
+            print('REGRESSION {}'.format(regression))
+        if regressions:
+            sys.exit(1)
+        print('No regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark the trigram index of catalogue titles on a synthetic catalogue
+
+Builds the index of the titles bench_search generates, saves and loads it as the plugin does, then times
+searches of titles with one typo and completions of title prefixes against a scan of the trigram sets of all
+titles, the naive way to match them. Recall is the share of typo searches listing the intended title in their
+first 10 results.
+
+Usage: python -m benchmarks.bench_fuzzy [--titles 100000] [--queries 50] [--repeat 5]
+"""
+from __future__ import absolute_import, division, unicode_literals
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from lib.trigram import TrigramIndex
+from benchmarks.bench_search import get_titles
+
+
+def get_typo(rand, title):
+    """Title with one character of a word of 4 or more letters swapped, dropped or replaced"""
+    words = title.split(' ')
+    candidates = [index for index, word in enumerate(words) if len(word) >= 4]
+    if not candidates:
+        return title
+    index = rand.choice(candidates)
+    word = words[index]
+    position = rand.randrange(1, len(word) - 1)
+    edit = rand.choice(('swap', 'drop', 'replace'))
+    if edit == 'swap':
+        word = word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    elif edit == 'drop':
+        word = word[:position] + word[position + 1:]
+    else:
+        word = word[:position] + rand.choice('aeiouxz') + word[position + 1:]
+    words[index] = word
+    return ' '.join(words)
+
+
+def measure(function, queries, repeat):
+    """Median ms per query over repeat runs and the results of the last run"""
+    timings = []
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [function(query) for query in queries]
+        timings.append((time.perf_counter() - start) * 1000 / len(queries))
+    return statistics.median(timings), results
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--titles', type=int, default=100000, help='titles in the catalogue')
+    parser.add_argument('--queries', type=int, default=50, help='queries of each kind')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query')
+    args = parser.parse_args()
+
+    titles = [(int(title['id']), title['name']) for title in get_titles(args.titles)[0]]
+    path = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        index = TrigramIndex.build(titles)
+        build_seconds = time.perf_counter() - start
+        file_path = os.path.join(path, 'catalogue.trigrams')
+        index.save(file_path)
+        start = time.perf_counter()
+        index = TrigramIndex.load(file_path)
+        load_ms = (time.perf_counter() - start) * 1000
+        print('Indexed {} titles in {:.2f} s, index {:.1f} MB, loaded in {:.1f} ms'.format(
+            len(index), build_seconds, os.path.getsize(file_path) / 1024 / 1024, load_ms))
+
+        rand = random.Random(2)
+        targets = rand.sample(titles, args.queries)
+        typos = [get_typo(rand, name) for _, name in targets]
+        prefixes = [name[:rand.randint(3, 6)] for _, name in targets]
+        search_ms, results = measure(lambda query: index.search(query, 10), typos, args.repeat)
+        recall = sum(1 for (_id, name), result in zip(targets, results)
+                     if _id in [match[0] for match in result] or name in [index.get_title(match[0]) for match in result])
+        complete_ms, results = measure(lambda query: index.complete(query, 10), prefixes, args.repeat)
+        completed = sum(1 for result in results if result)
+
+        # The naive alternative, the trigrams of every title kept as sets and scanned
+        trigram_sets = [TrigramIndex.get_trigrams(name) for _, name in titles]
+
+        def scan(query):
+            trigrams = TrigramIndex.get_trigrams(query)
+            return sorted(((len(trigrams & title_trigrams), position) for position, title_trigrams in enumerate(trigram_sets)), reverse=True)[:10]
+
+        scan_ms, _ = measure(scan, typos[:5], 1)
+        print('{:<12} {:>10} {:>8}'.format('query', 'ms', 'found'))
+        print('{:<12} {:>10.2f} {:>7}%'.format('typo', search_ms, 100 * recall // len(typos)))
+        print('{:<12} {:>10.2f} {:>7}%'.format('prefix', complete_ms, 100 * completed // len(prefixes)))
+        print('{:<12} {:>10.2f}'.format('typo scan', scan_ms))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
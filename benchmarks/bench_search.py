@@ -0,0 +1,115 @@
+"""
+Benchmark offline search of the local catalogue on a synthetic catalogue
+
+Fills a catalogue in a temporary profile directory page by page as the sync does, then times full-text
+searches against a LIKE scan of the stored records, the naive way to search them locally. Titles are built
+from a generated vocabulary with a natural word frequency distribution. Full-text matches are capped at 500.
+
+Usage: python -m benchmarks.bench_search [--titles 100000] [--repeat 5]
+"""
+from __future__ import absolute_import, division, unicode_literals
+import os
+import time
+import random
+import sqlite3
+import shutil
+import itertools
+import argparse
+import tempfile
+import statistics
+from lib.catalogue import Catalogue
+from lib.globals import G
+
+KEY = ('vod', '*', 0)
+PAGE_SIZE = 1000
+SYLLABLES = ('ka', 'lo', 'ré', 'mi', 'sa', 'to', 'nö', 'ri', 'ta', 'be', 'ña', 'du', 'vi', 'el', 'on', 'mar', 'ste', 'gra', 'cé', 'lin',
+             'por', 'dan', 'fu', 'qui', 'ber', 'sol', 'ma', 'ne', 'zo', 'ül')
+
+
+def get_vocabulary(rand, count=20000):
+    """Distinct pseudo words, some with diacritics, most frequent first"""
+    words = []
+    seen = set()
+    while len(words) < count:
+        word = ''.join(rand.choice(SYLLABLES) for _ in range(rand.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def get_titles(count, seed=1):
+    """Synthetic VOD records, words follow a Zipf distribution like natural text, and the queries to time"""
+    rand = random.Random(seed)
+    words = get_vocabulary(rand)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    people = [word.title() for word in words[:2000]]
+
+    def get_text(length):
+        """Words drawn by frequency"""
+        return ' '.join(rand.choices(words, cum_weights=cum_weights, k=length))
+
+    titles = []
+    for index in range(count):
+        titles.append({'id': str(index), 'name': get_text(rand.randint(1, 4)).title(), 'added': '2024-01-01 00:00:00',
+                       'description': get_text(30),
+                       'actors': ', '.join('{} {}'.format(rand.choice(people), rand.choice(people)) for _ in range(3)),
+                       'director': '{} {}'.format(rand.choice(people), rand.choice(people))})
+    accented = next(word for word in words[100:] if any(char in word for char in 'éöñü'))
+    folded = accented.replace('é', 'e').replace('ö', 'o').replace('ñ', 'n').replace('ü', 'u')
+    queries = [('common word', words[2]), ('frequent word', words[50]), ('rare word', words[5000]), ('two words', '{} {}'.format(words[10], words[300])),
+               ('prefix', words[200][:4]), ('folded diacritics', folded.upper()), ('no match', 'qqqq')]
+    return titles, queries
+
+
+def build(titles):
+    """Sync the titles page by page, returns seconds"""
+    start = time.perf_counter()
+    with Catalogue() as catalogue:
+        for page in range(1, len(titles) // PAGE_SIZE + 2):
+            data = titles[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+            if catalogue.add_page(KEY, page, {'total_items': len(titles), 'max_page_items': PAGE_SIZE, 'data': data}):
+                break
+    return time.perf_counter() - start
+
+
+def measure(search, query, repeat):
+    """Median ms of a search and its result count"""
+    timings = []
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = search(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), count
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--titles', type=int, default=100000, help='titles in the catalogue')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query')
+    args = parser.parse_args()
+
+    G.addon_config.token_path = tempfile.mkdtemp()
+    try:
+        titles, queries = get_titles(args.titles)
+        seconds = build(titles)
+        print('Synced and indexed {} titles in {:.2f} s, database {:.1f} MB'.format(
+            args.titles, seconds, os.path.getsize(Catalogue.get_path()) / 1024 / 1024))
+        connection = sqlite3.connect(Catalogue.get_path())
+        with Catalogue() as catalogue:
+            print('{:<18} {:<14} {:>10} {:>8} {:>10} {:>8}'.format('query', 'term', 'fts ms', 'matches', 'like ms', 'matches'))
+            for label, query in queries:
+                fts_ms, fts_count = measure(lambda term: catalogue.search(KEY, term, 1, 2, 3600)['total_items'], query, args.repeat)
+                like_ms, like_count = measure(lambda term: len(connection.execute(
+                    'SELECT id FROM items WHERE ' + ' AND '.join(['record LIKE ?'] * len(term.split())),
+                    ['%{}%'.format(word) for word in term.split()]).fetchall()), query, args.repeat)
+                print('{:<18} {:<14} {:>10.2f} {:>8} {:>10.2f} {:>8}'.format(label, query, fts_ms, fts_count, like_ms, like_count))
+        connection.close()
+    finally:
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
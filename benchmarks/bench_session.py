@@ -0,0 +1,86 @@
+"""
+Benchmark per-request latency of bare requests.get against the pooled PortalSession
+
+A local stand-in portal adds a fixed delay whenever a new TCP connection is accepted
+to emulate the TCP+TLS setup cost of a distant portal.
+
+Usage: python -m benchmarks.bench_session [--requests 50] [--connect-delay 100]
+"""
+from __future__ import absolute_import, division, unicode_literals
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from lib.session import PortalSession
+
+RESPONSE = json.dumps({'js': [{'id': '*', 'title': 'All'}]}).encode('utf-8')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every GET with a small JSON body over keep-alive connections"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connect_delay = 0.0
+
+    def setup(self):
+        """Called once per accepted connection"""
+        time.sleep(self.connect_delay)
+        super().setup()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve JSON"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silence request logging"""
+
+
+def measure(get, url, count):
+    """Return per-request latencies in ms"""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = get(url=url, headers={}, params={'type': 'vod', 'action': 'get_categories'}, timeout=30)
+        response.json()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    """Print summary line"""
+    print('{:<16} mean={:8.2f}ms  median={:8.2f}ms  p95={:8.2f}ms'.format(
+        name, statistics.mean(latencies), statistics.median(latencies),
+        sorted(latencies)[int(len(latencies) * 0.95) - 1]))
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50, help='requests per client')
+    parser.add_argument('--connect-delay', type=float, default=100, help='emulated connection setup cost in ms')
+    args = parser.parse_args()
+
+    StandInHandler.connect_delay = args.connect_delay / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/stalker_portal/server/load.php'.format(server.server_address[1])
+    try:
+        bare = measure(requests.get, url, args.requests)
+        pooled = measure(PortalSession.get, url, args.requests)
+    finally:
+        PortalSession.close()
+        server.shutdown()
+    report('requests.get', bare)
+    report('PortalSession', pooled)
+    print('speedup          {:.1f}x'.format(statistics.mean(bare) / statistics.mean(pooled)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark plugin start up, from interpreter start to endOfDirectory
+
+Every run starts a fresh interpreter which executes addon_entry.py the way Kodi does and reports
+when xbmcplugin.endOfDirectory is called. The eager run imports requests up front, as the plugin
+did before its imports were deferred, to show what the lazy import graph saves.
+
+Usage: python -m benchmarks.bench_startup [--repeat 10] [--action sub_folder]
+"""
+from __future__ import absolute_import, division, unicode_literals
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_URL = 'plugin://plugin.video.stalkervod/'
+# Routes which make no portal call, so the timings cover start up only
+ACTIONS = {
+    'sub_folder': '?action=sub_folder&video_id=200000%3A1&start=1&end=20&name=Series+1+S1&poster_url=http%3A%2F%2F127.0.0.1%2Fposter.jpg'
+}
+MARKER = 'END_OF_DIRECTORY'
+CHILD = '''
+import sys
+import time
+import runpy
+import xbmcplugin
+if sys.argv[1] == 'eager':
+    import requests
+end_of_directory = xbmcplugin.endOfDirectory
+
+def timed_end_of_directory(*args, **kwargs):
+    """Report the time and whether requests was loaded"""
+    end_of_directory(*args, **kwargs)
+    print('{} {} {}'.format(MARKER, time.time(), 'requests' in sys.modules), flush=True)
+
+xbmcplugin.endOfDirectory = timed_end_of_directory
+sys.argv = sys.argv[2:]
+runpy.run_path('addon_entry.py', run_name='__main__')
+'''.replace('MARKER', repr(MARKER))
+
+
+def measure(mode, query):
+    """Milliseconds from spawning the interpreter to endOfDirectory, and whether requests was loaded"""
+    start = time.time()
+    output = subprocess.run([sys.executable, '-c', CHILD, mode, PLUGIN_URL, '1', query], cwd=ROOT_DIR, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    for line in output.splitlines():
+        if line.startswith(MARKER):
+            _, end, requests_loaded = line.split()
+            return (float(end) - start) * 1000, requests_loaded == 'True'
+    raise RuntimeError('endOfDirectory was not called:\n{}'.format(output))
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='runs per action')
+    parser.add_argument('--action', choices=sorted(ACTIONS), nargs='+', default=sorted(ACTIONS), help='actions to run')
+    args = parser.parse_args()
+
+    print('{:<16} {:<6} {:>10} {:>10} {:>9}'.format('action', 'mode', 'median ms', 'min ms', 'requests'))
+    for action in args.action:
+        for mode in ('lazy', 'eager'):
+            # Warm up the file system cache
+            measure(mode, ACTIONS[action])
+            runs = [measure(mode, ACTIONS[action]) for _ in range(args.repeat)]
+            timings = [timing for timing, _ in runs]
+            print('{:<16} {:<6} {:>10.2f} {:>10.2f} {:>9}'.format(action, mode, statistics.median(timings), min(timings),
+                                                                   'loaded' if runs[0][1] else 'deferred'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Micro-benchmark plugin url building of a video listing, G.get_plugin_url against PluginUrl templates
+
+Every item gets a favorite context menu url and a play url, as in the VOD listing.
+
+Usage: python -m benchmarks.bench_urls [--items 10000] [--repeat 5]
+"""
+from __future__ import absolute_import, division, unicode_literals
+import time
+import argparse
+import statistics
+from lib.globals import G
+from lib.plugin_url import PluginUrl
+
+PLUGIN_URL = 'plugin://plugin.video.stalkervod/'
+
+
+def get_videos(count):
+    """Video records with the fields used in urls"""
+    return [{'id': str(100000 + index), 'name': 'Movie {} - The Sequel'.format(index + 1),
+             'cmd': 'ffrt http://127.0.0.1/media/{}.mpg'.format(index)} for index in range(count)]
+
+
+def build_dict_urls(videos):
+    """Urls built from a fresh dict per item"""
+    for video in videos:
+        G.get_plugin_url({'action': 'add_fav', 'video_id': video['id'], '_type': 'vod'})
+        G.get_plugin_url({'action': 'play', 'video_id': video['id'], 'series': 0, 'title': video['name'], 'cmd': video.get('cmd', '')})
+
+
+def build_template_urls(videos):
+    """Urls built from templates created once per listing"""
+    add_fav_url = PluginUrl({'action': 'add_fav', 'video_id': PluginUrl.FIELD, '_type': 'vod'})
+    play_url = PluginUrl({'action': 'play', 'video_id': PluginUrl.FIELD, 'series': 0, 'title': PluginUrl.FIELD, 'cmd': PluginUrl.FIELD})
+    for video in videos:
+        add_fav_url.build(video['id'])
+        play_url.build(video['id'], video['name'], video.get('cmd', ''))
+
+
+def measure(build, videos, repeat):
+    """Median ms of building the listing urls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build(videos)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    """Run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=10000, help='videos in the listing')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per variant')
+    args = parser.parse_args()
+
+    G.addon_config.url = PLUGIN_URL
+    videos = get_videos(args.items)
+    dict_ms = measure(build_dict_urls, videos, args.repeat)
+    template_ms = measure(build_template_urls, videos, args.repeat)
+    print('{:<20} {:>10.2f} ms'.format('G.get_plugin_url', dict_ms))
+    print('{:<20} {:>10.2f} ms  ({:.1f}x)'.format('PluginUrl', template_ms, dict_ms / template_ms))
+
+
+if __name__ == '__main__':
+    main()
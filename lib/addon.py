@@ -4,6 +4,8 @@ Compatible with Kodi 19.x "Matrix" and above
 from __future__ import absolute_import, division, unicode_literals
 import re
 import math
+import dataclasses
+from typing import Callable
 from urllib.parse import parse_qsl
 import xbmc
 import xbmcgui
@@ -11,25 +13,49 @@ import xbmcplugin
 from .globals import G
 from .utils import ask_for_input, get_int_value, ask_for_category_selection
 from .api import Api
+from .auth import AuthError
+from .cache import ResponseCache
+from .prefetch import Prefetcher
+from .session import PortalSession
+from .metrics import Metrics
+from .plugin_url import PluginUrl
+from .models import VodItem, SeriesItem, Channel
 from .loggers import Logger
 
 
+@dataclasses.dataclass(frozen=True)
+class Route:
+    """Plugin action handler, the params it requires and the content type of its listing"""
+    handler: Callable
+    required: tuple = ()
+    content: str = None
+
+
 class StalkerAddon:
     """Stalker Addon"""
     @staticmethod
     def __toggle_favorites(video_id, add, _type):
         """Remove/add favorites and refresh"""
-        Logger.debug('Toggle Favorites video_id={}, add={}, _type={}'.format(video_id, add, _type))
+        Logger.debug('Toggle Favorites video_id=%s, add=%s, _type=%s', video_id, add, _type)
         if add:
             Api.add_favorites(video_id, _type)
         else:
             Api.remove_favorites(video_id, _type)
         xbmc.executebuiltin('Container.Refresh')
 
+    @staticmethod
+    def __clear_cache():
+        """Clear cached portal responses and the catalogue"""
+        from .catalogue import Catalogue  # pylint: disable=import-outside-toplevel
+        Logger.debug('Clear cache')
+        ResponseCache.clear_all()
+        Catalogue.clear()
+        xbmcgui.Dialog().notification(G.addon_config.name, 'Cache cleared', xbmcgui.NOTIFICATION_INFO)
+
     @staticmethod
     def __play_video(params):
         """Play video"""
-        Logger.debug('Play video {}'.format(params))
+        Logger.debug('Play video %s', params)
         stream_url = Api.get_vod_stream_url(params['video_id'], params['series'], params.get('cmd', ''), params.get('use_cmd', '0'))
         play_item = xbmcgui.ListItem(path=stream_url)
         video_info = play_item.getVideoInfoTag()
@@ -48,7 +74,7 @@ class StalkerAddon:
     @staticmethod
     def __play_tv(params):
         """Play TV Channel"""
-        Logger.debug('Play TV {}'.format(params))
+        Logger.debug('Play TV %s', params)
         stream_url = Api.get_tv_stream_url(params)
         play_item = xbmcgui.ListItem(path=stream_url)
         xbmcplugin.setResolvedUrl(G.get_handle(), True, listitem=play_item)
@@ -58,7 +84,6 @@ class StalkerAddon:
         """List the TV channel genres"""
         Logger.debug('List TV Genres')
         xbmcplugin.setPluginCategory(G.get_handle(), 'TV CHANNELS')
-        xbmcplugin.setContent(G.get_handle(), 'videos')
         list_item = xbmcgui.ListItem(label='TV FAVORITES')
         url = G.get_plugin_url({'action': 'tv_favorites', 'page': 1, 'update_listing': False})
         xbmcplugin.addDirectoryItem(G.get_handle(), url, list_item, True)
@@ -87,7 +112,6 @@ class StalkerAddon:
         """List vod categories"""
         Logger.debug('List VOD Categories')
         xbmcplugin.setPluginCategory(G.get_handle(), 'VOD')
-        xbmcplugin.setContent(G.get_handle(), 'videos')
 
         list_item = xbmcgui.ListItem(label='VOD FAVORITES')
         url = G.get_plugin_url({'action': 'vod_favorites', 'page': 1, 'update_listing': False})
@@ -116,7 +140,6 @@ class StalkerAddon:
         """List series categories"""
         Logger.debug('List Series Categories')
         xbmcplugin.setPluginCategory(G.get_handle(), 'SERIES')
-        xbmcplugin.setContent(G.get_handle(), 'videos')
 
         list_item = xbmcgui.ListItem(label='SERIES FAVORITES')
         url = G.get_plugin_url({'action': 'series_favorites', 'page': 1, 'update_listing': False})
@@ -143,98 +166,90 @@ class StalkerAddon:
     @staticmethod
     def __list_channels(params):
         """List the TV Channels"""
-        Logger.debug('List Channels {}'.format(params))
+        Logger.debug('List Channels %s', params)
         search_term = params.get('search_term', '')
         page = params['page']
         plugin_category = 'TV - ' + params['category'] if params.get('fav', '0') != '1' else 'TV - ' + params['category'] + ' - FAVORITES'
         xbmcplugin.setPluginCategory(G.get_handle(), plugin_category)
-        xbmcplugin.setContent(G.get_handle(), 'videos')
-        videos = Api.get_tv_channels(params['category_id'], page, search_term, params.get('fav', 0))
+        videos = Api.get_tv_channels(params['category_id'], page, search_term, params.get('fav', 0), stream=True)
         StalkerAddon.__create_tv_listing(videos, params)
 
     @staticmethod
     def __create_tv_listing(videos, params):
-        update_listing = params['update_listing']
-        item_count = len(videos['data'])
+        """Create paginated listing"""
+        StalkerAddon.__end_listing(StalkerAddon.__get_tv_items(videos), videos, params)
+
+    @staticmethod
+    def __get_tv_items(videos):
+        """Directory items of TV channels"""
         directory_items = []
-        for video in videos['data']:
-            label = video['name']
-            if video.get('fav', 0) == 1:
-                label = label + ' ★'
+        add_fav_url, remove_fav_url = StalkerAddon.__get_favorite_urls('itv')
+        play_url = PluginUrl({'action': 'tv_play', 'cmd': PluginUrl.FIELD, 'use_http_tmp_link': PluginUrl.FIELD, 'use_load_balancing': PluginUrl.FIELD})
+        for channel in Channel.from_response(videos):
+            label = channel.name + ' ★' if channel.fav else channel.name
             list_item = xbmcgui.ListItem(label, label)
             video_info = list_item.getVideoInfoTag()
             video_info.setPlaycount(0)
             list_item.setProperty('IsPlayable', 'true')
-            if video.get('fav', 0) == 1:
-                url = G.get_plugin_url({'action': 'remove_fav', 'video_id': video['id'], '_type': 'itv'})
+            if channel.fav:
+                url = remove_fav_url.build(channel.id)
                 list_item.addContextMenuItems([('Remove from favorites', f'RunPlugin({url}, False)')])
             else:
-                url = G.get_plugin_url({'action': 'add_fav', 'video_id': video['id'], '_type': 'itv'})
+                url = add_fav_url.build(channel.id)
                 list_item.addContextMenuItems([('Add to favorites', f'RunPlugin({url}, False)')])
-            if 'logo' in video:
-                list_item.setArt({'icon': video['logo'], 'thumb': video['logo'], 'clearlogo': video['logo']})
-            url = G.get_plugin_url({'action': 'tv_play', 'cmd': video['cmd'], 'use_http_tmp_link': video.get('use_http_tmp_link', 0), 'use_load_balancing': video.get('use_load_balancing', 0)})
+            if channel.logo is not None:
+                list_item.setArt({'icon': channel.logo, 'thumb': channel.logo, 'clearlogo': channel.logo})
+            url = play_url.build(channel.cmd, channel.use_http_tmp_link, channel.use_load_balancing)
             directory_items.append((url, list_item, False))
-        total_items = get_int_value(videos, 'total_items')
-        if total_items > item_count:
-            StalkerAddon.__add_navigation_items(params, videos, directory_items)
-            item_count = item_count + 2
-        xbmcplugin.addDirectoryItems(G.get_handle(), directory_items, item_count)
-        xbmcplugin.endOfDirectory(G.get_handle(), succeeded=True, updateListing=update_listing == 'True', cacheToDisc=False)
+        return directory_items
 
     @staticmethod
     def __list_vod(params):
         """List videos for a category"""
-        Logger.debug('List VOD {}'.format(params))
+        Logger.debug('List VOD %s', params)
         search_term = params.get('search_term', '')
         plugin_category = 'VOD - ' + params['category'] if params.get('fav', '0') != '1' else 'VOD - ' + params['category'] + ' - FAVORITES'
         xbmcplugin.setPluginCategory(G.get_handle(), plugin_category)
-        xbmcplugin.setContent(G.get_handle(), 'videos')
-        videos = Api.get_videos(params['category_id'], params['page'], search_term, params.get('fav', 0))
+        videos = Api.get_videos(params['category_id'], params['page'], search_term, params.get('fav', 0), stream=True)
         StalkerAddon.__create_video_listing(videos, params)
 
     @staticmethod
     def __list_vod_favorites(params):
         """List Favorites Channels"""
-        Logger.debug('List VOD Favorites {}'.format(params))
+        Logger.debug('List VOD Favorites %s', params)
         xbmcplugin.setPluginCategory(G.get_handle(), 'VOD FAVORITES')
-        xbmcplugin.setContent(G.get_handle(), 'videos')
-        videos = Api.get_vod_favorites(params['page'])
+        videos = Api.get_vod_favorites(params['page'], stream=True)
         StalkerAddon.__create_video_listing(videos, params)
 
     @staticmethod
     def __list_series_favorites(params):
         """List Favorites Channels"""
         xbmcplugin.setPluginCategory(G.get_handle(), 'SERIES FAVORITES')
-        xbmcplugin.setContent(G.get_handle(), 'videos')
-        series = Api.get_series_favorites(params['page'])
+        series = Api.get_series_favorites(params['page'], stream=True)
         StalkerAddon.__create_series_listing(series, params)
 
     @staticmethod
     def __list_tv_favorites(params):
         """List Favorites Channels"""
-        Logger.debug('List TV favorites {}'.format(params))
+        Logger.debug('List TV favorites %s', params)
         xbmcplugin.setPluginCategory(G.get_handle(), 'TV FAVORITES')
-        xbmcplugin.setContent(G.get_handle(), 'videos')
-        videos = Api.get_tv_favorites(params['page'])
+        videos = Api.get_tv_favorites(params['page'], stream=True)
         StalkerAddon.__create_tv_listing(videos, params)
 
     @staticmethod
     def __list_series(params):
         """List series"""
-        Logger.debug('List TV favorites {}'.format(params))
+        Logger.debug('List TV favorites %s', params)
         search_term = params.get('search_term', '')
         plugin_category = 'SERIES - ' + params['category'] if params.get('fav', '0') != '1' else 'SERIES - ' + params['category'] + ' - FAVORITES'
         xbmcplugin.setPluginCategory(G.get_handle(), plugin_category)
-        xbmcplugin.setContent(G.get_handle(), 'videos')
-        series = Api.get_series(params['category_id'], params['page'], search_term, params.get('fav', 0))
+        series = Api.get_series(params['category_id'], params['page'], search_term, params.get('fav', 0), stream=True)
         StalkerAddon.__create_series_listing(series, params)
 
     @staticmethod
     def __list_season(params):
         """List season"""
         xbmcplugin.setPluginCategory(G.get_handle(), params['name'])
-        xbmcplugin.setContent(G.get_handle(), 'videos')
         seasons = Api.get_seasons(params['video_id'])
         directory_items = []
         for season in seasons['data']:
@@ -264,120 +279,124 @@ class StalkerAddon:
     @staticmethod
     def __create_video_listing(videos, params):
         """Create paginated listing"""
-        update_listing = params['update_listing']
-        item_count = len(videos['data'])
-        directory_items = []
-        for video in videos['data']:
-            label = video['name'] if video.get('hd', 1) == 1 else video['name'] + ' (SD)'
-            if video.get('fav', 0) == 1:
-                label = label + ' ★'
-            list_item = xbmcgui.ListItem(label=label, label2=label)
-            if video.get('fav', 0) == 1:
-                url = G.get_plugin_url({'action': 'remove_fav', 'video_id': video['id'], '_type': 'vod'})
-                list_item.addContextMenuItems([('Remove from favorites', f'RunPlugin({url}, False)')])
-            else:
-                url = G.get_plugin_url({'action': 'add_fav', 'video_id': video['id'], '_type': 'vod'})
-                list_item.addContextMenuItems([('Add to favorites', f'RunPlugin({url}, False)')])
+        StalkerAddon.__end_listing(StalkerAddon.__get_video_items(videos), videos, params)
 
-            is_folder = False
-            poster_url = None
-            if 'screenshot_uri' in video and isinstance(video['screenshot_uri'], str):
-                if video['screenshot_uri'].startswith('http'):
-                    poster_url = video['screenshot_uri']
-                else:
-                    poster_url = G.portal_config.portal_base_url + video['screenshot_uri']
+    @staticmethod
+    def __get_video_items(videos):
+        """Directory items of videos, those with series open their episodes"""
+        directory_items = []
+        add_fav_url, remove_fav_url = StalkerAddon.__get_favorite_urls('vod')
+        sub_folder_url = PluginUrl({'action': 'sub_folder', 'video_id': PluginUrl.FIELD, 'start': PluginUrl.FIELD, 'end': PluginUrl.FIELD,
+                                    'name': PluginUrl.FIELD, 'poster_url': PluginUrl.FIELD})
+        play_url = PluginUrl({'action': 'play', 'video_id': PluginUrl.FIELD, 'series': 0, 'title': PluginUrl.FIELD, 'cmd': PluginUrl.FIELD})
+        for video in VodItem.from_response(videos):
+            list_item = StalkerAddon.__create_video_item(video, add_fav_url, remove_fav_url)
             video_info = list_item.getVideoInfoTag()
-            if video['series']:
-                url = G.get_plugin_url({'action': 'sub_folder', 'video_id': video['id'], 'start': video['series'][0], 'end': video['series'][-1],
-                                        'name': video['name'], 'poster_url': poster_url})
+            if video.series:
+                url = sub_folder_url.build(video.id, video.series[0], video.series[-1], video.name, video.poster_url)
                 is_folder = True
                 video_info.setMediaType('season')
             else:
-                url = G.get_plugin_url({'action': 'play', 'video_id': video['id'], 'series': 0, 'title': video['name'], 'cmd': video.get('cmd', '')})
-                time = get_int_value(video, 'time')
-                if time != 0:
-                    video_info.setDuration(time * 60)
+                url = play_url.build(video.id, video.name, video.cmd)
+                is_folder = False
+                if video.duration != 0:
+                    video_info.setDuration(video.duration * 60)
                 video_info.setMediaType('movie')
                 list_item.setProperty('IsPlayable', 'true')
-
-            video_info.setTitle(video['name'])
-            video_info.setOriginalTitle(video['name'])
-            video_info.setSortTitle(video['name'])
-            if 'country' in video:
-                video_info.setCountries([video['country']])
-            video_info.setDirectors([video['director']])
-            video_info.setPlot(video.get('description', ''))
-            video_info.setPlotOutline(video.get('description', ''))
-            actors = [xbmc.Actor(actor) for actor in video['actors'].split(',') if actor]  # pylint: disable=maybe-no-member
-            video_info.setCast(actors)
-            video_info.setLastPlayed(video['last_played'])
-            video_info.setDateAdded(video['added'])
-            year = get_int_value(video, 'year')
-            if year != 0:
-                video_info.setYear(year)
-            list_item.setArt({'poster': poster_url})
             directory_items.append((url, list_item, is_folder))
-        # Add navigation items
-        total_items = get_int_value(videos, 'total_items')
-        if total_items > item_count:
-            StalkerAddon.__add_navigation_items(params, videos, directory_items)
-            item_count = item_count + 2
-        xbmcplugin.addDirectoryItems(G.get_handle(), directory_items, item_count)
-        xbmcplugin.endOfDirectory(G.get_handle(), succeeded=True, updateListing=update_listing == 'True', cacheToDisc=False)
+        return directory_items
 
     @staticmethod
     def __create_series_listing(series, params):
         """Create paginated listing"""
-        update_listing = params['update_listing']
-        item_count = len(series['data'])
-        directory_items = []
-        for video in series['data']:
-            label = video['name'] if video.get('hd', 1) == 1 else video['name'] + ' (SD)'
-            if video.get('fav', 0) == 1:
-                label = label + ' ★'
-            list_item = xbmcgui.ListItem(label=label, label2=label)
-            if video.get('fav', 0) == 1:
-                url = G.get_plugin_url({'action': 'remove_fav', 'video_id': video['id'], '_type': 'series'})
-                list_item.addContextMenuItems([('Remove from favorites', f'RunPlugin({url}, False)')])
-            else:
-                url = G.get_plugin_url({'action': 'add_fav', 'video_id': video['id'], '_type': 'series'})
-                list_item.addContextMenuItems([('Add to favorites', f'RunPlugin({url}, False)')])
-
-            poster_url = None
-            if 'screenshot_uri' in video and isinstance(video['screenshot_uri'], str):
-                if video['screenshot_uri'].startswith('http'):
-                    poster_url = video['screenshot_uri']
-                else:
-                    poster_url = G.portal_config.portal_base_url + video['screenshot_uri']
-            video_info = list_item.getVideoInfoTag()
-            url = G.get_plugin_url({'action': 'season_listing', 'video_id': video['id'], 'name': video['name'], 'poster_url': poster_url})
-            video_info.setMediaType('season')
+        StalkerAddon.__end_listing(StalkerAddon.__get_series_items(series), series, params)
 
-            video_info.setTitle(video['name'])
-            video_info.setOriginalTitle(video['name'])
-            video_info.setSortTitle(video['name'])
-            if 'country' in video:
-                video_info.setCountries([video['country']])
-            video_info.setDirectors([video['director']])
-            video_info.setPlot(video.get('description', ''))
-            video_info.setPlotOutline(video.get('description', ''))
-            actors = [xbmc.Actor(actor) for actor in video['actors'].split(',') if actor]  # pylint: disable=maybe-no-member
-            video_info.setCast(actors)
-            video_info.setLastPlayed(video['last_played'])
-            video_info.setDateAdded(video['added'])
-            year = get_int_value(video, 'year')
-            if year != 0:
-                video_info.setYear(year)
-            list_item.setArt({'poster': poster_url})
+    @staticmethod
+    def __get_series_items(series):
+        """Directory items of series, each opens its seasons"""
+        directory_items = []
+        add_fav_url, remove_fav_url = StalkerAddon.__get_favorite_urls('series')
+        season_listing_url = PluginUrl({'action': 'season_listing', 'video_id': PluginUrl.FIELD, 'name': PluginUrl.FIELD, 'poster_url': PluginUrl.FIELD})
+        for video in SeriesItem.from_response(series):
+            list_item = StalkerAddon.__create_video_item(video, add_fav_url, remove_fav_url)
+            list_item.getVideoInfoTag().setMediaType('season')
+            url = season_listing_url.build(video.id, video.name, video.poster_url)
             directory_items.append((url, list_item, True))
-        # Add navigation items
-        total_items = get_int_value(series, 'total_items')
+        return directory_items
+
+    @staticmethod
+    def __end_listing(directory_items, listing, params):
+        """Add the navigation items of a paginated listing and end it"""
+        item_count = len(directory_items)
+        total_items = get_int_value(listing, 'total_items')
         if total_items > item_count:
-            StalkerAddon.__add_navigation_items(params, series, directory_items)
+            StalkerAddon.__add_navigation_items(params, listing, directory_items)
             item_count = item_count + 2
         xbmcplugin.addDirectoryItems(G.get_handle(), directory_items, item_count)
-        xbmcplugin.endOfDirectory(G.get_handle(), succeeded=True, updateListing=update_listing == 'True',
-                                  cacheToDisc=False)
+        xbmcplugin.endOfDirectory(G.get_handle(), succeeded=True, updateListing=params['update_listing'] == 'True', cacheToDisc=False)
+
+    @staticmethod
+    def __list_search_results(params):
+        """List the results of a search of VOD, series and TV, grouped by type in the order the searches complete"""
+        Logger.debug('List search results %s', params)
+        search_term = params['search_term']
+        xbmcplugin.setPluginCategory(G.get_handle(), 'SEARCH - ' + search_term)
+        get_items = {'vod': StalkerAddon.__get_video_items, 'series': StalkerAddon.__get_series_items, 'itv': StalkerAddon.__get_tv_items}
+        found = False
+        for _type, listing in Api.search_all(search_term, G.addon_config.search_deadline):
+            label, action = StalkerAddon.__search_groups[_type]
+            if listing is None:
+                xbmcgui.Dialog().notification(G.addon_config.name, label + ' search did not complete', xbmcgui.NOTIFICATION_WARNING)
+                continue
+            directory_items = get_items[_type](listing)
+            if not directory_items:
+                continue
+            found = True
+            # The group header opens the paginated results of the type
+            list_item = xbmcgui.ListItem(label='[B]{} - {} of {} results[/B]'.format(label, len(directory_items), get_int_value(listing, 'total_items')))
+            list_item.setArt({'thumb': G.get_custom_thumb_path('search.png')})
+            url = G.get_plugin_url({'action': action, 'category': 'ALL', 'category_id': '*', 'page': 1, 'update_listing': False,
+                                    'search_term': search_term, 'fav': 0})
+            xbmcplugin.addDirectoryItems(G.get_handle(), [(url, list_item, True)] + directory_items)
+        if not found:
+            xbmcgui.Dialog().notification(G.addon_config.name, 'No results for ' + search_term, xbmcgui.NOTIFICATION_INFO)
+        xbmcplugin.endOfDirectory(G.get_handle(), succeeded=True, updateListing=False, cacheToDisc=False)
+
+    @staticmethod
+    def __create_video_item(video, add_fav_url, remove_fav_url):
+        """List item with the favorite context menu and info shared by VOD and series"""
+        label = video.name if video.hd else video.name + ' (SD)'
+        if video.fav:
+            label = label + ' ★'
+        list_item = xbmcgui.ListItem(label=label, label2=label)
+        if video.fav:
+            url = remove_fav_url.build(video.id)
+            list_item.addContextMenuItems([('Remove from favorites', f'RunPlugin({url}, False)')])
+        else:
+            url = add_fav_url.build(video.id)
+            list_item.addContextMenuItems([('Add to favorites', f'RunPlugin({url}, False)')])
+        video_info = list_item.getVideoInfoTag()
+        video_info.setTitle(video.name)
+        video_info.setOriginalTitle(video.name)
+        video_info.setSortTitle(video.name)
+        if video.country is not None:
+            video_info.setCountries([video.country])
+        video_info.setDirectors([video.director])
+        video_info.setPlot(video.description)
+        video_info.setPlotOutline(video.description)
+        video_info.setCast([xbmc.Actor(actor) for actor in video.actors])  # pylint: disable=maybe-no-member
+        video_info.setLastPlayed(video.last_played)
+        video_info.setDateAdded(video.added)
+        if video.year != 0:
+            video_info.setYear(video.year)
+        list_item.setArt({'poster': video.poster_url})
+        return list_item
+
+    @staticmethod
+    def __get_favorite_urls(_type):
+        """Add and remove favorite url templates of a listing"""
+        return (PluginUrl({'action': 'add_fav', 'video_id': PluginUrl.FIELD, '_type': _type}),
+                PluginUrl({'action': 'remove_fav', 'video_id': PluginUrl.FIELD, '_type': _type}))
 
     @staticmethod
     def __add_navigation_items(params, videos, directory_items):
@@ -390,6 +409,8 @@ class StalkerAddon:
         if _max_page_limit > 1:
             total_pages = total_pages if (total_pages % _max_page_limit) == 0 else total_pages + _max_page_limit - (
                     total_pages % _max_page_limit)
+        # Let the background service warm the cache with the next page block
+        Prefetcher.publish(dict(params), total_pages)
         label = '<< Last Page' if page == 1 else '<< Previous Page'
         list_item = xbmcgui.ListItem(label)
         list_item.setArt({'thumb': G.get_custom_thumb_path('pagePrevious.png')})
@@ -413,7 +434,6 @@ class StalkerAddon:
         """List episodes for a series"""
         name = params['name']
         xbmcplugin.setPluginCategory(G.get_handle(), name)
-        xbmcplugin.setContent(G.get_handle(), 'videos')
         temp = name.split(' ')
         match = re.match("^S[0-9]+$", temp[-1])
         season = None
@@ -422,6 +442,8 @@ class StalkerAddon:
             name = ' '.join(temp[:-1])
         start = get_int_value(params, 'start')
         end = get_int_value(params, 'end')
+        play_url = PluginUrl({'action': 'play', 'video_id': params['video_id'], 'series': PluginUrl.FIELD, 'season_no': season,
+                              'title': name, 'total_episodes': end, 'poster_url': params['poster_url']})
         for episode_no in range(start, end + 1):
             list_item = xbmcgui.ListItem(label='Episode ' + str(episode_no))
             video_info = list_item.getVideoInfoTag()
@@ -437,14 +459,13 @@ class StalkerAddon:
                 video_info.setMediaType('movie')
             list_item.setProperties({'IsPlayable': 'true'})
             list_item.setArt({'poster': params['poster_url']})
-            url = G.get_plugin_url({'action': 'play', 'video_id': params['video_id'], 'series': episode_no, 'season_no': season,
-                                    'title': name, 'total_episodes': end, 'poster_url': params['poster_url']})
+            url = play_url.build(episode_no)
             xbmcplugin.addDirectoryItem(G.get_handle(), url, list_item, False)
         xbmcplugin.endOfDirectory(G.get_handle(), succeeded=True, updateListing=False, cacheToDisc=False)
 
     def __search_vod(self, params):
         """Search for videos"""
-        Logger.debug('Search VOD {}'.format(params))
+        Logger.debug('Search VOD %s', params)
 
         # If the category is missing, show the category selection popup
         if not params.get('category'):
@@ -468,7 +489,7 @@ class StalkerAddon:
                 func_str = f'Container.Update({url})'
                 xbmc.executebuiltin(func_str)
             else:
-                self.__list_vod(params)
+                self.__dispatch(StalkerAddon.__routes['vod_listing'], params)
 
     @staticmethod
     def __search_series(params):
@@ -519,7 +540,15 @@ class StalkerAddon:
                 func_str = f'Container.Update({url})'
                 xbmc.executebuiltin(func_str)
             else:
-                self.__list_channels(params)
+                self.__dispatch(StalkerAddon.__routes['tv_listing'], params)
+
+    def __search_all(self, params):
+        """Search VOD, series and TV at once"""
+        Logger.debug('Search all %s', params)
+        search_term = ask_for_input('VOD, series and TV')
+        if search_term:
+            params.update({'action': 'search_listing', 'search_term': search_term})
+            self.__dispatch(StalkerAddon.__routes['search_listing'], params)
 
     @staticmethod
     def __list_main_menu():
@@ -538,56 +567,77 @@ class StalkerAddon:
             url = G.get_plugin_url({'action': 'series', 'page': 1, 'update_listing': False})
             xbmcplugin.addDirectoryItem(G.get_handle(), url, list_item, True)
 
+        list_item = xbmcgui.ListItem(label='SEARCH')
+        list_item.setArt({'thumb': G.get_custom_thumb_path('search.png')})
+        url = G.get_plugin_url({'action': 'search'})
+        xbmcplugin.addDirectoryItem(G.get_handle(), url, list_item, True)
+
         xbmcplugin.endOfDirectory(G.get_handle(), succeeded=True, updateListing=False, cacheToDisc=False)
 
+    # Label and listing action of the result groups of a search of all types
+    __search_groups = {'vod': ('VOD', 'vod_listing'), 'series': ('SERIES', 'series_listing'), 'itv': ('TV', 'tv_listing')}
+
+    # Handlers take the addon and the params, listing routes get their content type set before they run
+    __routes = {
+        '': Route(lambda addon, params: StalkerAddon.__list_main_menu()),
+        'tv': Route(lambda addon, params: StalkerAddon.__list_tv_genres(), content='videos'),
+        'vod': Route(lambda addon, params: StalkerAddon.__list_vod_categories(), content='videos'),
+        'series': Route(lambda addon, params: StalkerAddon.__list_series_categories(), content='videos'),
+        'vod_favorites': Route(lambda addon, params: StalkerAddon.__list_vod_favorites(params), ('page', 'update_listing'), 'videos'),
+        'series_favorites': Route(lambda addon, params: StalkerAddon.__list_series_favorites(params), ('page', 'update_listing'), 'videos'),
+        'tv_favorites': Route(lambda addon, params: StalkerAddon.__list_tv_favorites(params), ('page', 'update_listing'), 'videos'),
+        'tv_listing': Route(lambda addon, params: StalkerAddon.__list_channels(params), ('category', 'category_id', 'page', 'update_listing'), 'videos'),
+        'vod_listing': Route(lambda addon, params: StalkerAddon.__list_vod(params), ('category', 'category_id', 'page', 'update_listing'), 'videos'),
+        'series_listing': Route(lambda addon, params: StalkerAddon.__list_series(params), ('category', 'category_id', 'page', 'update_listing'), 'videos'),
+        'season_listing': Route(lambda addon, params: StalkerAddon.__list_season(params), ('video_id', 'name', 'poster_url'), 'videos'),
+        'sub_folder': Route(lambda addon, params: StalkerAddon.__list_episodes(params), ('video_id', 'name', 'poster_url'), 'videos'),
+        'play': Route(lambda addon, params: StalkerAddon.__play_video(params), ('video_id', 'series')),
+        'tv_play': Route(lambda addon, params: StalkerAddon.__play_tv(params), ('cmd',)),
+        'vod_search': Route(__search_vod),
+        'series_search': Route(lambda addon, params: StalkerAddon.__search_series(params)),
+        'tv_search': Route(__search_tv),
+        'search': Route(__search_all),
+        'search_listing': Route(lambda addon, params: StalkerAddon.__list_search_results(params), ('search_term',), 'videos'),
+        'remove_fav': Route(lambda addon, params: StalkerAddon.__toggle_favorites(params['video_id'], False, params['_type']), ('video_id', '_type')),
+        'add_fav': Route(lambda addon, params: StalkerAddon.__toggle_favorites(params['video_id'], True, params['_type']), ('video_id', '_type')),
+        'clear_cache': Route(lambda addon, params: StalkerAddon.__clear_cache())
+    }
+
+    @staticmethod
+    def add_route(action, handler, required=(), content=None):
+        """Register handler(addon, params) for action, replacing any existing route"""
+        StalkerAddon.__routes[action] = Route(handler, tuple(required), content)
+
     def router(self, param_string):
         """Route calls"""
         params = dict(parse_qsl(param_string))
-        if params and 'action' in params:
-            if params['action'] == 'tv':
-                self.__list_tv_genres()
-            elif params['action'] == 'vod':
-                self.__list_vod_categories()
-            elif params['action'] == 'series':
-                self.__list_series_categories()
-            elif params['action'] == 'vod_favorites':
-                self.__list_vod_favorites(params)
-            elif params['action'] == 'series_favorites':
-                self.__list_series_favorites(params)
-            elif params['action'] == 'tv_favorites':
-                self.__list_tv_favorites(params)
-            elif params['action'] == 'tv_listing':
-                self.__list_channels(params)
-            elif params['action'] == 'vod_listing':
-                self.__list_vod(params)
-            elif params['action'] == 'series_listing':
-                self.__list_series(params)
-            elif params['action'] == 'season_listing':
-                self.__list_season(params)
-            elif params['action'] == 'sub_folder':
-                self.__list_episodes(params)
-            elif params['action'] == 'play':
-                self.__play_video(params)
-            elif params['action'] == 'tv_play':
-                self.__play_tv(params)
-            elif params['action'] == 'vod_search':
-                self.__search_vod(params)
-            elif params['action'] == 'series_search':
-                self.__search_series(params)
-            elif params['action'] == 'tv_search':
-                self.__search_tv(params)
-            elif params['action'] == 'remove_fav':
-                self.__toggle_favorites(params['video_id'], False, params['_type'])
-            elif params['action'] == 'add_fav':
-                self.__toggle_favorites(params['video_id'], True, params['_type'])
-            else:
-                raise ValueError('Invalid param string: {}!'.format(param_string))
-        else:
-            self.__list_main_menu()
+        route = StalkerAddon.__routes.get(params.get('action', ''))
+        if route is None:
+            raise ValueError('Invalid param string: {}!'.format(param_string))
+        self.__dispatch(route, params)
+
+    def __dispatch(self, route, params):
+        """Check the required params, set the content type and run the handler"""
+        missing = [name for name in route.required if name not in params]
+        if missing:
+            raise ValueError('Missing params {} for action {}!'.format(', '.join(missing), params.get('action')))
+        if route.content:
+            xbmcplugin.setContent(G.get_handle(), route.content)
+        # The deadline starts with each handler, a search dispatches its listing once the user entered the search term
+        PortalSession.set_deadline(G.addon_config.action_deadline)
+        route.handler(self, params)
 
 
 def run(argv):
     """Run"""
     G.init_globals()
-    stalker_addon = StalkerAddon()
-    stalker_addon.router(argv[2][1:])
+    Logger.reset()
+    Metrics.start()
+    try:
+        stalker_addon = StalkerAddon()
+        stalker_addon.router(argv[2][1:])
+    except AuthError:
+        xbmcgui.Dialog().ok(G.addon_config.name, 'Error getting token')
+        raise
+    finally:
+        Metrics.finish(argv[2][1:])
@@ -3,18 +3,41 @@ Stalker API Calls
 """
 from __future__ import absolute_import, division, unicode_literals
 
-import json
 import math
-import requests
 from .globals import G
 from .auth import Auth
+from .cache import ResponseCache
+from .session import PortalSession
 from .loggers import Logger
+from .metrics import Metrics
+from .json_stream import ListingStream
 from .utils import get_int_value
 
 
 class Api:
     """API calls"""
 
+    __LISTING_KEYS = ('type', 'action', 'category', 'genre', 'movie_id', 'sortby', 'search', 'p')
+    __STREAM_CHUNK_SIZE = 64 * 1024
+    # A streamed listing is only cached up to this many items, it would otherwise be held in memory whole
+    __MAX_CACHED_ITEMS = 2000
+
+    @staticmethod
+    def __call_stalker_portal_cached(params, ttl):
+        """Method to call portal, response body is cached on disk for ttl seconds"""
+        cache = ResponseCache('responses', G.addon_config.cache_max_entries)
+        body = cache.get(params)
+        if body is not None:
+            Logger.debug('Cache hit for params %s', params)
+            Metrics.increment('cache_hit')
+            return body
+        Metrics.increment('cache_miss')
+        response = Api.__call_stalker_portal_return_response(params)
+        body = response.json()
+        if ttl > 0 and response.status_code == 200 and response.text.find('Authorization failed') == -1:
+            cache.put(params, body, ttl)
+        return body
+
     @staticmethod
     def __call_stalker_portal(params, return_response_body=True):
         """Method to call portal"""
@@ -24,8 +47,8 @@ class Api:
         return None
 
     @staticmethod
-    def __call_stalker_portal_return_response(params):
-        """Method to call portal"""
+    def __call_stalker_portal_return_response(params, stream=False):
+        """Method to call portal, with stream the body is returned as a ListingStream"""
         retries = 0
         url = G.portal_config.portal_url
         mac_cookie = G.portal_config.mac_cookie
@@ -33,44 +56,55 @@ class Api:
         auth = Auth()
         while True:
             token = auth.get_token(retries > 0)
-            Logger.debug("Calling Stalker portal {} with params {}".format(url, json.dumps(params)))
-            response = requests.get(url=url,
-                                    headers={'Cookie': mac_cookie,
-                                             'SN': G.portal_config.serial_number,
-                                             'Authorization': 'Bearer ' + token,
-                                             'X-User-Agent': 'Model: MAG250; Link: WiFi', 'Referrer': referrer,
-                                             'User-Agent': 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'},
-                                    params=params,
-                                    timeout=30
-                                    )
-            if response.text.find('Authorization failed') == -1 or retries == G.addon_config.max_retries:
+            Logger.debug('Calling Stalker portal %s with params %s', url, params)
+            response = PortalSession.get(url=url,
+                                         headers={'Cookie': mac_cookie,
+                                                  'SN': G.portal_config.serial_number,
+                                                  'Authorization': 'Bearer ' + token,
+                                                  'X-User-Agent': 'Model: MAG250; Link: WiFi', 'Referrer': referrer,
+                                                  'User-Agent': 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'},
+                                         params=params,
+                                         stream=stream
+                                         )
+            if stream:
+                response = ListingStream(Metrics.iter_content(response, Api.__STREAM_CHUNK_SIZE))
+            if not Api.__is_authorization_failed(response) or retries == G.addon_config.max_retries:
                 break
             if retries > 1:
-                auth.clear_cache()
+                auth.discard_token(token)
             retries += 1
+            Metrics.increment('auth_retry')
         return response
 
+    @staticmethod
+    def __is_authorization_failed(response):
+        """Whether the portal rejected the token, of a streamed body only the start is read"""
+        text = response.get_head() if isinstance(response, ListingStream) else response.text
+        return text.find('Authorization failed') != -1
+
     @staticmethod
     def get_vod_categories():
         """Get video categories"""
         params = {'type': 'vod', 'action': 'get_categories'}
-        return Api.__call_stalker_portal(params)['js']
+        return Api.__call_stalker_portal_cached(params, G.addon_config.categories_cache_ttl)['js']
 
     @staticmethod
     def get_series_categories():
         """Get video categories"""
         params = {'type': 'series', 'action': 'get_categories'}
-        return Api.__call_stalker_portal(params).get('js', False)
+        return Api.__call_stalker_portal_cached(params, G.addon_config.categories_cache_ttl).get('js', False)
 
     @staticmethod
     def get_tv_genres():
         """Get tv genres"""
         params = {'type': 'itv', 'action': 'get_genres'}
-        return Api.__call_stalker_portal(params)['js']
+        return Api.__call_stalker_portal_cached(params, G.addon_config.genres_cache_ttl)['js']
 
     @staticmethod
     def remove_favorites(video_id, _type):
         """Remove from favorites"""
+        Api.__get_listing_cache().invalidate(_type)
+        Api.__set_catalogue_favorite(_type, video_id, False)
         if _type == 'itv':
             Api.__remove_tv_favorites(video_id)
         else:
@@ -80,12 +114,28 @@ class Api:
     @staticmethod
     def add_favorites(video_id, _type):
         """Add to favorites"""
+        Api.__get_listing_cache().invalidate(_type)
+        Api.__set_catalogue_favorite(_type, video_id, True)
         if _type == 'itv':
             Api.__add_tv_favorites(video_id)
         else:
             params = {'type': _type, 'action': 'set_fav', 'video_id': video_id}
             Api.__call_stalker_portal(params, False)
 
+    @staticmethod
+    def __set_catalogue_favorite(_type, video_id, fav):
+        """Keep the fav flag of the catalogue in step with the portal"""
+        # Imported here so plugin invocations which never reach the catalogue do not load sqlite3
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        from .catalogue import Catalogue  # pylint: disable=import-outside-toplevel
+        if not Catalogue.exists():
+            return
+        try:
+            with Catalogue() as catalogue:
+                catalogue.set_favorite(_type, video_id, fav)
+        except sqlite3.Error as ex:
+            Logger.warn('Could not update catalogue favorite {}: {}'.format(video_id, ex))
+
     @staticmethod
     def __add_tv_favorites(video_id):
         """Add to tv favorites"""
@@ -110,22 +160,22 @@ class Api:
         Api.__call_stalker_portal(params, False)
 
     @staticmethod
-    def get_vod_favorites(page):
+    def get_vod_favorites(page, stream=False):
         """Get favorites"""
         params = {'type': 'vod', 'action': 'get_ordered_list', 'fav': '1', 'sortby': 'added'}
-        return Api.get_listing(params, page)
+        return Api.get_listing(params, page, stream)
 
     @staticmethod
-    def get_series_favorites(page):
+    def get_series_favorites(page, stream=False):
         """Get favorites"""
         params = {'type': 'series', 'action': 'get_ordered_list', 'fav': '1', 'sortby': 'added'}
-        return Api.get_listing(params, page)
+        return Api.get_listing(params, page, stream)
 
     @staticmethod
-    def get_tv_favorites(page):
+    def get_tv_favorites(page, stream=False):
         """Get favorites"""
         params = {'type': 'itv', 'action': 'get_ordered_list', 'fav': '1', 'sortby': 'number'}
-        return Api.get_listing(params, page)
+        return Api.get_listing(params, page, stream)
 
     @staticmethod
     def get_seasons(video_id):
@@ -134,43 +184,172 @@ class Api:
         return Api.__call_stalker_portal(params)['js']
 
     @staticmethod
-    def get_tv_channels(category_id, page, search_term, fav):
+    def get_tv_channels(category_id, page, search_term, fav, stream=False):
         """Get videos for a category"""
         params = {'type': 'itv', 'action': 'get_ordered_list', 'genre': category_id, 'sortby': 'number', 'fav': fav}
         if bool(search_term.strip()):
             params.update({'search': search_term})
-        return Api.get_listing(params, page)
+        return Api.get_listing(params, page, stream)
 
     @staticmethod
-    def get_videos(category_id, page, search_term, fav):
+    def get_videos(category_id, page, search_term, fav, stream=False):
         """Get videos for a category"""
         params = {'type': 'vod', 'action': 'get_ordered_list', 'category': category_id, 'sortby': 'added', 'fav': fav}
         if bool(search_term.strip()):
             params.update({'search': search_term})
-        return Api.get_listing(params, page)
+        return Api.get_listing(params, page, stream)
 
     @staticmethod
-    def get_series(category_id, page, search_term, fav):
+    def get_series(category_id, page, search_term, fav, stream=False):
         """Get videos for a category"""
         params = {'type': 'series', 'action': 'get_ordered_list', 'category': category_id, 'sortby': 'added', 'fav': fav}
         if bool(search_term.strip()):
             params.update({'search': search_term})
-        return Api.get_listing(params, page)
+        return Api.get_listing(params, page, stream)
+
+    @staticmethod
+    def search_all(search_term, deadline):
+        """Search VOD, series and TV in all categories concurrently. Yields (type, listing) as each search
+        completes, listing is None for a search which failed or did not complete within deadline seconds"""
+        from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout  # pylint: disable=import-outside-toplevel
+        searches = {'vod': Api.get_videos, 'series': Api.get_series, 'itv': Api.get_tv_channels}
+        executor = ThreadPoolExecutor(max_workers=len(searches))
+        futures = {executor.submit(Api.__search, search, search_term): _type for _type, search in searches.items()}
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                yield futures.pop(future), future.result()
+        except FuturesTimeout:
+            for future, _type in futures.items():
+                if not future.done():
+                    Logger.warn('{} search did not complete within {} seconds'.format(_type, deadline))
+                yield _type, future.result() if future.done() else None
+        finally:
+            # Do not wait for a late search, the action deadline of the session ends it
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def __search(search, search_term):
+        """First page block of a search in all categories, None when it failed"""
+        try:
+            return search('*', 1, search_term, 0)
+        except (IOError, ValueError, KeyError, TypeError) as ex:
+            Logger.warn('Search failed: {}'.format(ex))
+            return None
 
     @staticmethod
-    def get_listing(params, page):
-        """Generic method to get listing"""
+    def get_listing(params, page, stream=False):
+        """Generic method to get listing. With stream the first page is parsed as it arrives and data is a
+        generator, the listing is cached once it was read to the end"""
+        listing = Api.__get_catalogue_listing(params, page)
+        if listing is not None:
+            Metrics.increment('catalogue_hit')
+            return listing
         params.update({'p': str(page)})
-        response = Api.__call_stalker_portal(params)['js']
-        videos = response['data']
+        cache_key = Api.__get_listing_cache_key(params)
+        cache = Api.__get_listing_cache()
+        listing = cache.get(cache_key)
+        if listing is not None:
+            Logger.debug('Listing cache hit for params %s', cache_key)
+            Metrics.increment('cache_hit')
+            return listing
+        Metrics.increment('cache_miss')
+        if stream:
+            listing_stream = Api.__call_stalker_portal_return_response(params, stream=True)
+            response = listing_stream.read_fields()
+            videos = listing_stream.iter_data()
+            if 'total_items' not in response:
+                # Paging fields follow the data, they are only known once all items were read
+                videos = list(videos)
+        else:
+            response = Api.__call_stalker_portal(params)['js']
+            videos = response['data']
         total_items = response['total_items']
         max_page_items = response['max_page_items']
         total_pages = int(math.ceil(float(total_items) / float(max_page_items)))
-        for page_no in range(int(page) + 1, min(int(page) + G.addon_config.max_page_limit, total_pages + 1)):
-            params.update({'p': str(page_no)})
-            response = Api.__call_stalker_portal(params)['js']
-            videos += response['data']
-        return {'max_page_items': max_page_items, 'total_items': total_items, 'data': videos}
+        pages = range(int(page) + 1, min(int(page) + G.addon_config.max_page_limit, total_pages + 1))
+        complete = True
+        more_videos = []
+        if pages:
+            from concurrent.futures import ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+            max_workers = max(1, min(len(pages), G.addon_config.max_concurrent_requests))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # map yields in submission order, so pages are merged in page order
+                for data in executor.map(Api.__get_listing_page, [dict(params, p=str(page_no)) for page_no in pages]):
+                    complete = complete and data is not None
+                    more_videos += data or []
+        # Do not keep a listing with missing pages around
+        ttl = G.addon_config.listing_cache_ttl if complete else 0
+        if stream:
+            listing = {'max_page_items': max_page_items, 'total_items': total_items, 'data': []}
+            return dict(listing, data=Api.__iter_listing((videos, more_videos), cache, cache_key, listing, ttl))
+        listing = {'max_page_items': max_page_items, 'total_items': total_items, 'data': videos + more_videos}
+        if ttl > 0:
+            cache.put(cache_key, listing, ttl)
+        return listing
+
+    @staticmethod
+    def get_ordered_list_page(params, page):
+        """Get a single page of get_ordered_list, uncached"""
+        return Api.__call_stalker_portal(dict(params, p=str(page)))['js']
+
+    @staticmethod
+    def __get_catalogue_listing(params, page):
+        """Listing or search results served by the local catalogue, None when it does not hold a fresh copy"""
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        from .catalogue import Catalogue  # pylint: disable=import-outside-toplevel
+        key = Catalogue.get_key(params)
+        if key is None or G.addon_config.catalogue_max_age <= 0 or not Catalogue.exists():
+            return None
+        search_term = str(params.get('search', '')).strip()
+        try:
+            with Catalogue() as catalogue:
+                if search_term:
+                    listing = catalogue.search(key, search_term, page, G.addon_config.max_page_limit, G.addon_config.catalogue_max_age)
+                else:
+                    listing = catalogue.get_listing(key, page, G.addon_config.max_page_limit, G.addon_config.catalogue_max_age)
+        except sqlite3.Error as ex:
+            Logger.warn('Could not read catalogue: {}'.format(ex))
+            return None
+        if listing is not None:
+            Logger.debug('Catalogue hit for %s page %s', key, page)
+        return listing
+
+    @staticmethod
+    def __iter_listing(pages, cache, cache_key, listing, ttl):
+        """Yield the items of the pages, the listing is cached once all items were read unless it has too many"""
+        for page in pages:
+            for item in page:
+                if ttl > 0:
+                    listing['data'].append(item)
+                    if len(listing['data']) > Api.__MAX_CACHED_ITEMS:
+                        Logger.debug('Listing too large to cache for params %s', cache_key)
+                        listing['data'] = []
+                        ttl = 0
+                yield item
+        if ttl > 0:
+            cache.put(cache_key, listing, ttl)
+
+    @staticmethod
+    def __get_listing_cache():
+        """Cache of merged listing pages"""
+        return ResponseCache('listings', G.addon_config.listing_cache_max_entries)
+
+    @staticmethod
+    def __get_listing_cache_key(params):
+        """Normalised get_ordered_list params, so equivalent requests share one cache entry"""
+        cache_key = {key: str(params.get(key, '')).strip() for key in Api.__LISTING_KEYS}
+        cache_key['fav'] = '1' if str(params.get('fav', '0')) == '1' else '0'
+        cache_key['page_limit'] = str(G.addon_config.max_page_limit)
+        return cache_key
+
+    @staticmethod
+    def __get_listing_page(params):
+        """Get data of a single listing page, None when the page failed"""
+        try:
+            return Api.__call_stalker_portal(params)['js']['data']
+        except (IOError, ValueError, KeyError, TypeError) as ex:
+            Logger.warn('Skipping listing page {}, error: {}'.format(params['p'], ex))
+            return None
 
     @staticmethod
     def get_vod_stream_url(video_id, series, cmd, use_cmd):
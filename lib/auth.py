@@ -2,114 +2,303 @@
 from __future__ import absolute_import, division, unicode_literals
 import os
 import json
+import time
+import threading
 import dataclasses
-import requests
+try:
+    import fcntl
+    msvcrt = None  # pylint: disable=invalid-name
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt  # pylint: disable=import-error
 import xbmcvfs
-import xbmcgui
 from .globals import G
 from .loggers import Logger
+from .metrics import Metrics
+from .session import PortalSession
+
+
+class AuthError(IOError):
+    """The portal did not issue a token, the plugin reports it while background work retries later"""
 
 
 @dataclasses.dataclass
 class Token:
     """Token"""
     value: str = None
+    validated_at: float = 0
+    expires_at: float = 0
+    portal: str = None
+
+
+class TokenStore:
+    """Process wide token holder, token.json is read again only when another process changed it"""
+
+    __TOKEN_FILE = 'token.json'
+    __lock = threading.RLock()
+    __token_dir = None
+    __path = None
+    __mtime = None
+    __token = None
+
+    @staticmethod
+    def get_path():
+        """Token file path"""
+        if TokenStore.__token_dir != G.addon_config.token_path:
+            TokenStore.__token_dir = G.addon_config.token_path
+            TokenStore.__path = os.path.join(TokenStore.__token_dir, TokenStore.__TOKEN_FILE)
+            TokenStore.__token = None
+        return TokenStore.__path
+
+    @staticmethod
+    def load():
+        """ Load token, from memory unless token.json was changed """
+        with TokenStore.__lock:
+            path = TokenStore.get_path()
+            mtime = TokenStore.__get_mtime(path)
+            if TokenStore.__token is not None and mtime is not None and mtime == TokenStore.__mtime:
+                return TokenStore.__token
+            Logger.debug('Loading token from cache')
+            token = Token()
+            try:
+                with xbmcvfs.File(path, 'r') as f:
+                    token.__dict__ = json.loads(f.read())
+            except (IOError, TypeError, ValueError):
+                Logger.warn('We could not use the cache since it is invalid or non-existent.')
+            TokenStore.__mtime = mtime
+            TokenStore.__token = token
+            return token
+
+    @staticmethod
+    def save(token, replace=True):
+        """ Store token, unless replace is False and another process changed token.json since it was loaded.
+        Returns the token in effect """
+        with TokenStore.__lock:
+            path = TokenStore.get_path()
+            if not replace and TokenStore.__get_mtime(path) != TokenStore.__mtime:
+                Logger.debug('Token changed by another process, reloading')
+                return TokenStore.load()
+            Logger.debug('Saving token to cache')
+            with xbmcvfs.File(path, 'w') as f:
+                json.dump(token.__dict__, f, indent=2)
+            TokenStore.__mtime = TokenStore.__get_mtime(path)
+            TokenStore.__token = token
+            return token
+
+    @staticmethod
+    def clear():
+        """ Remove token from memory and disk """
+        with TokenStore.__lock:
+            path = TokenStore.get_path()
+            TokenStore.__token = None
+            TokenStore.__mtime = None
+            if xbmcvfs.exists(path):
+                xbmcvfs.delete(path)
+
+    @staticmethod
+    def __get_mtime(path):
+        """Modification time of token.json, None when missing"""
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+
+class TokenLock:
+    """Cross process lock on a file in the profile directory, so only one invocation makes a handshake at a time"""
+
+    __LOCK_FILE = 'token.lock'
+    __thread_lock = threading.Lock()
+
+    def __init__(self):
+        self.__file = None
+
+    def __enter__(self):
+        TokenLock.__thread_lock.acquire()  # pylint: disable=consider-using-with
+        try:
+            self.__file = open(os.path.join(G.addon_config.token_path, self.__LOCK_FILE), 'a+')  # pylint: disable=consider-using-with
+            if fcntl:
+                fcntl.flock(self.__file.fileno(), fcntl.LOCK_EX)
+            else:
+                self.__file.seek(0)
+                msvcrt.locking(self.__file.fileno(), msvcrt.LK_LOCK, 1)
+        except (IOError, OSError) as ex:
+            # Still serialised within this process
+            Logger.warn('Could not lock token file: {}'.format(ex))
+            self.__close()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.__close()
+        finally:
+            TokenLock.__thread_lock.release()
+
+    def __close(self):
+        """Release the file lock"""
+        if self.__file is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self.__file.fileno(), fcntl.LOCK_UN)
+            else:
+                self.__file.seek(0)
+                msvcrt.locking(self.__file.fileno(), msvcrt.LK_UNLCK, 1)
+        except (IOError, OSError):
+            pass
+        self.__file.close()
+        self.__file = None
 
 
 class Auth:
     """Auth API"""
 
-    __TOKEN_FILE = 'token.json'
+    __MIN_REVALIDATE_INTERVAL = 60
 
     def __init__(self):
-        self.__token_path = os.path.join(G.addon_config.token_path, self.__TOKEN_FILE)
-        self.__token = Token()
-        self.__load_cache()
+        self.__token_path = TokenStore.get_path()
         self.__url = G.portal_config.portal_url
         self.__mac_cookie = G.portal_config.mac_cookie
         self.__referrer = G.portal_config.server_address
+        self.__portal = '{} {}'.format(self.__url, self.__mac_cookie)
+        self.__rejected = None
+        self.__token = self.__load_token()
 
     def get_token(self, refresh_token):
         """Get Token"""
-        Logger.debug('Token path {}'.format(self.__token_path))
+        Logger.debug('Token path %s', self.__token_path)
         if self.__token.value:
-            if refresh_token:
-                self.__refresh_token()
-            return self.__token.value
-        self.clear_cache()
-        Logger.debug('Getting token from {}'.format(self.__url))
-        response = requests.get(url=self.__url,
-                                headers={'Cookie': self.__mac_cookie, 'X-User-Agent': 'Model: MAG250; Link: WiFi', 'Referrer': self.__referrer,
-                                         'User-Agent': 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'},
-                                params={'type': 'stb', 'action': 'handshake'},
-                                timeout=30
-                                )
-        if response.status_code != 200 or response.text.find('Authorization failed') != -1:
-            Logger.error('Error getting token, statusCode={}'.format(response.status_code))
-            Logger.debug('Token Response {}'.format(response.text))
-            xbmcgui.Dialog().ok(G.addon_config.name, "Error getting token")
-            raise Exception
-        self.__token.value = response.json()['js']['token']
-        self.__refresh_token()
-        self.__save_cache()
+            if refresh_token or self.__token.expires_at < time.time():
+                # A token the portal just rejected is revalidated even when that was done recently
+                self.__revalidate_token(refresh_token)
+            if self.__token.value:
+                return self.__token.value
+        if not self.__single_flight_handshake():
+            raise AuthError('Error getting token')
         return self.__token.value
 
+    def discard_token(self, value):
+        """Forget a token rejected by the portal, the next get_token replaces it once for all invocations"""
+        self.__rejected = value
+        self.__token = Token()
+
     def clear_cache(self):
         """Clear token from cache"""
         self.__token = Token()
-        if xbmcvfs.exists(self.__token_path):
-            xbmcvfs.delete(self.__token_path)
-
-    def __refresh_token(self):
-        """Refresh token"""
-        Logger.debug('Refreshing token')
-        requests.get(url=self.__url,
-                     headers={'Cookie': self.__mac_cookie, 'SN': G.portal_config.serial_number, 'Authorization': 'Bearer ' + self.__token.value,
-                              'X-User-Agent': 'Model: MAG250; Link: WiFi', 'Referrer': self.__referrer,
-                              'User-Agent': 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'},
-                     params={
-                         'type': 'stb',
-                         'action': 'get_profile',
-                         'hd': '1',
-                         'auth_second_step': '0',
-                         'num_banks': '1',
-                         'stb_type': 'MAG250',
-                         'image_version': '216',
-                         'hw_version': '1.7-BD-00',
-                         'not_valid_token': '0',
-                         'device_id': G.portal_config.device_id,
-                         'device_id2': G.portal_config.device_id_2,
-                         'signature': G.portal_config.signature,
-                         'sn': G.portal_config.serial_number,
-                         'ver': 'ImageDescription:%200.2.18-r23-pub-254;%20ImageDate:%20Wed%20Aug%2029%2010:49:26'
-                                '%20EEST%202018;%20PORTAL%20version:%205.1.1;%20API%20Version:%20JS%20API'
-                                '%20version:%20328;%20STB%20API%20version:%20134;%20Player%20Engine%20version'
-                                ':%200x566'
-                     },
-                     timeout=30
-                     )
-        requests.get(url=self.__url,
-                     headers={'Cookie': self.__mac_cookie, 'SN': G.portal_config.serial_number, 'Authorization': 'Bearer ' + self.__token.value,
-                              'X-User-Agent': 'Model: MAG250; Link: WiFi', 'Referrer': self.__referrer,
-                              'User-Agent': 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'},
-                     params={
-                         'type': 'watchdog', 'action': 'get_events',
-                         'init': '0', 'cur_play_type': '1', 'event_active_id': '0'
-                     },
-                     timeout=30
-                     )
-
-    def __load_cache(self):
-        """ Load tokens from cache """
-        Logger.debug('Loading token from cache')
-        try:
-            with xbmcvfs.File(self.__token_path, 'r') as f:
-                self.__token.__dict__ = json.loads(f.read())
-        except (IOError, TypeError, ValueError):
-            Logger.warn('We could not use the cache since it is invalid or non-existent.')
-
-    def __save_cache(self):
-        """ Store tokens in cache """
-        Logger.debug('Saving token to cache')
-        with xbmcvfs.File(self.__token_path, 'w') as f:
-            json.dump(self.__token.__dict__, f, indent=2)
+        TokenStore.clear()
+
+    def refresh_ahead(self, margin):
+        """Revalidate the token before it expires so plugin invocations do not have to, returns False without a token"""
+        if not self.__token.value:
+            return False
+        if self.__token.expires_at - margin > time.time():
+            return True
+        Logger.debug('Refreshing token ahead of expiry')
+        if not self.__get_profile():
+            Logger.warn('Token rejected by the portal, getting a new one')
+            self.discard_token(self.__token.value)
+            return self.__single_flight_handshake()
+        self.__token = TokenStore.save(self.__token, replace=False)
+        return True
+
+    def send_watchdog(self):
+        """Send watchdog keep-alive for the cached token, returns False without a token"""
+        if not self.__token.value:
+            return False
+        Logger.debug('Sending watchdog')
+        PortalSession.get(url=self.__url,
+                          headers={'Cookie': self.__mac_cookie, 'SN': G.portal_config.serial_number, 'Authorization': 'Bearer ' + self.__token.value,
+                                   'X-User-Agent': 'Model: MAG250; Link: WiFi', 'Referrer': self.__referrer,
+                                   'User-Agent': 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'},
+                          params={
+                              'type': 'watchdog', 'action': 'get_events',
+                              'init': '0', 'cur_play_type': '1', 'event_active_id': '0'
+                          }
+                          )
+        return True
+
+    def __load_token(self):
+        """Stored token, empty when it was issued for another portal"""
+        token = TokenStore.load()
+        if token.portal not in (None, self.__portal):
+            Logger.debug('Cached token belongs to another portal')
+            return Token()
+        return token
+
+    def __single_flight_handshake(self):
+        """Get a new token, unless another invocation got one while this one waited for the lock"""
+        with TokenLock():
+            token = self.__load_token()
+            if token.value and token.value != self.__rejected:
+                Logger.debug('Using token obtained by another invocation')
+                self.__token = token
+                return True
+            self.clear_cache()
+            if not self.__handshake():
+                return False
+            self.__get_profile()
+            self.__token = TokenStore.save(self.__token)
+            self.__rejected = None
+            return True
+
+    def __handshake(self):
+        """Get a new token, returns False when the portal refuses it"""
+        Logger.debug('Getting token from %s', self.__url)
+        Metrics.increment('handshake')
+        response = PortalSession.get(url=self.__url,
+                                     headers={'Cookie': self.__mac_cookie, 'X-User-Agent': 'Model: MAG250; Link: WiFi', 'Referrer': self.__referrer,
+                                              'User-Agent': 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'},
+                                     params={'type': 'stb', 'action': 'handshake'}
+                                     )
+        if response.status_code != 200 or response.text.find('Authorization failed') != -1:
+            Logger.error('Error getting token, statusCode={}'.format(response.status_code))
+            Logger.debug('Token Response %s', response.text)
+            return False
+        self.__token = Token(value=response.json()['js']['token'], portal=self.__portal)
+        return True
+
+    def __revalidate_token(self, force):
+        """Revalidate token with a profile call, unless that was just done and not forced. A token the portal rejects is discarded"""
+        if not force and self.__token.validated_at > time.time() - self.__MIN_REVALIDATE_INTERVAL:
+            Logger.debug('Token validated recently, skipping profile call')
+            return
+        if not self.__get_profile():
+            Logger.warn('Token rejected by the portal, getting a new one')
+            self.discard_token(self.__token.value)
+            return
+        self.__token = TokenStore.save(self.__token, replace=False)
+
+    def __get_profile(self):
+        """Get profile, this activates the token on the portal. Returns whether the portal accepted the token"""
+        Logger.debug('Getting profile')
+        Metrics.increment('revalidation')
+        response = PortalSession.get(url=self.__url,
+                                     headers={'Cookie': self.__mac_cookie, 'SN': G.portal_config.serial_number, 'Authorization': 'Bearer ' + self.__token.value,
+                                              'X-User-Agent': 'Model: MAG250; Link: WiFi', 'Referrer': self.__referrer,
+                                              'User-Agent': 'Mozilla/5.0 (QtEmbedded; U; Linux; C) AppleWebKit/533.3 (KHTML, like Gecko) MAG200 stbapp ver: 2 rev: 250 Safari/533.3'},
+                                     params={
+                                         'type': 'stb',
+                                         'action': 'get_profile',
+                                         'hd': '1',
+                                         'auth_second_step': '0',
+                                         'num_banks': '1',
+                                         'stb_type': 'MAG250',
+                                         'image_version': '216',
+                                         'hw_version': '1.7-BD-00',
+                                         'not_valid_token': '0',
+                                         'device_id': G.portal_config.device_id,
+                                         'device_id2': G.portal_config.device_id_2,
+                                         'signature': G.portal_config.signature,
+                                         'sn': G.portal_config.serial_number,
+                                         'ver': 'ImageDescription:%200.2.18-r23-pub-254;%20ImageDate:%20Wed%20Aug%2029%2010:49:26'
+                                                '%20EEST%202018;%20PORTAL%20version:%205.1.1;%20API%20Version:%20JS%20API'
+                                                '%20version:%20328;%20STB%20API%20version:%20134;%20Player%20Engine%20version'
+                                                ':%200x566'
+                                     }
+                                     )
+        if response.status_code != 200 or response.text.find('Authorization failed') != -1:
+            return False
+        now = time.time()
+        self.__token.validated_at = now
+        self.__token.expires_at = now + G.addon_config.token_validity
+        return True
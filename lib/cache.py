@@ -0,0 +1,108 @@
+"""Persistent response cache"""
+from __future__ import absolute_import, division, unicode_literals
+import os
+import json
+import time
+import shutil
+import hashlib
+from .globals import G
+from .loggers import Logger
+
+
+class ResponseCache:
+    """TTL cache of portal responses stored as JSON files in the addon profile directory"""
+
+    __CACHE_DIR = 'cache'
+
+    def __init__(self, name, max_entries):
+        self.__path = os.path.join(G.addon_config.token_path, self.__CACHE_DIR, name)
+        self.__max_entries = max_entries
+
+    def get(self, params):
+        """Get cached value for params, None when missing or expired"""
+        file_path = self.__get_file_path(params)
+        try:
+            with open(file_path, 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if entry.get('expires', 0) < time.time():
+            Logger.debug('Cache expired for %s', params)
+            self.__delete(file_path)
+            return None
+        # Touch the entry so eviction drops the least recently used ones first
+        os.utime(file_path, None)
+        return entry.get('value')
+
+    def put(self, params, value, ttl):
+        """Store value for params, valid for ttl seconds"""
+        if not os.path.isdir(self.__path):
+            os.makedirs(self.__path, exist_ok=True)
+        file_path = self.__get_file_path(params)
+        temp_path = '{}.{}.tmp'.format(file_path, os.getpid())
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'expires': time.time() + ttl, 'value': value}, f)
+            os.replace(temp_path, file_path)
+        except IOError as ex:
+            Logger.warn('Could not write cache {}: {}'.format(file_path, ex))
+            self.__delete(temp_path)
+            return
+        self.__evict()
+
+    def invalidate(self, _type):
+        """Remove all entries for a content type"""
+        prefix = '{}-'.format(_type)
+        for file_name in self.__list_entries():
+            if file_name.startswith(prefix):
+                self.__delete(os.path.join(self.__path, file_name))
+
+    def clear(self):
+        """Remove all entries"""
+        shutil.rmtree(self.__path, ignore_errors=True)
+
+    @staticmethod
+    def clear_all():
+        """Remove every cache stored in the profile directory"""
+        Logger.debug('Clearing all caches')
+        shutil.rmtree(os.path.join(G.addon_config.token_path, ResponseCache.__CACHE_DIR), ignore_errors=True)
+
+    def __get_file_path(self, params):
+        """Cache file path, keyed by portal and sorted params"""
+        key = json.dumps([G.portal_config.portal_url, G.portal_config.mac_cookie, sorted((str(k), str(v)) for k, v in params.items())])
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.__path, '{}-{}.json'.format(params.get('type', ''), digest))
+
+    def __list_entries(self):
+        """Cache file names"""
+        try:
+            return [file_name for file_name in os.listdir(self.__path) if file_name.endswith('.json')]
+        except OSError:
+            return []
+
+    def __evict(self):
+        """Drop least recently used entries above max_entries"""
+        entries = self.__list_entries()
+        if len(entries) <= self.__max_entries:
+            return
+        paths = [os.path.join(self.__path, file_name) for file_name in entries]
+        paths.sort(key=ResponseCache.__get_mtime)
+        for file_path in paths[:len(paths) - self.__max_entries]:
+            Logger.debug('Evicting cache entry %s', file_path)
+            self.__delete(file_path)
+
+    @staticmethod
+    def __get_mtime(file_path):
+        """Modification time, 0 when the file vanished"""
+        try:
+            return os.path.getmtime(file_path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def __delete(file_path):
+        """Delete file ignoring errors"""
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
@@ -0,0 +1,437 @@
+"""Local catalogue of portal listings"""
+from __future__ import absolute_import, division, unicode_literals
+import os
+import re
+import json
+import time
+import sqlite3
+from .globals import G
+from .trigram import TrigramIndex
+
+
+class Catalogue:
+    """
+    Listings of get_ordered_list stored in an SQLite database in the addon profile directory
+
+    A listing is keyed by content type, category id and fav. Its items are kept in portal order. A full sync writes
+    a new generation of them and only switches to it once complete, so a listing is always served whole. An
+    incremental sync of a listing sorted by added pages only until it reaches the newest item already known, the
+    added high-water mark, and puts the new items in front. The All listing of a content type is merged from the
+    synced categories instead. WAL mode lets the plugin read while the service writes.
+
+    Names, descriptions, actors and directors are indexed for full-text search when SQLite has FTS5. The index
+    folds case and diacritics, an item listed in several categories is indexed once. Titles are also indexed by
+    trigrams in a file next to the database, rebuilt once a sync completed, for the searches which match nothing
+    in full-text: most often a typo.
+    """
+
+    __DB_FILE = 'catalogue.db'
+    __TRIGRAM_FILE = 'catalogue.trigrams'
+    __VERSION = 5
+    __SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS listings (type TEXT NOT NULL, category_id TEXT NOT NULL, fav INTEGER NOT NULL, '
+        'generation INTEGER NOT NULL DEFAULT 0, synced_at REAL NOT NULL DEFAULT 0, full_synced_at REAL NOT NULL DEFAULT 0, '
+        'total_items INTEGER NOT NULL DEFAULT 0, max_page_items INTEGER NOT NULL DEFAULT 0, watermark TEXT NOT NULL DEFAULT \'\', '
+        'sync_generation INTEGER NOT NULL DEFAULT 0, sync_incremental INTEGER NOT NULL DEFAULT 0, next_page INTEGER NOT NULL DEFAULT 1, '
+        'next_position INTEGER NOT NULL DEFAULT 0, failures INTEGER NOT NULL DEFAULT 0, retry_at REAL NOT NULL DEFAULT 0, '
+        'PRIMARY KEY (type, category_id, fav))',
+        'CREATE TABLE IF NOT EXISTS items (type TEXT NOT NULL, category_id TEXT NOT NULL, fav_listing INTEGER NOT NULL, '
+        'generation INTEGER NOT NULL, position INTEGER NOT NULL, id TEXT NOT NULL, added TEXT NOT NULL, fav INTEGER NOT NULL, '
+        'record TEXT NOT NULL, PRIMARY KEY (type, category_id, fav_listing, generation, position))',
+        'CREATE INDEX IF NOT EXISTS items_id ON items (type, id, category_id, fav_listing, generation)',
+        'CREATE TABLE IF NOT EXISTS documents (rowid INTEGER PRIMARY KEY, type TEXT NOT NULL, id TEXT NOT NULL, name TEXT NOT NULL DEFAULT \'\', '
+        'UNIQUE (type, id))',
+        'CREATE TABLE IF NOT EXISTS trigram_index (synced_at REAL NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS portal (identity TEXT NOT NULL)'
+    )
+    __SEARCH_SCHEMA = ('CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(name, description, actors, director, '
+                       'tokenize="unicode61 remove_diacritics 2")')
+    # bm25 weights of name, description, actors and director
+    __SEARCH_RANK = 'bm25(search, 10.0, 1.0, 2.0, 2.0)'
+    __SEARCH_LIMIT = 500
+    __SEARCH_CANDIDATES = 4
+    __LISTING_KEY = 'type = ? AND category_id = ? AND fav = ?'
+    __ITEMS_KEY = 'type = ? AND category_id = ? AND fav_listing = ?'
+    __GENERATION_ITEMS = 'items.type = ? AND items.category_id = ? AND items.fav_listing = ? AND items.generation = ?'
+
+    def __init__(self, sync=False):
+        """Open the catalogue, with sync the data of another portal or MAC is dropped to sync the configured one"""
+        self.__connection = sqlite3.connect(self.get_path(), timeout=5)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        portal = '{} {}'.format(G.portal_config.portal_url, G.portal_config.mac_cookie)
+        # Only the sync replaces the data of another portal, the plugin and the service would otherwise drop each
+        # other's data while one of them still runs with the previous settings
+        self.__other_portal = not sync and self.__get_portal() not in (None, portal)
+        with self.__connection:
+            if self.__connection.execute('PRAGMA user_version').fetchone()[0] != self.__VERSION or (sync and self.__get_portal() not in (None, portal)):
+                # The catalogue only holds portal data, an older layout or the data of another portal or MAC is
+                # dropped and synced again
+                for table in ('listings', 'items', 'documents', 'search', 'trigram_index', 'portal'):
+                    self.__connection.execute('DROP TABLE IF EXISTS ' + table)
+                self.__connection.execute('PRAGMA user_version = {}'.format(self.__VERSION))
+                self.__remove_files(self.get_trigram_path())
+            for statement in self.__SCHEMA:
+                self.__connection.execute(statement)
+            if self.__get_portal() is None:
+                self.__connection.execute('INSERT INTO portal VALUES (?)', (portal,))
+            try:
+                self.__connection.execute(self.__SEARCH_SCHEMA)
+                self.__has_search = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5, searches go to the portal
+                self.__has_search = False
+
+    def __get_portal(self):
+        """Portal url and MAC cookie the catalogue holds the data of, None for a new catalogue"""
+        try:
+            row = self.__connection.execute('SELECT identity FROM portal').fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the database"""
+        self.__connection.close()
+
+    @staticmethod
+    def get_path():
+        """Database file in the profile directory"""
+        return os.path.join(G.addon_config.token_path, Catalogue.__DB_FILE)
+
+    @staticmethod
+    def get_trigram_path():
+        """Trigram index file in the profile directory"""
+        return os.path.join(G.addon_config.token_path, Catalogue.__TRIGRAM_FILE)
+
+    @staticmethod
+    def exists():
+        """Whether a catalogue was created, the plugin does not create one just to find it empty"""
+        return os.path.isfile(Catalogue.get_path())
+
+    @staticmethod
+    def get_key(params):
+        """Listing key of get_ordered_list params ignoring search, None for listings the catalogue does not hold"""
+        if params.get('action') != 'get_ordered_list' or params.get('movie_id'):
+            return None
+        fav = 1 if str(params.get('fav', '0')) == '1' else 0
+        category_id = str(params.get('genre' if params.get('type') == 'itv' else 'category', ''))
+        # Only whole categories and the favorites listing are synced, not favorites of one category
+        if fav and category_id:
+            return None
+        return params.get('type'), category_id, fav
+
+    @staticmethod
+    def get_params(key):
+        """get_ordered_list params of a listing key, as Api requests the listing"""
+        _type, category_id, fav = key
+        params = {'type': _type, 'action': 'get_ordered_list', 'sortby': 'number' if _type == 'itv' else 'added'}
+        if category_id:
+            params['genre' if _type == 'itv' else 'category'] = category_id
+        if fav:
+            params['fav'] = '1'
+        return params
+
+    @staticmethod
+    def is_incremental(key):
+        """Whether the listing is sorted by added, TV is sorted by number and favorites are small enough to sync whole"""
+        return key[0] != 'itv' and not key[2]
+
+    def get_listing(self, key, page, page_limit, max_age):
+        """Listing of page_limit pages from page like Api.get_listing returns it, None unless synced within max_age seconds"""
+        if self.__other_portal:
+            return None
+        row = self.__connection.execute('SELECT generation, synced_at, total_items, max_page_items FROM listings WHERE ' + self.__LISTING_KEY,
+                                        key).fetchone()
+        if row is None or row[0] == 0 or row[1] < time.time() - max_age:
+            return None
+        generation, _, total_items, max_page_items = row
+        cursor = self.__connection.execute('SELECT fav, record FROM items WHERE ' + self.__ITEMS_KEY + ' AND generation = ? '
+                                           'ORDER BY position LIMIT ? OFFSET ?',
+                                           key + (generation, page_limit * max_page_items, (int(page) - 1) * max_page_items))
+        return {'max_page_items': max_page_items, 'total_items': total_items, 'data': self.__get_items(cursor)}
+
+    def search(self, key, search_term, page, page_limit, max_age):
+        """
+        Items of the listing matching all words of search_term, words match as prefixes. Title matches come first,
+        the other fields are only searched when titles do not fill the results. When nothing matches, titles
+        completing the words and then titles similar to search_term are listed. At most 500 matches are returned.
+
+        Returns page_limit pages from page like Api.get_listing, None unless the listing was synced within max_age seconds
+        and full-text search or a trigram index is available.
+        """
+        if self.__other_portal:
+            return None
+        row = self.__connection.execute('SELECT generation, synced_at, max_page_items FROM listings WHERE ' + self.__LISTING_KEY, key).fetchone()
+        if row is None or row[0] == 0 or row[1] < time.time() - max_age or not (self.__has_search or os.path.isfile(self.get_trigram_path())):
+            return None
+        generation, _, max_page_items = row
+        query = self.get_match_query(search_term)
+        if not query:
+            return {'max_page_items': max_page_items, 'total_items': 0, 'data': []}
+        rows = []
+        found = set()
+        for match in ('name : ({})'.format(query), query) if self.__has_search else ():
+            for row in self.__match(match, key, generation, self.__SEARCH_LIMIT + len(rows)):
+                if row[0] not in found and len(rows) < self.__SEARCH_LIMIT:
+                    found.add(row[0])
+                    rows.append(row[1:])
+            if len(rows) == self.__SEARCH_LIMIT:
+                break
+        if not rows:
+            rows = self.__match_trigrams(search_term, key, generation)
+        data = self.__get_items(rows)
+        start = (int(page) - 1) * max_page_items
+        return {'max_page_items': max_page_items, 'total_items': len(data), 'data': data[start:start + page_limit * max_page_items]}
+
+    def __match(self, match, key, generation, limit):
+        """Document rowid, fav and record of the best limit matches in the listing generation"""
+        # Ranking in the index alone is much cheaper than ranking joined rows. The listing items are then looked
+        # up for the best candidates, which is exact when they hold enough of them or were all the matches.
+        candidates = [row[0] for row in self.__connection.execute('SELECT rowid FROM search WHERE search MATCH ? ORDER BY ' + self.__SEARCH_RANK +
+                                                                  ' LIMIT ?', (match, limit * self.__SEARCH_CANDIDATES))]
+        rows = self.__get_listed(candidates, key, generation, limit)
+        if len(rows) == limit or len(candidates) < limit * self.__SEARCH_CANDIDATES:
+            return rows
+        # A small listing, most of the best matches are in other categories
+        return self.__connection.execute(
+            'SELECT search.rowid, items.fav, items.record FROM search CROSS JOIN documents ON documents.rowid = search.rowid '
+            'CROSS JOIN items ON items.type = documents.type AND items.id = documents.id '
+            'WHERE search MATCH ? AND ' + self.__GENERATION_ITEMS + ' ORDER BY ' + self.__SEARCH_RANK + ', items.position LIMIT ?', (match,) + key + (generation, limit)).fetchall()
+
+    def __match_trigrams(self, search_term, key, generation):
+        """Fav and record of the items of the listing generation with titles completing search_term, then with similar titles"""
+        try:
+            index = TrigramIndex.load(self.get_trigram_path())
+        except (IOError, ValueError):
+            return []
+        limit = self.__SEARCH_LIMIT * self.__SEARCH_CANDIDATES
+        candidates = [_id for _id, _ in index.complete(search_term, limit)] + [_id for _id, _ in index.search(search_term, limit)]
+        return [row[1:] for row in self.__get_listed(list(dict.fromkeys(candidates)), key, generation, self.__SEARCH_LIMIT)]
+
+    def __get_listed(self, candidates, key, generation, limit):
+        """Document rowid, fav and record of the candidate documents in the listing generation, in candidate order"""
+        # CROSS JOIN keeps the join order, the planner would otherwise scan the listing
+        return self.__connection.execute('SELECT documents.rowid, items.fav, items.record FROM json_each(?) AS candidates '
+                                         'CROSS JOIN documents ON documents.rowid = candidates.value '
+                                         'CROSS JOIN items ON items.type = documents.type AND items.id = documents.id '
+                                         'WHERE ' + self.__GENERATION_ITEMS + ' ORDER BY candidates.key LIMIT ?',
+                                         (json.dumps(candidates),) + key + (generation, limit)).fetchall()
+
+    @staticmethod
+    def get_match_query(search_term):
+        """FTS5 query matching all words of the search term as prefixes, empty without words"""
+        return ' '.join('"{}"*'.format(word) for word in re.findall(r'\w+', search_term))
+
+    def get_sync_state(self, key):
+        """Seconds since the last sync and the last full sync, None when never synced, and the page the sync continues at"""
+        row = self.__connection.execute('SELECT generation, synced_at, full_synced_at, sync_generation, next_page FROM listings WHERE '
+                                        + self.__LISTING_KEY, key).fetchone()
+        if row is None or row[0] == 0:
+            return None, None, row[4] if row and row[3] else 1
+        now = time.time()
+        return now - row[1], now - row[2], row[4] if row[3] else 1
+
+    def is_deferred(self, key):
+        """Whether the sync of the listing failed and is not to be retried yet"""
+        row = self.__connection.execute('SELECT retry_at FROM listings WHERE ' + self.__LISTING_KEY, key).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def defer(self, key, delay, max_delay):
+        """Retry the sync of a listing which failed in delay seconds, doubled with each failure in a row up to max_delay, returns the delay"""
+        with self.__connection:
+            self.__connection.execute('INSERT OR IGNORE INTO listings (type, category_id, fav) VALUES (?, ?, ?)', key)
+            failures = self.__connection.execute('SELECT failures FROM listings WHERE ' + self.__LISTING_KEY, key).fetchone()[0]
+            delay = min(delay * 2 ** failures, max_delay)
+            self.__connection.execute('UPDATE listings SET failures = failures + 1, retry_at = ? WHERE ' + self.__LISTING_KEY, (time.time() + delay,) + key)
+        return delay
+
+    def add_page(self, key, page, response, incremental=False):
+        """
+        Store a page of the listing being synced, returns whether the sync completed with it
+
+        Page 1 starts a sync, incremental when requested and the listing has a watermark. Other pages continue the
+        sync in progress.
+        """
+        max_page_items = int(response['max_page_items'])
+        total_items = int(response['total_items'])
+        data = response['data']
+        with self.__connection:
+            self.__connection.execute('INSERT OR IGNORE INTO listings (type, category_id, fav) VALUES (?, ?, ?)', key)
+            generation, sync_generation, sync_incremental, next_position, watermark = self.__connection.execute(
+                'SELECT generation, sync_generation, sync_incremental, next_position, watermark FROM listings WHERE ' + self.__LISTING_KEY,
+                key).fetchone()
+            if page == 1 or not sync_generation:
+                sync_incremental = incremental and generation > 0 and watermark != ''
+                if sync_incremental:
+                    sync_generation = generation
+                    # Room in front of the listing for as many new items as the portal lists
+                    next_position = self.__connection.execute('SELECT COALESCE(MIN(position), 0) FROM items WHERE ' + self.__ITEMS_KEY +
+                                                              ' AND generation = ?', key + (generation,)).fetchone()[0] - total_items
+                else:
+                    sync_generation = generation + 1
+                    next_position = 0
+                    self.__delete_items(key, 'generation = ?', sync_generation)
+            reached_watermark = False
+            if sync_incremental:
+                reached_watermark = any(self.__get_added(item) < watermark for item in data)
+                data = [item for item in data if self.__get_added(item) >= watermark and not self.__contains(key, sync_generation, item)]
+            self.__connection.executemany('INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+                key + (sync_generation, next_position + index, str(item['id']), self.__get_added(item),
+                       1 if str(item.get('fav', 0)) == '1' else 0, json.dumps(item))
+                for index, item in enumerate(data)])
+            next_position += len(data)
+            self.__index(key[0], data)
+            if response['data'] and page * max_page_items < total_items and not reached_watermark:
+                self.__connection.execute('UPDATE listings SET sync_generation = ?, sync_incremental = ?, next_page = ?, next_position = ? WHERE '
+                                          + self.__LISTING_KEY, (sync_generation, sync_incremental, page + 1, next_position) + key)
+                return False
+            self.__complete(key, sync_generation, max_page_items, sync_incremental)
+        return True
+
+    def merge_listings(self, _type, category_ids):
+        """
+        Store the All listing of a content type as the union of its category listings, the portal lists the same items
+        there and syncing it would fetch the whole catalogue twice. An item of several categories is listed once, in
+        the order of the All listing, TV by number and others newest first. It is as old as its oldest category and
+        merged again once any category was synced since, returns whether it was. A category whose sync fails does
+        not hold it back, it is merged with the items it last synced if any.
+        """
+        key = (_type, '*', 0)
+        categories = (_type, json.dumps(category_ids))
+        count, synced_at, newest_synced_at, max_page_items = self.__connection.execute(
+            'SELECT SUM(generation > 0 OR failures > 0), COALESCE(MIN(CASE WHEN generation > 0 AND failures = 0 THEN synced_at END), '
+            'MIN(CASE WHEN generation > 0 THEN synced_at END)), MAX(CASE WHEN generation > 0 THEN synced_at END), MAX(max_page_items) '
+            'FROM listings WHERE type = ? AND fav = 0 AND category_id IN (SELECT value FROM json_each(?))', categories).fetchone()
+        merged = self.__connection.execute('SELECT generation, full_synced_at FROM listings WHERE ' + self.__LISTING_KEY, key).fetchone()
+        if (not category_ids or (count or 0) < len(category_ids) or newest_synced_at is None
+                or (merged is not None and merged[1] >= newest_synced_at)):
+            return False
+        generation = (merged[0] if merged else 0) + 1
+        order = 'CAST(json_extract(record, \'$.number\') AS INTEGER), id' if _type == 'itv' else 'added DESC, id'
+        with self.__connection:
+            self.__connection.execute('INSERT OR IGNORE INTO listings (type, category_id, fav) VALUES (?, ?, ?)', key)
+            self.__connection.execute(
+                'INSERT INTO items SELECT type, \'*\', 0, ?, ROW_NUMBER() OVER (ORDER BY ' + order + ') - 1, id, added, fav, record FROM items '
+                'WHERE rowid IN (SELECT MIN(items.rowid) FROM listings CROSS JOIN items ON items.type = listings.type '
+                'AND items.category_id = listings.category_id AND items.fav_listing = 0 AND items.generation = listings.generation '
+                'WHERE listings.type = ? AND listings.fav = 0 AND listings.category_id IN (SELECT value FROM json_each(?)) GROUP BY items.id)',
+                (generation,) + categories)
+            total_items, watermark = self.__connection.execute('SELECT COUNT(*), COALESCE(MAX(added), \'\') FROM items WHERE ' + self.__ITEMS_KEY +
+                                                               ' AND generation = ?', key + (generation,)).fetchone()
+            # full_synced_at of the All listing is when the newest category it was merged from was synced
+            self.__connection.execute('UPDATE listings SET generation = ?, synced_at = ?, full_synced_at = ?, total_items = ?, max_page_items = ?, '
+                                      'watermark = ? WHERE ' + self.__LISTING_KEY,
+                                      (generation, synced_at, newest_synced_at, total_items, max_page_items, watermark) + key)
+            self.__delete_items(key, 'generation != ?', generation)
+        return True
+
+    def update_trigram_index(self):
+        """Build the trigram index of titles when a listing was synced since it was last built, returns whether it was built"""
+        synced_at = self.__connection.execute('SELECT MAX(synced_at) FROM listings').fetchone()[0]
+        built = self.__connection.execute('SELECT synced_at FROM trigram_index').fetchone()
+        path = self.get_trigram_path()
+        if not synced_at or (built is not None and built[0] >= synced_at and os.path.isfile(path)):
+            return False
+        TrigramIndex.build(self.__connection.execute('SELECT rowid, name FROM documents WHERE name != \'\' ORDER BY rowid')).save(path)
+        with self.__connection:
+            self.__connection.execute('DELETE FROM trigram_index')
+            self.__connection.execute('INSERT INTO trigram_index VALUES (?)', (synced_at,))
+        return True
+
+    def set_favorite(self, _type, video_id, fav):
+        """Update the fav flag of an item, the favorites listing is served by the portal until synced again"""
+        if self.__other_portal:
+            return
+        with self.__connection:
+            self.__connection.execute('UPDATE items SET fav = ? WHERE type = ? AND id = ?', (1 if fav else 0, _type, str(video_id)))
+            self.__connection.execute('DELETE FROM listings WHERE type = ? AND fav = 1', (_type,))
+            self.__connection.execute('DELETE FROM items WHERE type = ? AND fav_listing = 1', (_type,))
+
+    def __complete(self, key, generation, max_page_items, incremental):
+        """Serve the synced generation, drop the previous one and move the watermark to the newest item"""
+        total_items, watermark = self.__connection.execute('SELECT COUNT(*), COALESCE(MAX(added), \'\') FROM items WHERE ' + self.__ITEMS_KEY +
+                                                           ' AND generation = ?', key + (generation,)).fetchone()
+        now = time.time()
+        self.__connection.execute('UPDATE listings SET generation = ?, synced_at = ?, full_synced_at = CASE WHEN ? THEN full_synced_at ELSE ? END, '
+                                  'total_items = ?, max_page_items = ?, watermark = ?, sync_generation = 0, sync_incremental = 0, next_page = 1, '
+                                  'next_position = 0, failures = 0, retry_at = 0 WHERE ' + self.__LISTING_KEY,
+                                  (generation, now, incremental, now, total_items, max_page_items, watermark) + key)
+        self.__delete_items(key, 'generation != ?', generation)
+        if not incremental:
+            self.__drop_deleted_documents()
+
+    def __index(self, _type, items):
+        """Add or update the search documents of items"""
+        documents = [(_type, str(item['id'])) for item in items]
+        self.__connection.executemany('INSERT OR IGNORE INTO documents (type, id) VALUES (?, ?)', documents)
+        self.__connection.executemany('UPDATE documents SET name = ? WHERE type = ? AND id = ?',
+                                      [(self.__get_text(item, 'name'),) + document for item, document in zip(items, documents)])
+        if not self.__has_search:
+            return
+        self.__connection.executemany(
+            'INSERT OR REPLACE INTO search (rowid, name, description, actors, director) '
+            'VALUES ((SELECT rowid FROM documents WHERE type = ? AND id = ?), ?, ?, ?, ?)',
+            [(_type, str(item['id']), self.__get_text(item, 'name', 'o_name'), self.__get_text(item, 'description'),
+              self.__get_text(item, 'actors'), self.__get_text(item, 'director')) for item in items])
+
+    def __drop_deleted_documents(self):
+        """Drop the search documents of items no longer listed in any category"""
+        deleted = 'SELECT rowid FROM documents WHERE NOT EXISTS (SELECT 1 FROM items WHERE items.type = documents.type AND items.id = documents.id)'
+        if self.__has_search:
+            self.__connection.execute('DELETE FROM search WHERE rowid IN (' + deleted + ')')
+        self.__connection.execute('DELETE FROM documents WHERE rowid IN (' + deleted + ')')
+
+    @staticmethod
+    def __get_items(rows):
+        """Items of fav and record rows, the fav flag is kept apart from the record as toggling it updates only the flag"""
+        items = []
+        for fav, record in rows:
+            item = json.loads(record)
+            item['fav'] = fav
+            items.append(item)
+        return items
+
+    @staticmethod
+    def __get_text(item, *fields):
+        """Distinct text values of the fields"""
+        values = []
+        for field in fields:
+            value = item.get(field)
+            if isinstance(value, str) and value and value not in values:
+                values.append(value)
+        return ' '.join(values)
+
+    def __contains(self, key, generation, item):
+        """Whether the listing generation holds the item"""
+        return self.__connection.execute('SELECT 1 FROM items WHERE ' + self.__ITEMS_KEY + ' AND generation = ? AND id = ?',
+                                         key + (generation, str(item['id']))).fetchone() is not None
+
+    def __delete_items(self, key, condition, generation):
+        """Delete the items of a listing matching the generation condition"""
+        self.__connection.execute('DELETE FROM items WHERE ' + self.__ITEMS_KEY + ' AND ' + condition, key + (generation,))
+
+    @staticmethod
+    def __get_added(item):
+        """Added timestamp of an item, the portal formats it so that it sorts as text"""
+        return str(item.get('added') or '')
+
+    @staticmethod
+    def clear():
+        """Delete the catalogue"""
+        Catalogue.__remove_files(Catalogue.get_path(), Catalogue.get_path() + '-wal', Catalogue.get_path() + '-shm', Catalogue.get_trigram_path())
+
+    @staticmethod
+    def __remove_files(*paths):
+        """Delete the files which exist"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,109 @@
+"""Background sync of the local catalogue"""
+from __future__ import absolute_import, division, unicode_literals
+import time
+import sqlite3
+from collections import deque
+from .globals import G
+from .api import Api
+from .catalogue import Catalogue
+from .loggers import Logger
+
+
+class CatalogueSync:
+    """
+    Fills the catalogue with every category and the favorites of VOD, series and TV, a page at a time
+
+    The page a sync continues at is stored with each page, so a sync interrupted by playback or a Kodi restart
+    resumes there. A listing is synced again once half of catalogue_max_age passed, so it is replaced before
+    the plugin stops serving it. Listings sorted by added are synced incrementally, only their new items are
+    fetched, and in full every catalogue_full_sync_interval to drop the items deleted from the portal. The All
+    category is not synced but merged from the others. A listing the portal sends a response for which cannot
+    be stored is retried later with a growing delay, the other listings are synced meanwhile. Once all listings
+    are synced the trigram index of titles is rebuilt if any changed, and the catalogue is checked again for due
+    listings a few minutes later.
+    """
+
+    __CATEGORIES = {'vod': 'get_vod_categories', 'series': 'get_series_categories', 'itv': 'get_tv_genres'}
+    __PAGES_PER_RUN = 4
+    __RETRY_DELAY = 60
+    __MAX_RETRY_DELAY = 6 * 3600
+    __CHECK_INTERVAL = 10 * 60
+
+    def __init__(self):
+        self.__request_times = deque()
+        self.__next_run = 0
+        self.__category_ids = None
+        self.__pages = 0
+
+    def run(self):
+        """Sync the next pages of the listings which are due"""
+        if G.addon_config.catalogue_max_age <= 0 or time.time() < self.__next_run:
+            return
+        self.__pages = 0
+        try:
+            if self.__category_ids is None:
+                # Categories are listed once for all runs of a sync
+                self.__category_ids = self.__get_category_ids()
+            with Catalogue(sync=True) as catalogue:
+                for key in self.__get_keys():
+                    if catalogue.is_deferred(key):
+                        continue
+                    try:
+                        if not self.__sync_listing(catalogue, key):
+                            return
+                    except (ValueError, KeyError, TypeError) as ex:
+                        # A response the catalogue cannot hold fails this listing only, the others are synced meanwhile
+                        delay = catalogue.defer(key, self.__RETRY_DELAY, self.__MAX_RETRY_DELAY)
+                        Logger.warn('Catalogue sync of {} failed, retrying in {} seconds: {}'.format(key, delay, ex))
+                for _type, category_ids in self.__category_ids.items():
+                    if catalogue.merge_listings(_type, category_ids):
+                        Logger.debug('Merged catalogue %s categories', _type)
+                if catalogue.update_trigram_index():
+                    Logger.debug('Rebuilt catalogue trigram index')
+            self.__category_ids = None
+            self.__next_run = time.time() + self.__CHECK_INTERVAL
+        except (IOError, ValueError, KeyError, TypeError, sqlite3.Error) as ex:
+            Logger.warn('Catalogue sync failed, retrying in {} seconds: {}'.format(self.__RETRY_DELAY, ex))
+            self.__category_ids = None
+            self.__next_run = time.time() + self.__RETRY_DELAY
+
+    def __sync_listing(self, catalogue, key):
+        """Sync the next pages of a listing if it is due, returns False when the run stops for the page limit or budget"""
+        age, full_age, page = catalogue.get_sync_state(key)
+        if page == 1 and age is not None and age < G.addon_config.catalogue_max_age / 2:
+            return True
+        incremental = full_age is not None and full_age < G.addon_config.catalogue_full_sync_interval and Catalogue.is_incremental(key)
+        done = False
+        while not done:
+            if self.__pages == self.__PAGES_PER_RUN:
+                return False
+            if not self.__acquire_budget():
+                self.__next_run = self.__request_times[0] + 60
+                return False
+            Logger.debug('Syncing catalogue %s page %s', key, page)
+            self.__pages += 1
+            done = catalogue.add_page(key, page, Api.get_ordered_list_page(Catalogue.get_params(key), page), incremental)
+            page += 1
+        return True
+
+    def __get_category_ids(self):
+        """Ids of the categories of each content type, but for All"""
+        return {_type: [str(category['id']) for category in getattr(Api, method)() or [] if str(category['id']) != '*']
+                for _type, method in self.__CATEGORIES.items()}
+
+    def __get_keys(self):
+        """Listing keys of all categories, favorites first as they are the smallest"""
+        keys = [(_type, '', 1) for _type in self.__CATEGORIES]
+        for _type, category_ids in self.__category_ids.items():
+            keys += [(_type, category_id, 0) for category_id in category_ids]
+        return keys
+
+    def __acquire_budget(self):
+        """Limit sync bandwidth to catalogue_pages_per_minute portal pages"""
+        now = time.time()
+        while self.__request_times and self.__request_times[0] < now - 60:
+            self.__request_times.popleft()
+        if len(self.__request_times) >= G.addon_config.catalogue_pages_per_minute:
+            return False
+        self.__request_times.append(now)
+        return True
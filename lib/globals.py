@@ -34,7 +34,30 @@ class AddOnConfig:
     addon_data_path: str = None
     max_page_limit: int = 2
     max_retries: int = 3
+    network_retries: int = 2
+    connect_timeout: int = 5
+    read_timeout: int = 15
+    retry_backoff: float = 0.5
+    retry_backoff_max: float = 4
+    action_deadline: int = 30
+    search_deadline: int = 10
     token_path: str = None
+    pool_size: int = 4
+    max_concurrent_requests: int = 4
+    categories_cache_ttl: int = 24 * 3600
+    genres_cache_ttl: int = 24 * 3600
+    cache_max_entries: int = 50
+    listing_cache_ttl: int = 5 * 60
+    listing_cache_max_entries: int = 20
+    prefetch_depth: int = 1
+    prefetch_pages_per_minute: int = 10
+    token_validity: int = 6 * 3600
+    watchdog_interval: int = 120
+    token_refresh_margin: int = 15 * 60
+    trace_requests: bool = False
+    catalogue_max_age: int = 24 * 3600
+    catalogue_pages_per_minute: int = 120
+    catalogue_full_sync_interval: int = 7 * 24 * 3600
 
 
 class GlobalVariables:
@@ -48,7 +71,7 @@ class GlobalVariables:
         self.portal_config = PortalConfig()
 
     def init_globals(self):
-        """Init global settings"""
+        """Init global settings, the settings are read again on every call as they may have changed since"""
         self.__is_addd_on_first_run = self.__is_addd_on_first_run is None
         self.addon_config.url = sys.argv[0]
         if self.__is_addd_on_first_run:
@@ -62,16 +85,45 @@ class GlobalVariables:
             if not xbmcvfs.exists(token_path):
                 xbmcvfs.mkdirs(token_path)
             self.addon_config.token_path = token_path
-            self.addon_config.handle = int(sys.argv[1])
-
-            # Init Portal settings
-            self.portal_config.mac_cookie = 'mac=' + self.__addon.getSetting('mac_address')
-            self.portal_config.device_id = self.__addon.getSetting('device_id')
-            self.portal_config.device_id_2 = self.__addon.getSetting('device_id_2')
-            self.portal_config.signature = self.__addon.getSetting('signature')
-            self.portal_config.serial_number = self.__addon.getSetting('serial_number')
-            self.portal_config.alternative_context_path = self.__addon.getSetting('alternative_context_path') == 'true'
-            self.__set_portal_addresses()
+            self.addon_config.handle = int(sys.argv[1]) if len(sys.argv) > 1 else -1
+        else:
+            # The interpreter is reused, an Addon instance only reads the settings once
+            self.__addon = xbmcaddon.Addon()
+        self.__load_settings()
+
+    def __load_settings(self):
+        """Load portal and performance settings"""
+        # Init Portal settings
+        self.portal_config.mac_cookie = 'mac=' + self.__addon.getSetting('mac_address')
+        self.portal_config.device_id = self.__addon.getSetting('device_id')
+        self.portal_config.device_id_2 = self.__addon.getSetting('device_id_2')
+        self.portal_config.signature = self.__addon.getSetting('signature')
+        self.portal_config.serial_number = self.__addon.getSetting('serial_number')
+        self.portal_config.alternative_context_path = self.__addon.getSetting('alternative_context_path') == 'true'
+        self.__set_portal_addresses()
+
+        # Init performance settings
+        self.addon_config.pool_size = self.__get_int_setting('connection_pool_size', AddOnConfig.pool_size)
+        self.addon_config.max_concurrent_requests = self.__get_int_setting('max_concurrent_requests', AddOnConfig.max_concurrent_requests)
+        self.addon_config.connect_timeout = self.__get_int_setting('connect_timeout', AddOnConfig.connect_timeout)
+        self.addon_config.read_timeout = self.__get_int_setting('read_timeout', AddOnConfig.read_timeout)
+        self.addon_config.network_retries = self.__get_int_setting('network_retries', AddOnConfig.network_retries)
+        self.addon_config.action_deadline = self.__get_int_setting('action_deadline', AddOnConfig.action_deadline)
+        self.addon_config.search_deadline = self.__get_int_setting('search_deadline', AddOnConfig.search_deadline)
+        self.addon_config.categories_cache_ttl = self.__get_int_setting('categories_cache_hours', 24) * 3600
+        self.addon_config.genres_cache_ttl = self.__get_int_setting('genres_cache_hours', 24) * 3600
+        self.addon_config.listing_cache_ttl = self.__get_int_setting('listing_cache_minutes', 5) * 60
+        self.addon_config.prefetch_depth = self.__get_int_setting('prefetch_depth', AddOnConfig.prefetch_depth)
+        self.addon_config.prefetch_pages_per_minute = self.__get_int_setting('prefetch_pages_per_minute', AddOnConfig.prefetch_pages_per_minute)
+        self.addon_config.trace_requests = self.__addon.getSetting('trace_requests') == 'true'
+        self.addon_config.catalogue_max_age = self.__get_int_setting('catalogue_hours', 24) * 3600
+        self.addon_config.catalogue_pages_per_minute = self.__get_int_setting('catalogue_pages_per_minute', AddOnConfig.catalogue_pages_per_minute)
+        self.addon_config.catalogue_full_sync_interval = self.__get_int_setting('catalogue_full_sync_days', 7) * 24 * 3600
+
+    def __get_int_setting(self, setting_id, default):
+        """Get integer setting, falls back to default when unset or invalid"""
+        value = self.__addon.getSetting(setting_id)
+        return int(value) if value and value.isnumeric() else default
 
     def get_handle(self):
         """Get addon handle"""
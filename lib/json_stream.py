@@ -0,0 +1,141 @@
+"""Incremental parsing of portal listing responses"""
+from __future__ import absolute_import, division, unicode_literals
+import json
+import codecs
+
+
+class ListingStream:
+    """
+    Parses a {"js": {..., "data": [...]}} response body as its chunks arrive
+
+    Items of js.data are decoded one at a time, so a huge listing is never held as one body. The other
+    js fields are collected in fields, those following data only once all items were read.
+    """
+
+    __WHITESPACE = ' \t\n\r'
+    __NUMBER_CONTINUATIONS = '.eE+-'
+
+    def __init__(self, chunks):
+        self.fields = {}
+        self.__chunks = iter(chunks)
+        self.__text_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.__json_decoder = json.JSONDecoder()
+        self.__buffer = ''
+        self.__pos = 0
+        self.__eof = False
+        # start, data when positioned in the data array, done
+        self.__state = 'start'
+
+    def get_head(self, length=64):
+        """Start of the body, without consuming it"""
+        while len(self.__buffer) - self.__pos < length and self.__fill():
+            pass
+        return self.__buffer[self.__pos:self.__pos + length]
+
+    def read_fields(self):
+        """Read up to the data array, returns the js fields found before it"""
+        if self.__state != 'start':
+            return self.fields
+        self.__expect('{')
+        while True:
+            key = self.__decode()
+            self.__expect(':')
+            if key == 'js' and self.__peek() == '{':
+                self.__pos += 1
+                if self.__read_js_fields():
+                    self.__state = 'data'
+                    return self.fields
+                break
+            self.__decode()
+            if self.__next_member() == '}':
+                raise ValueError('Response has no js object')
+        self.__state = 'done'
+        return self.fields
+
+    def iter_data(self):
+        """Yield the items of js.data, then read the js fields following it"""
+        self.read_fields()
+        if self.__state != 'data':
+            return
+        if self.__peek() == ']':
+            self.__pos += 1
+        else:
+            while True:
+                yield self.__decode()
+                if self.__next_member(']') == ']':
+                    break
+        self.__state = 'done'
+        if self.__next_member() == ',':
+            self.__read_js_fields()
+        # Read what follows js to the end of the body, the connection is then released and the size of the call recorded
+        while self.__fill():
+            self.__pos = len(self.__buffer)
+
+    def __read_js_fields(self):
+        """Read js members into fields, True when stopped at the start of the data array"""
+        if self.__peek() == '}':
+            self.__pos += 1
+            return False
+        while True:
+            key = self.__decode()
+            self.__expect(':')
+            if key == 'data' and self.__peek() == '[' and self.__state == 'start':
+                self.__pos += 1
+                return True
+            self.fields[key] = self.__decode()
+            if self.__next_member() == '}':
+                return False
+
+    def __next_member(self, end='}'):
+        """Consume the separator after a value, returns ',' or the closing character"""
+        char = self.__peek()
+        if char not in (',', end):
+            raise ValueError('Expected , or {} at offset {}'.format(end, self.__pos))
+        self.__pos += 1
+        return char
+
+    def __expect(self, char):
+        """Consume char"""
+        if self.__peek() != char:
+            raise ValueError('Expected {} at offset {}'.format(char, self.__pos))
+        self.__pos += 1
+
+    def __peek(self):
+        """Next character after whitespace, empty at the end of the body"""
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos] in self.__WHITESPACE:
+                self.__pos += 1
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self.__fill():
+                return ''
+
+    def __decode(self):
+        """Decode the JSON value at the current position"""
+        self.__peek()
+        while True:
+            try:
+                value, end = self.__json_decoder.raw_decode(self.__buffer, self.__pos)
+                # A number ending with the buffer, or where its fraction or exponent starts, may continue in the next chunk
+                if self.__eof or (end < len(self.__buffer) and self.__buffer[end] not in self.__NUMBER_CONTINUATIONS):
+                    self.__pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.__eof:
+                    raise
+            self.__fill()
+
+    def __fill(self):
+        """Append the next chunk to the buffer, False at the end of the body"""
+        if self.__eof:
+            return False
+        chunk = next(self.__chunks, None)
+        if chunk is None:
+            self.__eof = True
+            text = self.__text_decoder.decode(b'', final=True)
+        else:
+            text = self.__text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        # Drop what was consumed, the buffer only holds the item being decoded
+        self.__buffer = self.__buffer[self.__pos:] + text
+        self.__pos = 0
+        return chunk is not None or text != ''
@@ -1,34 +1,80 @@
 """Logger class"""
 from __future__ import absolute_import, division, unicode_literals
+import json
+import time
 import xbmc
 import xbmcaddon
 
-__addon__ = xbmcaddon.Addon()
-
 
 class Logger:
-    """Logger class"""
+    """
+    Logger class
+
+    Messages take deferred %-style arguments, they are only formatted when the message is logged.
+    Debug messages are dropped before formatting unless debug logging is enabled in Kodi.
+    """
+
+    # Seconds the Kodi debug logging setting is cached for, the service lives across toggles
+    __DEBUG_CHECK_INTERVAL = 60
+    __addon_id = None
+    __debug_enabled = None
+    __debug_checked_at = 0
+
+    @staticmethod
+    def get_addon_id():
+        """Addon id, looked up once"""
+        if Logger.__addon_id is None:
+            Logger.__addon_id = xbmcaddon.Addon().getAddonInfo('id')
+        return Logger.__addon_id
+
+    @staticmethod
+    def is_debug_enabled():
+        """Whether Kodi debug logging is on, checked at most once per interval"""
+        now = time.time()
+        if Logger.__debug_enabled is None or now - Logger.__debug_checked_at > Logger.__DEBUG_CHECK_INTERVAL:
+            Logger.__debug_enabled = Logger.__get_debug_setting()
+            Logger.__debug_checked_at = now
+        return Logger.__debug_enabled
+
+    @staticmethod
+    def reset():
+        """Forget the cached debug logging setting"""
+        Logger.__debug_enabled = None
+
+    @staticmethod
+    def __get_debug_setting():
+        """Kodi debug logging setting, enabled when it cannot be read"""
+        request = {'jsonrpc': '2.0', 'method': 'Settings.GetSettingValue', 'params': {'setting': 'debug.showloginfo'}, 'id': 1}
+        try:
+            return bool(json.loads(xbmc.executeJSONRPC(json.dumps(request)))['result']['value'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return True
+
     @staticmethod
-    def log(message, level=xbmc.LOGDEBUG):
-        """Generic log method defaults to debug"""
-        xbmc.log('{0}: {1}'.format(__addon__.getAddonInfo('id'), message), level)
+    def log(message, level=xbmc.LOGDEBUG, args=()):
+        """Generic log method defaults to debug, args are %-formatted into the message"""
+        if args:
+            # A single mapping fills %(name)s fields, as in the logging module
+            message = message % (args[0] if len(args) == 1 and isinstance(args[0], dict) else args)
+        xbmc.log('{0}: {1}'.format(Logger.get_addon_id(), message), level)
 
     @staticmethod
-    def info(message):
+    def info(message, *args):
         """Info log method"""
-        Logger.log(message, xbmc.LOGINFO)
+        Logger.log(message, xbmc.LOGINFO, args)
 
     @staticmethod
-    def error(message):
+    def error(message, *args):
         """Error log method"""
-        Logger.log(message, xbmc.LOGERROR)
+        Logger.log(message, xbmc.LOGERROR, args)
 
     @staticmethod
-    def warn(message):
+    def warn(message, *args):
         """Warn log method"""
-        Logger.log(message, xbmc.LOGWARNING)
+        Logger.log(message, xbmc.LOGWARNING, args)
 
     @staticmethod
-    def debug(message):
-        """Debug log method"""
-        Logger.log(message, xbmc.LOGDEBUG)
+    def debug(message, *args):
+        """Debug log method, a no-op while debug logging is off"""
+        if Logger.is_debug_enabled():
+            Logger.log(message, xbmc.LOGDEBUG, args)
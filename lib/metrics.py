@@ -0,0 +1,115 @@
+"""Per invocation portal call metrics"""
+from __future__ import absolute_import, division, unicode_literals
+import os
+import json
+import time
+import threading
+import weakref
+from collections import deque, Counter
+from .globals import G
+from .loggers import Logger
+
+
+class Metrics:
+    """Collects portal calls and counters of one plugin invocation"""
+
+    __TRACE_FILE = 'trace.jsonl'
+    __MAX_CALLS = 1000
+    __lock = threading.Lock()
+    # Bounded, the background service never finishes an invocation
+    __calls = deque(maxlen=__MAX_CALLS)
+    __counters = Counter()
+    __started = time.time()
+    # Calls of streamed responses, their sizes are known once the body was read
+    __streamed_calls = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def start():
+        """Start collecting for a new invocation"""
+        with Metrics.__lock:
+            Metrics.__calls.clear()
+            Metrics.__counters.clear()
+            Metrics.__started = time.time()
+
+    @staticmethod
+    def record_call(params, latency, response, retries, streamed=False):
+        """Record a portal call, response is None when it failed"""
+        size, transferred = Metrics.__get_sizes(response, streamed)
+        call = {'type': params.get('type', ''), 'action': params.get('action', ''), 'p': params.get('p'),
+                'latency_ms': round(latency * 1000, 1), 'retries': retries,
+                'status': response.status_code if response is not None else None,
+                'bytes': size, 'transferred': transferred,
+                'encoding': response.headers.get('Content-Encoding', 'identity') if response is not None else None}
+        Logger.debug('Portal call %(type)s/%(action)s p=%(p)s: status %(status)s in %(latency_ms)s ms, %(bytes)s bytes, '
+                     '%(transferred)s transferred as %(encoding)s, %(retries)s retries', call)
+        with Metrics.__lock:
+            Metrics.__calls.append(call)
+            if streamed and response is not None:
+                Metrics.__streamed_calls[response] = call
+
+    @staticmethod
+    def iter_content(response, chunk_size):
+        """Yield the decoded chunks of a streamed response, the sizes of its call are recorded once all were read"""
+        size = 0
+        for chunk in response.iter_content(chunk_size):
+            size += len(chunk)
+            yield chunk
+        with Metrics.__lock:
+            call = Metrics.__streamed_calls.pop(response, None)
+            if call is not None:
+                call['bytes'], call['transferred'] = size, Metrics.__get_transferred(response, size)
+        if call is not None:
+            Logger.debug('Portal call %(type)s/%(action)s p=%(p)s: streamed %(bytes)s bytes, %(transferred)s transferred', call)
+
+    @staticmethod
+    def __get_sizes(response, streamed):
+        """Decoded body bytes and bytes transferred, zero for a streamed body still to be read"""
+        if response is None or streamed:
+            return 0, 0
+        size = len(response.content)
+        return size, Metrics.__get_transferred(response, size)
+
+    @staticmethod
+    def __get_transferred(response, size):
+        """Bytes urllib3 read from the connection, before decoding the content encoding"""
+        try:
+            return int(response.raw.tell())
+        except (AttributeError, TypeError, ValueError):
+            return size
+
+    @staticmethod
+    def increment(counter):
+        """Increment a counter: cache_hit, cache_miss, handshake, revalidation or auth_retry"""
+        with Metrics.__lock:
+            Metrics.__counters[counter] += 1
+
+    @staticmethod
+    def get_summary():
+        """One line summary of the invocation"""
+        with Metrics.__lock:
+            calls = list(Metrics.__calls)
+            counters = Metrics.__counters.copy()
+            elapsed = (time.time() - Metrics.__started) * 1000
+        summary = '{} portal calls in {:.0f} ms, {} bytes ({} transferred), {} retries; cache {} hits, {} misses; {} handshakes, {} revalidations, {} auth retries; total {:.0f} ms'.format(
+            len(calls), sum(call['latency_ms'] for call in calls), sum(call['bytes'] for call in calls),
+            sum(call['transferred'] for call in calls), sum(call['retries'] for call in calls),
+            counters['cache_hit'], counters['cache_miss'], counters['handshake'], counters['revalidation'], counters['auth_retry'], elapsed)
+        if calls:
+            slowest = max(calls, key=lambda call: call['latency_ms'])
+            summary += '; slowest {type}/{action} {latency_ms:.0f} ms'.format(**slowest)
+        return summary
+
+    @staticmethod
+    def finish(invocation):
+        """Log the summary and append the calls to the trace file when enabled"""
+        Logger.info('{}: {}'.format(invocation, Metrics.get_summary()))
+        if not G.addon_config.trace_requests:
+            return
+        with Metrics.__lock:
+            records = [dict(call, invocation=invocation, started=Metrics.__started) for call in Metrics.__calls]
+            records.append({'invocation': invocation, 'started': Metrics.__started, 'summary': True, **Metrics.__counters})
+        try:
+            with open(os.path.join(G.addon_config.token_path, Metrics.__TRACE_FILE), 'a') as f:
+                f.writelines(json.dumps(record) + '\n' for record in records)
+        except IOError as ex:
+            Logger.warn('Could not write trace: {}'.format(ex))
@@ -0,0 +1,77 @@
+"""Listing items normalised from portal records"""
+from __future__ import absolute_import, division, unicode_literals
+from .globals import G
+from .utils import get_int_value
+
+
+def get_poster_url(record):
+    """Screenshot url of a record, relative urls resolve against the portal, None without screenshot"""
+    screenshot_uri = record.get('screenshot_uri')
+    if not isinstance(screenshot_uri, str):
+        return None
+    if screenshot_uri.startswith('http'):
+        return screenshot_uri
+    return G.portal_config.portal_base_url + screenshot_uri
+
+
+class VideoItem:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """Fields of VOD and series records shown in Kodi"""
+
+    __slots__ = ('id', 'name', 'hd', 'fav', 'poster_url', 'country', 'director', 'description', 'actors', 'last_played', 'added', 'year')
+
+    def __init__(self, record):
+        self.id = record['id']  # pylint: disable=invalid-name
+        self.name = record['name']
+        self.hd = record.get('hd', 1) == 1  # pylint: disable=invalid-name
+        self.fav = record.get('fav', 0) == 1
+        self.poster_url = get_poster_url(record)
+        self.country = record.get('country')
+        self.director = record.get('director', '')
+        self.description = record.get('description', '')
+        self.actors = tuple(actor for actor in record.get('actors', '').split(',') if actor)
+        self.last_played = record.get('last_played')
+        self.added = record.get('added')
+        self.year = get_int_value(record, 'year')
+
+    @classmethod
+    def from_response(cls, response):
+        """Items of the data of a listing response, built as the data is iterated"""
+        return (cls(record) for record in response['data'])
+
+
+class SeriesItem(VideoItem):  # pylint: disable=too-few-public-methods
+    """Series of a series listing"""
+
+    __slots__ = ()
+
+
+class VodItem(VideoItem):  # pylint: disable=too-few-public-methods
+    """Video of a VOD listing, series listed as VOD carry their episode numbers"""
+
+    __slots__ = ('series', 'cmd', 'duration')
+
+    def __init__(self, record):
+        super().__init__(record)
+        self.series = record.get('series') or []
+        self.cmd = record.get('cmd', '')
+        self.duration = get_int_value(record, 'time')
+
+
+class Channel:  # pylint: disable=too-few-public-methods
+    """TV channel of a listing"""
+
+    __slots__ = ('id', 'name', 'fav', 'logo', 'cmd', 'use_http_tmp_link', 'use_load_balancing')
+
+    def __init__(self, record):
+        self.id = record['id']  # pylint: disable=invalid-name
+        self.name = record['name']
+        self.fav = record.get('fav', 0) == 1
+        self.logo = record.get('logo')
+        self.cmd = record['cmd']
+        self.use_http_tmp_link = record.get('use_http_tmp_link', 0)
+        self.use_load_balancing = record.get('use_load_balancing', 0)
+
+    @classmethod
+    def from_response(cls, response):
+        """Channels of the data of a listing response, built as the data is iterated"""
+        return (cls(record) for record in response['data'])
@@ -0,0 +1,36 @@
+"""Plugin url templates for listings"""
+from __future__ import absolute_import, division, unicode_literals
+from urllib.parse import urlencode, quote_plus
+from .globals import G
+
+
+class PluginUrl:
+    """
+    Plugin url of one kind of listing item
+
+    The plugin base url and static params are encoded once, build only encodes the params marked as FIELD.
+    Params keep their order, so urls are the same as G.get_plugin_url builds for the same dict.
+    """
+
+    FIELD = object()
+
+    def __init__(self, params):
+        self.__chunks = []
+        chunk = G.addon_config.url + '?'
+        separator = ''
+        for key, value in params.items():
+            chunk += separator
+            separator = '&'
+            if value is PluginUrl.FIELD:
+                self.__chunks.append(chunk + quote_plus(key) + '=')
+                chunk = ''
+            else:
+                chunk += urlencode({key: value})
+        self.__tail = chunk
+        self.__fields = len(self.__chunks)
+
+    def build(self, *values):
+        """Url with the values of the FIELD params in template order"""
+        if len(values) != self.__fields:
+            raise ValueError('Expected {} values, got {}'.format(self.__fields, len(values)))
+        return ''.join([chunk + quote_plus(str(value)) for chunk, value in zip(self.__chunks, values)]) + self.__tail
@@ -0,0 +1,77 @@
+"""Background prefetch of listing pages"""
+from __future__ import absolute_import, division, unicode_literals
+import json
+import time
+from collections import deque
+import xbmcgui
+from .globals import G
+from .api import Api
+from .loggers import Logger
+
+
+class Prefetcher:
+    """Warms the listing cache with the page blocks following the last opened listing"""
+
+    __PROPERTY = 'plugin.video.stalkervod.last_listing'
+    __HOME_WINDOW_ID = 10000
+    __FETCHERS = {
+        'vod_listing': lambda params: Api.get_videos(params['category_id'], params['page'], params.get('search_term', ''), params.get('fav', 0)),
+        'series_listing': lambda params: Api.get_series(params['category_id'], params['page'], params.get('search_term', ''), params.get('fav', 0)),
+        'tv_listing': lambda params: Api.get_tv_channels(params['category_id'], params['page'], params.get('search_term', ''), params.get('fav', 0)),
+        'vod_favorites': lambda params: Api.get_vod_favorites(params['page']),
+        'series_favorites': lambda params: Api.get_series_favorites(params['page']),
+        'tv_favorites': lambda params: Api.get_tv_favorites(params['page'])
+    }
+
+    def __init__(self):
+        self.__last_listing = None
+        self.__request_times = deque()
+
+    @staticmethod
+    def publish(params, total_pages):
+        """Publish the listing opened by the plugin to the background service"""
+        if params.get('action') not in Prefetcher.__FETCHERS:
+            return
+        xbmcgui.Window(Prefetcher.__HOME_WINDOW_ID).setProperty(  # pylint: disable=no-member
+            Prefetcher.__PROPERTY, json.dumps({'params': params, 'total_pages': total_pages}))
+
+    @staticmethod
+    def get_next_page(page, total_pages, page_limit):
+        """Next page block as linked by the Next Page item, wraps to the first page"""
+        return 1 if page == total_pages - page_limit + 1 else page + page_limit
+
+    def run(self):
+        """Prefetch page blocks after the last published listing"""
+        if G.addon_config.prefetch_depth <= 0 or G.addon_config.listing_cache_ttl <= 0:
+            return
+        value = xbmcgui.Window(Prefetcher.__HOME_WINDOW_ID).getProperty(Prefetcher.__PROPERTY)  # pylint: disable=no-member
+        if not value or value == self.__last_listing:
+            return
+        listing = json.loads(value)
+        params = listing['params']
+        page_limit = G.addon_config.max_page_limit
+        page = int(params['page'])
+        for _ in range(G.addon_config.prefetch_depth):
+            page = self.get_next_page(page, listing['total_pages'], page_limit)
+            if page == int(params['page']):
+                break
+            if not self.__acquire_budget(page_limit):
+                Logger.debug('Prefetch budget exhausted, retrying later')
+                return
+            Logger.debug('Prefetching %s page %s', params['action'], page)
+            try:
+                self.__FETCHERS[params['action']](dict(params, page=page))
+            except Exception as ex:  # pylint: disable=broad-except
+                Logger.warn('Prefetch of {} page {} failed: {}'.format(params['action'], page, ex))
+                break
+        self.__last_listing = value
+
+    def __acquire_budget(self, pages):
+        """Limit prefetch bandwidth to prefetch_pages_per_minute portal pages"""
+        now = time.time()
+        while self.__request_times and self.__request_times[0] < now - 60:
+            self.__request_times.popleft()
+        if len(self.__request_times) + pages > max(pages, G.addon_config.prefetch_pages_per_minute):
+            return False
+        self.__request_times.extend([now] * pages)
+        return True
@@ -3,31 +3,83 @@
 
 from __future__ import absolute_import, division, unicode_literals
 
+import time
 from urllib.parse import urlsplit, parse_qsl, urlencode
 import xbmc
 from xbmc import Monitor, Player, getInfoLabel
+from .auth import Auth
+from .globals import G
 from .loggers import Logger
+from .prefetch import Prefetcher
+from .session import PortalSession
+from .catalogue_sync import CatalogueSync
 from .utils import get_int_value, get_next_info_and_send_signal
 
 
 class BackgroundService(Monitor):
     """ Background service code """
 
+    __TICK = 1
+
     def __init__(self):
         Monitor.__init__(self)
         self._player = PlayerMonitor()
+        self.__settings_changed = False
+
+    def onSettingsChanged(self):  # pylint: disable=invalid-name
+        """ Will be called when the addon settings changed, they are reloaded by the background loop """
+        self.__settings_changed = True
 
     def run(self):
         """ Background loop for maintenance tasks """
         Logger.debug('Service started')
+        G.init_globals()
+        prefetcher = Prefetcher()
+        catalogue_sync = CatalogueSync()
+        # Refresh the token right away, it may have expired while Kodi was not running
+        next_keep_alive = time.time()
 
         while not self.abortRequested():
             # Stop when abort requested
-            if self.waitForAbort(10):
+            if self.waitForAbort(self.__TICK):
                 break
+            if self.__settings_changed:
+                # Another portal or MAC gets a token and a catalogue of its own, the tasks start over with it
+                Logger.debug('Settings changed, reloading')
+                self.__settings_changed = False
+                G.init_globals()
+                PortalSession.close()
+                prefetcher = Prefetcher()
+                catalogue_sync = CatalogueSync()
+                next_keep_alive = time.time()
+            if time.time() >= next_keep_alive:
+                next_keep_alive = time.time() + G.addon_config.watchdog_interval
+                self.__run_task('Keep alive', self.__keep_alive)
+            # Keep the bandwidth for the stream while playing
+            if not self._player.isPlaying():
+                self.__run_task('Prefetch', prefetcher.run)
+                self.__run_task('Catalogue sync', catalogue_sync.run)
 
         Logger.debug('Service stopped')
 
+    @staticmethod
+    def __run_task(name, task):
+        """ Run a maintenance task, an error it did not expect is logged and the service carries on """
+        try:
+            task()
+        except Exception as ex:  # pylint: disable=broad-except
+            Logger.error('{} failed: {!r}'.format(name, ex))
+
+    @staticmethod
+    def __keep_alive():
+        """ Keep the cached token valid and its portal session alive, plugin invocations then never need a handshake """
+        try:
+            auth = Auth()
+            auth.refresh_ahead(G.addon_config.token_refresh_margin)
+            auth.send_watchdog()
+        except (IOError, ValueError, KeyError) as ex:
+            Logger.warn('Keep alive failed: {}'.format(ex))
+
 
 class PlayerMonitor(Player):
     """ A custom Player object to check subtitles """
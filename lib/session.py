@@ -0,0 +1,114 @@
+"""Shared HTTP session for portal calls"""
+from __future__ import absolute_import, division, unicode_literals
+import time
+import random
+import threading
+from .globals import G
+from .loggers import Logger
+from .metrics import Metrics
+
+
+class PortalSession:
+    """
+    Keep-alive connection pool shared by Api and Auth
+
+    requests is imported on the first portal call, it is the largest share of the plugin start up time
+    and routes which make no portal call do not need it.
+    """
+
+    __RETRY_STATUS_CODES = (500, 502, 503, 504)
+    # Most compact first, only those urllib3 can decode here are offered
+    __ENCODINGS = ('zstd', 'br', 'gzip', 'deflate')
+    __session = None
+    __lock = threading.Lock()
+    __deadline = None
+
+    @staticmethod
+    def get_session():
+        """Get the shared session, created on first use"""
+        if PortalSession.__session is None:
+            with PortalSession.__lock:
+                if PortalSession.__session is None:
+                    import requests  # pylint: disable=import-outside-toplevel
+                    from requests.adapters import HTTPAdapter  # pylint: disable=import-outside-toplevel
+                    pool_size = max(1, int(G.addon_config.pool_size))
+                    Logger.debug('Creating portal session with pool size %s', pool_size)
+                    session = requests.Session()
+                    session.headers['Accept-Encoding'] = PortalSession.get_accept_encoding()
+                    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    PortalSession.__session = session
+        return PortalSession.__session
+
+    @staticmethod
+    def get_accept_encoding():
+        """Accept-Encoding offering the content encodings urllib3 can decode, brotli and zstd need optional modules"""
+        from urllib3.util import make_headers  # pylint: disable=import-outside-toplevel
+        available = make_headers(accept_encoding=True)['accept-encoding'].split(',')
+        return ', '.join(encoding for encoding in PortalSession.__ENCODINGS if encoding in available)
+
+    @staticmethod
+    def set_deadline(seconds):
+        """Limit the time all portal calls of a user action may take, None for no limit"""
+        PortalSession.__deadline = None if seconds is None else time.monotonic() + seconds
+
+    @staticmethod
+    def get(url, headers, params, timeout=None, stream=False):
+        """Send GET request over the pooled session, transient failures are retried with exponential backoff.
+        Without timeout the configured connect and read timeouts are used, with stream the body is left to be read"""
+        from requests.exceptions import ChunkedEncodingError, ConnectionError as ConnectError, Timeout  # pylint: disable=import-outside-toplevel
+        start = time.perf_counter()
+        attempt = 0
+        response = None
+        try:
+            while True:
+                attempt_timeout = timeout or PortalSession.__get_timeout()
+                try:
+                    response = PortalSession.get_session().get(url=url, headers=headers, params=params, timeout=attempt_timeout, stream=stream)
+                    if response.status_code not in PortalSession.__RETRY_STATUS_CODES:
+                        return response
+                    error = 'HTTP {}'.format(response.status_code)
+                except (ConnectError, Timeout, ChunkedEncodingError) as ex:
+                    response = None
+                    error = ex
+                delay = PortalSession.__get_backoff(attempt)
+                if attempt >= G.addon_config.network_retries or not PortalSession.__has_time_left(delay):
+                    if response is not None:
+                        return response
+                    raise error
+                attempt += 1
+                Logger.warn('Portal call failed ({}), retry {} in {:.2f}s'.format(error, attempt, delay))
+                time.sleep(delay)
+        finally:
+            Metrics.record_call(params, time.perf_counter() - start, response, attempt, stream)
+
+    @staticmethod
+    def close():
+        """Close pooled connections, next call opens a new session"""
+        with PortalSession.__lock:
+            if PortalSession.__session is not None:
+                PortalSession.__session.close()
+                PortalSession.__session = None
+
+    @staticmethod
+    def __get_timeout():
+        """Connect and read timeouts, shortened to the time left before the deadline"""
+        connect_timeout, read_timeout = G.addon_config.connect_timeout, G.addon_config.read_timeout
+        if PortalSession.__deadline is None:
+            return connect_timeout, read_timeout
+        remaining = PortalSession.__deadline - time.monotonic()
+        if remaining <= 0:
+            from requests.exceptions import Timeout  # pylint: disable=import-outside-toplevel
+            raise Timeout('Deadline exceeded')
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    @staticmethod
+    def __get_backoff(attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(G.addon_config.retry_backoff_max, G.addon_config.retry_backoff * 2 ** attempt))
+
+    @staticmethod
+    def __has_time_left(delay):
+        """Whether a retry after delay can still start before the deadline"""
+        return PortalSession.__deadline is None or time.monotonic() + delay < PortalSession.__deadline
@@ -0,0 +1,180 @@
+"""Trigram index of catalogue titles"""
+from __future__ import absolute_import, division, unicode_literals
+import os
+import re
+import struct
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from heapq import nlargest
+
+
+class TrigramIndex:
+    """
+    Titles indexed by their trigrams, matched by similarity to allow for typos and completed from word prefixes
+
+    Words are folded to lower case without diacritics and padded like pg_trgm pads them, two spaces in front and one
+    behind, so the start of a word has trigrams of its own. The postings of all trigrams are slices of one array of
+    title positions and the titles one UTF-8 blob with an array of offsets, an index takes a few bytes per trigram
+    of a title instead of a Python object. It is saved to a file in native byte order and read back whole.
+    """
+
+    __MAGIC = b'TRGM1'
+    # Array typecodes of the sections: ids, trigram counts, title offsets, titles, trigrams, posting offsets, postings
+    __TYPECODES = ('I', 'H', 'I', None, None, 'I', 'I')
+    __THRESHOLD = 0.4
+    __DIACRITICS = re.compile('[\u0300-\u036f]')
+    __WORDS = re.compile(r'\w+')
+
+    def __init__(self, ids, sizes, title_offsets, titles, trigrams, offsets, postings):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.__ids = ids
+        self.__sizes = sizes
+        self.__title_offsets = title_offsets
+        self.__titles = titles
+        self.__trigrams = {trigram: index for index, trigram in enumerate(trigrams)}
+        self.__offsets = offsets
+        self.__postings = postings
+        self.__view = memoryview(postings)
+
+    def __len__(self):
+        return len(self.__ids)
+
+    @staticmethod
+    def build(titles):
+        """Index of (id, title) pairs, ids are unsigned 32 bit integers"""
+        ids = array('I')
+        sizes = array('H')
+        title_offsets = array('I', [0])
+        blob = bytearray()
+        postings = {}
+        for position, (_id, title) in enumerate(titles):
+            trigrams = TrigramIndex.get_trigrams(title)
+            ids.append(_id)
+            sizes.append(min(len(trigrams), 0xFFFF))
+            blob += title.encode('utf-8')
+            title_offsets.append(len(blob))
+            for trigram in trigrams:
+                posting = postings.get(trigram)
+                if posting is None:
+                    posting = postings[trigram] = array('I')
+                posting.append(position)
+        trigrams = sorted(postings)
+        offsets = array('I', [0])
+        merged = array('I')
+        for trigram in trigrams:
+            merged.extend(postings[trigram])
+            offsets.append(len(merged))
+        return TrigramIndex(ids, sizes, title_offsets, bytes(blob), trigrams, offsets, merged)
+
+    @staticmethod
+    def get_words(text):
+        """Words of text in lower case without diacritics"""
+        return TrigramIndex.__WORDS.findall(TrigramIndex.__DIACRITICS.sub('', unicodedata.normalize('NFKD', text.casefold())))
+
+    @staticmethod
+    def get_trigrams(text, prefixes=False):
+        """Trigrams of the padded words of text, with prefixes words are not padded behind as they may continue"""
+        trigrams = set()
+        for word in TrigramIndex.get_words(text):
+            padded = '  ' + word if prefixes else '  ' + word + ' '
+            trigrams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+        return trigrams
+
+    def search(self, text, limit):
+        """
+        (id, score) of the limit titles most similar to text, best first
+
+        The score is the share of the trigrams of text found in the title, titles scoring below 0.4 do not match.
+        Equal scores go to the title most similar as a whole, the one with the fewest other trigrams.
+        """
+        trigrams = self.get_trigrams(text)
+        counts = Counter()
+        for trigram in trigrams:
+            counts.update(self.__get_postings(trigram))
+        minimum = self.__THRESHOLD * len(trigrams)
+        matches = ((shared / len(trigrams), shared / (len(trigrams) + self.__sizes[position] - shared), -position)
+                   for position, shared in counts.items() if shared >= minimum)
+        return [(self.__ids[-position], score) for score, _, position in nlargest(limit, matches)]
+
+    def complete(self, text, limit):
+        """(id, title) of the limit shortest titles with a word starting with each word of text"""
+        words = self.get_words(text)
+        postings = sorted((self.__get_postings(trigram) for trigram in self.get_trigrams(text, prefixes=True)), key=len)
+        if not postings:
+            return []
+        # Titles with all trigrams of the prefixes, which may still be found in other words or out of order
+        positions = [position for position in postings[0] if all(self.__contains(posting, position) for posting in postings[1:])]
+        positions.sort(key=lambda position: self.__title_offsets[position + 1] - self.__title_offsets[position])
+        completions = []
+        for position in positions:
+            title = self.get_title(position)
+            title_words = self.get_words(title)
+            if all(any(title_word.startswith(word) for title_word in title_words) for word in words):
+                completions.append((self.__ids[position], title))
+                if len(completions) == limit:
+                    break
+        return completions
+
+    def get_title(self, position):
+        """Title at a position of the index"""
+        return self.__titles[self.__title_offsets[position]:self.__title_offsets[position + 1]].decode('utf-8')
+
+    def save(self, path):
+        """Write the index to path, an index being read is replaced whole"""
+        sections = (self.__ids, self.__sizes, self.__title_offsets, self.__titles, '\n'.join(self.__trigrams).encode('utf-8'),
+                    self.__offsets, self.__postings)
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(self.__MAGIC)
+                for section in sections:
+                    data = section.tobytes() if isinstance(section, array) else section
+                    f.write(struct.pack('<Q', len(data)))
+                    f.write(data)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def load(path):
+        """Read an index written by save, raises ValueError when the file holds none"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(TrigramIndex.__MAGIC):
+            raise ValueError('Not a trigram index: {}'.format(path))
+        sections = []
+        offset = len(TrigramIndex.__MAGIC)
+        for _ in TrigramIndex.__TYPECODES:
+            if offset + 8 > len(data):
+                raise ValueError('Truncated trigram index: {}'.format(path))
+            size = struct.unpack_from('<Q', data, offset)[0]
+            sections.append(data[offset + 8:offset + 8 + size])
+            offset += 8 + size
+        if offset != len(data):
+            raise ValueError('Truncated trigram index: {}'.format(path))
+        values = [TrigramIndex.__get_array(typecode, section) if typecode else section for typecode, section in zip(TrigramIndex.__TYPECODES, sections)]
+        values[4] = values[4].decode('utf-8').split('\n') if values[4] else []
+        return TrigramIndex(*values)
+
+    def __get_postings(self, trigram):
+        """Ascending positions of the titles with the trigram"""
+        index = self.__trigrams.get(trigram)
+        if index is None:
+            return ()
+        return self.__view[self.__offsets[index]:self.__offsets[index + 1]]
+
+    @staticmethod
+    def __contains(posting, position):
+        """Whether the ascending posting holds position"""
+        index = bisect_left(posting, position)
+        return index < len(posting) and posting[index] == position
+
+    @staticmethod
+    def __get_array(typecode, data):
+        """Array of the bytes of a section"""
+        values = array(typecode)
+        values.frombytes(data)
+        return values
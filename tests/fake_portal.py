@@ -0,0 +1,348 @@
+"""
+Local Stalker portal emulator for integration tests and benchmarks
+
+Serves load.php and portal.php offline. The fixtures in tests/responses are the seed data: without a
+catalogue size they are served as they are, with one every listing holds catalogue_size generated items
+built from the fixture items and paged by page_size.
+
+Usage: python -m tests.fake_portal [--port 8080] [--catalogue-size 1000] [--latency 50] [--jitter 20] [--gzip]
+"""
+import os
+import copy
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSES_DIR = os.path.join(os.path.dirname(__file__), 'responses')
+FIXTURES = {
+    ('stb', 'handshake'): 'token.json',
+    ('stb', 'get_profile'): 'profile.json',
+    ('watchdog', 'get_events'): 'events.json',
+    ('vod', 'get_categories'): 'categories.json',
+    ('series', 'get_categories'): 'categories.json',
+    ('itv', 'get_genres'): 'genres.json',
+    ('vod', 'get_ordered_list'): 'videos.json',
+    ('series', 'get_ordered_list'): 'videos.json',
+    ('itv', 'get_all_fav_channels'): 'channels.json',
+    ('itv', 'get_ordered_list'): 'channels.json',
+    ('vod', 'create_link'): 'vod_stream_url.json',
+    ('itv', 'create_link'): 'itv_stream_url.json',
+    ('vod', 'set_fav'): 'add_remove_fav.json',
+    ('vod', 'del_fav'): 'add_remove_fav.json'
+}
+CONTEXT_PATHS = ('/stalker_portal/server/load.php', '/stalker_portal/portal.php')
+AUTHORIZATION_FAILED = b'Authorization failed.'
+
+
+def load_fixture(file_name):
+    """Parsed fixture from tests/responses"""
+    with open(os.path.join(RESPONSES_DIR, file_name), 'r') as f:
+        return json.load(f)
+
+
+class Catalogue:
+    """
+    Generated listing of one content type, items are built on demand so large catalogues stay cheap
+
+    Listings are newest first, as sortby=added lists them. The initial items are numbered from the newest,
+    items added later continue the numbering.
+    """
+
+    __ID_OFFSETS = {'vod': 100000, 'series': 200000, 'itv': 300000}
+    __NAMES = {'vod': 'Movie', 'series': 'Series', 'itv': 'Channel'}
+    __ADDED = 1700000000
+
+    def __init__(self, _type, size):
+        self.type = _type
+        self.size = size
+        self.favorites = set()
+        self.deleted = set()
+        self.__new_items = 0
+        self.__template = load_fixture('channels.json' if _type == 'itv' else 'videos.json')['js']['data'][0]
+
+    def add_items(self, count):
+        """Add count items in front of the listing"""
+        self.__new_items += count
+
+    def get_number(self, index):
+        """Number of the item at a listing index, the initial items keep numbers 0 to size - 1"""
+        if index < self.__new_items:
+            return self.size + self.__new_items - 1 - index
+        return index - self.__new_items
+
+    def get_id(self, number):
+        """Item id"""
+        return str(self.__ID_OFFSETS[self.type] + number)
+
+    def get_name(self, number):
+        """Item name"""
+        return '{} {}'.format(self.__NAMES[self.type], number + 1)
+
+    def get_added(self, number):
+        """Time the item was added, a minute apart and newest first"""
+        minutes = number - self.size + 1 if number >= self.size else -number
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.__ADDED + minutes * 60))
+
+    def get_item(self, number):
+        """Item built from the fixture template"""
+        item = copy.copy(self.__template)
+        item.update({'id': self.get_id(number), 'name': self.get_name(number), 'fav': 1 if self.get_id(number) in self.favorites else 0,
+                     'added': self.get_added(number)})
+        if self.type == 'itv':
+            item['number'] = str(number + 1)
+        else:
+            item['o_name'] = item['name']
+            item['series'] = list(self.__template['series']) if self.type == 'series' else []
+        return item
+
+    def get_seasons(self, movie_id, count=3):
+        """Seasons of a series"""
+        seasons = []
+        for season in range(1, count + 1):
+            item = copy.copy(self.__template)
+            item.update({'id': '{}:{}'.format(movie_id, season), 'name': 'Season {}'.format(season), 'series': list(self.__template['series'])})
+            seasons.append(item)
+        return {'total_items': str(count), 'max_page_items': count, 'selected_item': 0, 'cur_page': 0, 'data': seasons}
+
+    def get_page(self, params, page_size):
+        """Page of get_ordered_list honouring search, fav and p"""
+        numbers = [self.get_number(index) for index in range(self.size + self.__new_items)]
+        if self.deleted:
+            numbers = [number for number in numbers if self.get_id(number) not in self.deleted]
+        search = params.get('search', '').lower()
+        if search:
+            numbers = [number for number in numbers if search in self.get_name(number).lower()]
+        if params.get('fav') == '1':
+            numbers = [number for number in numbers if self.get_id(number) in self.favorites]
+        page = max(1, int(params.get('p', 1)))
+        start = (page - 1) * page_size
+        data = [self.get_item(number) for number in numbers[start:start + page_size]]
+        return {'total_items': str(len(numbers)), 'max_page_items': page_size, 'selected_item': 0, 'cur_page': page, 'data': data}
+
+    def update_favorites(self, action, params):
+        """Apply set_fav or del_fav, for itv set_fav replaces all favorites with fav_ch"""
+        if 'fav_ch' in params:
+            self.favorites = {_id for _id in params['fav_ch'].split(',') if _id}
+        elif action == 'set_fav':
+            self.favorites.add(params.get('video_id'))
+        else:
+            self.favorites.discard(params.get('video_id'))
+
+
+class FakePortalHandler(BaseHTTPRequestHandler):
+    """Hands requests to the portal, faults are injected one per request"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve a portal response or the next fault"""
+        split_url = urlsplit(self.path)
+        portal = self.server.portal
+        params = dict(parse_qsl(split_url.query))
+        portal.record(params)
+        fault = portal.next_fault()
+        if fault == 'reset':
+            # Close without answering, the client sees the connection dropped
+            self.close_connection = True
+            return
+        portal.delay(portal.hang_time if fault == 'hang' else None)
+        if split_url.path not in CONTEXT_PATHS:
+            self.__send(404, b'Not found')
+        elif isinstance(fault, int):
+            self.__send(fault, b'Server error')
+        else:
+            self.__send(200, portal.get_response(params, self.headers.get('Authorization', '')))
+
+    def __send(self, status, body):
+        """Send JSON body, gzip compressed when enabled and accepted by the client"""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if self.server.portal.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=6)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.server.portal.count_bytes(len(body))
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silence request logging"""
+
+
+class FakePortalServer(ThreadingHTTPServer):
+    """Threaded server that ignores clients which gave up waiting"""
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        """Silence broken pipes of abandoned requests"""
+
+
+class FakePortal:  # pylint: disable=too-many-instance-attributes
+    """
+    Stalker portal emulator on a local port
+
+    catalogue_size: items per vod, series and itv listing, None serves the fixtures as they are
+    page_size: max_page_items of listings
+    latency, jitter: seconds every response is delayed by, latency +/- a random jitter
+    token_ttl: seconds a handshake token stays valid, None accepts any token
+    failure_rate: share of requests answered by a random fault from failure_kinds
+    compress: gzip responses for clients accepting it, bytes_sent counts the compressed bytes
+    faults: queue of faults for the next requests, 'reset', 'hang' or an HTTP status code
+    """
+
+    def __init__(self, catalogue_size=None, page_size=14, latency=0.0, jitter=0.0, token_ttl=None,  # pylint: disable=too-many-positional-arguments
+                 failure_rate=0.0, failure_kinds=('reset', 503), seed=0, port=0, compress=False):
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.token_ttl = token_ttl
+        self.failure_rate = failure_rate
+        self.failure_kinds = failure_kinds
+        self.compress = compress
+        self.hang_time = 1.0
+        self.faults = []
+        self.requests = []
+        self.bytes_sent = 0
+        self.catalogues = None if catalogue_size is None else {_type: Catalogue(_type, catalogue_size) for _type in ('vod', 'series', 'itv')}
+        self.__tokens = {}
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__server = FakePortalServer(('127.0.0.1', port), FakePortalHandler)
+        self.__server.portal = self
+
+    @property
+    def server_address(self):
+        """Server address as entered in the addon settings"""
+        return 'http://127.0.0.1:{}/stalker_portal/c/'.format(self.__server.server_address[1])
+
+    @property
+    def url(self):
+        """Portal url as used by the addon"""
+        return 'http://127.0.0.1:{}/stalker_portal/server/load.php'.format(self.__server.server_address[1])
+
+    def start(self):
+        """Serve in a background thread"""
+        threading.Thread(target=self.__server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def reset_stats(self):
+        """Clear request log and byte counter"""
+        with self.__lock:
+            self.requests = []
+            self.bytes_sent = 0
+
+    def record(self, params):
+        """Log request params"""
+        with self.__lock:
+            self.requests.append(params)
+
+    def count_bytes(self, count):
+        """Add to bytes sent"""
+        with self.__lock:
+            self.bytes_sent += count
+
+    def next_fault(self):
+        """Fault for the current request, None to answer normally"""
+        with self.__lock:
+            if self.faults:
+                return self.faults.pop(0)
+            if self.failure_rate and self.__random.random() < self.failure_rate:
+                return self.__random.choice(self.failure_kinds)
+        return None
+
+    def delay(self, seconds=None):
+        """Sleep for the configured latency and jitter, or the given seconds"""
+        if seconds is None:
+            with self.__lock:
+                seconds = max(0.0, self.latency + self.__random.uniform(-self.jitter, self.jitter))
+        if seconds:
+            time.sleep(seconds)
+
+    def expire_tokens(self):
+        """Invalidate all issued tokens, as a portal restart would"""
+        with self.__lock:
+            self.__tokens.clear()
+
+    def get_response(self, params, authorization):
+        """Response body for the request params"""
+        key = (params.get('type'), params.get('action'))
+        if key == ('stb', 'handshake'):
+            return self.__handshake()
+        if not self.__is_authorized(authorization):
+            return AUTHORIZATION_FAILED
+        if self.catalogues is not None:
+            response = self.__get_catalogue_response(key, params)
+            if response is not None:
+                return json.dumps({'js': response}).encode('utf-8')
+        if key not in FIXTURES:
+            return json.dumps({'js': True}).encode('utf-8')
+        with open(os.path.join(RESPONSES_DIR, FIXTURES[key]), 'rb') as f:
+            return f.read()
+
+    def __handshake(self):
+        """Issue a new token"""
+        if self.token_ttl is None:
+            with open(os.path.join(RESPONSES_DIR, 'token.json'), 'rb') as f:
+                return f.read()
+        with self.__lock:
+            token = 'TOKEN{:08d}'.format(len(self.requests))
+            self.__tokens[token] = time.time() + self.token_ttl
+        return json.dumps({'js': {'token': token}}).encode('utf-8')
+
+    def __is_authorized(self, authorization):
+        """Whether the bearer token was issued and has not expired"""
+        if self.token_ttl is None:
+            return True
+        with self.__lock:
+            return self.__tokens.get(authorization.replace('Bearer ', '', 1), 0) > time.time()
+
+    def __get_catalogue_response(self, key, params):
+        """Generated response, None for requests the catalogue does not handle"""
+        _type, action = key
+        catalogue = self.catalogues.get(_type)
+        if catalogue is None:
+            return None
+        if action == 'get_ordered_list':
+            return catalogue.get_seasons(params['movie_id']) if params.get('movie_id') else catalogue.get_page(params, self.page_size)
+        if action == 'get_all_fav_channels':
+            return {'data': [{'id': _id} for _id in sorted(catalogue.favorites)]}
+        if action in ('set_fav', 'del_fav'):
+            catalogue.update_favorites(action, params)
+            return True
+        return None
+
+
+def main():
+    """Run the emulator until interrupted"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--catalogue-size', type=int, default=None, help='items per listing, fixtures when omitted')
+    parser.add_argument('--page-size', type=int, default=14)
+    parser.add_argument('--latency', type=float, default=0, help='response delay in ms')
+    parser.add_argument('--jitter', type=float, default=0, help='random delay variation in ms')
+    parser.add_argument('--token-ttl', type=float, default=None, help='token validity in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0, help='share of failed requests, 0 to 1')
+    parser.add_argument('--gzip', action='store_true', help='gzip responses for clients accepting it')
+    args = parser.parse_args()
+    portal = FakePortal(catalogue_size=args.catalogue_size, page_size=args.page_size, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                        token_ttl=args.token_ttl, failure_rate=args.failure_rate, port=args.port, compress=args.gzip).start()
+    print('Serving {} (server address {})'.format(portal.url, portal.server_address), flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        portal.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
 """Test Module for addon.py"""
+import sys
 import unittest
-from unittest.mock import patch
+import subprocess
+from unittest.mock import patch, Mock
 from lib.addon import StalkerAddon, run
+from lib.auth import AuthError
 from lib.globals import G
 
 
@@ -21,15 +24,49 @@ class TestStalkerAddon(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.stalker_addon.router(params)
 
+    def test_missing_param(self):
+        """Test required params are checked before the handler runs"""
+        with self.assertRaises(ValueError):
+            self.stalker_addon.router('action=add_fav&video_id=1234')
+
+    @patch('lib.addon.xbmcplugin')
+    def test_add_route(self, mock_xbmcplugin):
+        """Test registered routes are dispatched with their content type"""
+        handler = Mock()
+        StalkerAddon.add_route('browse', handler, ('path',), 'files')
+        self.stalker_addon.router('action=browse&path=%2F')
+        handler.assert_called_once_with(self.stalker_addon, {'action': 'browse', 'path': '/'})
+        mock_xbmcplugin.setContent.assert_called_once_with(G.get_handle(), 'files')
+        with self.assertRaises(ValueError):
+            self.stalker_addon.router('action=browse')
+
+    def test_import_defers_requests(self):
+        """Test the entry path does not import requests or sqlite3 before the first portal or catalogue call"""
+        code = 'import sys, lib.addon; sys.exit(int("requests" in sys.modules or "sqlite3" in sys.modules))'
+        self.assertEqual(subprocess.run([sys.executable, '-c', code], check=False, stdout=subprocess.DEVNULL).returncode, 0)
+
+    @patch('lib.addon.PortalSession')
     @patch('lib.addon.xbmc')
     @patch('lib.addon.Api')
     @patch('sys.argv', ['plugin://plugin.video.stalkervod/', '1'])
-    def test_run(self, mock_api, mock_xbmc):
+    def test_run(self, mock_api, mock_xbmc, mock_session):
         """Test run"""
         run(['plugin://plugin.video.stalkervod/', '1', '?action=add_fav&video_id=1234&_type=vod'])
+        mock_session.set_deadline.assert_called_with(G.addon_config.action_deadline)
         mock_api.add_favorites.assert_called_with('1234', 'vod')
         mock_xbmc.executebuiltin.assert_called_with('Container.Refresh')
 
+    @patch('lib.addon.xbmcgui')
+    @patch('lib.addon.PortalSession')
+    @patch('lib.addon.Api')
+    @patch('sys.argv', ['plugin://plugin.video.stalkervod/', '1'])
+    def test_run_auth_error(self, mock_api, mock_session, mock_xbmcgui):  # pylint: disable=unused-argument
+        """Test run tells the user the portal refused a token"""
+        mock_api.add_favorites.side_effect = AuthError('Error getting token')
+        with self.assertRaises(AuthError):
+            run(['plugin://plugin.video.stalkervod/', '1', '?action=add_fav&video_id=1234&_type=vod'])
+        mock_xbmcgui.Dialog.return_value.ok.assert_called_once_with(G.addon_config.name, 'Error getting token')
+
     @patch('lib.addon.xbmc')
     @patch('lib.addon.Api')
     def test_toggle_favorites_add(self, mock_api, mock_xbmc):
@@ -48,6 +85,16 @@ class TestStalkerAddon(unittest.TestCase):
         mock_api.remove_favorites.assert_called_with('1234', 'vod')
         mock_xbmc.executebuiltin.assert_called_with('Container.Refresh')
 
+    @patch('lib.addon.xbmcgui')
+    @patch('lib.catalogue.Catalogue.clear')
+    @patch('lib.addon.ResponseCache')
+    def test_clear_cache(self, mock_cache, mock_catalogue_clear, mock_xbmcgui):
+        """Test clear_cache"""
+        self.stalker_addon.router('action=clear_cache')
+        mock_cache.clear_all.assert_called_once()
+        mock_catalogue_clear.assert_called_once()
+        mock_xbmcgui.Dialog.return_value.notification.assert_called_once()
+
     @patch('lib.addon.xbmcplugin')
     @patch('lib.addon.xbmcgui')
     @patch('lib.addon.Api')
@@ -76,7 +123,8 @@ class TestStalkerAddon(unittest.TestCase):
     @patch('lib.addon.xbmcplugin')
     @patch('lib.addon.xbmcgui')
     @patch('lib.addon.Api')
-    def test_list_videos(self, mock_api, mock_xbmcgui, mock_xbmcplugin, mock_xbmc):
+    @patch('lib.addon.Prefetcher')
+    def test_list_videos(self, mock_prefetcher, mock_api, mock_xbmcgui, mock_xbmcplugin, mock_xbmc):
         """Test list_videos"""
         mock_api.get_videos.return_value = {'total_items': 10, 'max_page_items': 2,
                                             'data': [
@@ -139,14 +187,17 @@ class TestStalkerAddon(unittest.TestCase):
         self.stalker_addon.router(params)
         mock_xbmcplugin.setPluginCategory.assert_called_with(1, 'VOD - movies')
         mock_xbmcplugin.setContent.assert_called()
-        mock_api.get_videos.assert_called_with('1', '0', '', 0)
+        mock_api.get_videos.assert_called_with('1', '0', '', 0, stream=True)
         self.assertEqual(mock_xbmcgui.ListItem.call_count, 6)
         self.assertEqual(mock_xbmc.Actor.call_count, 4)
+        mock_prefetcher.publish.assert_called_once_with(
+            {'action': 'vod_listing', 'category': 'movies', 'category_id': '1', 'page': '0', 'update_listing': 'False'}, 6)
 
     @patch('lib.addon.xbmcplugin')
     @patch('lib.addon.xbmcgui')
     @patch('lib.addon.Api')
-    def test_list_channels(self, mock_api, mock_xbmcgui, mock_xbmcplugin):
+    @patch('lib.addon.Prefetcher')
+    def test_list_channels(self, mock_prefetcher, mock_api, mock_xbmcgui, mock_xbmcplugin):  # pylint: disable=unused-argument
         """Test list_channels"""
         mock_api.get_tv_channels.return_value = {'total_items': 10, 'max_page_items': 2,
                                                  'data': [
@@ -168,7 +219,7 @@ class TestStalkerAddon(unittest.TestCase):
         self.stalker_addon.router(params)
         mock_xbmcplugin.setPluginCategory.assert_called_with(1, 'TV - english')
         mock_xbmcplugin.setContent.assert_called()
-        mock_api.get_tv_channels.assert_called_with('1', '0', '', '0')
+        mock_api.get_tv_channels.assert_called_with('1', '0', '', '0', stream=True)
         self.assertEqual(mock_xbmcgui.ListItem.call_count, 4)
 
     @patch('lib.addon.xbmcplugin')
@@ -228,7 +279,7 @@ class TestStalkerAddon(unittest.TestCase):
         self.stalker_addon.router(params)
         mock_xbmcplugin.setPluginCategory.assert_called_with(1, 'VOD FAVORITES')
         mock_xbmcplugin.setContent.assert_called()
-        mock_api.get_vod_favorites.assert_called_with('0')
+        mock_api.get_vod_favorites.assert_called_with('0', stream=True)
         self.assertEqual(mock_xbmcgui.ListItem.call_count, 0)
         self.assertEqual(mock_xbmc.Actor.call_count, 0)
 
@@ -251,7 +302,7 @@ class TestStalkerAddon(unittest.TestCase):
         mock_api.get_series_categories.return_value = []
         params = ''
         self.stalker_addon.router(params)
-        self.assertEqual(mock_xbmcgui.ListItem.call_count, 2)
+        self.assertEqual(mock_xbmcgui.ListItem.call_count, 3)
 
     @patch('lib.addon.xbmcgui')
     @patch('lib.addon.Api')
@@ -260,7 +311,7 @@ class TestStalkerAddon(unittest.TestCase):
         mock_api.get_series_categories.return_value = 'false'
         params = ''
         self.stalker_addon.router(params)
-        self.assertEqual(mock_xbmcgui.ListItem.call_count, 2)
+        self.assertEqual(mock_xbmcgui.ListItem.call_count, 3)
 
     @patch('lib.addon.xbmcgui')
     @patch('lib.addon.Api')
@@ -277,7 +328,7 @@ class TestStalkerAddon(unittest.TestCase):
             }]
         params = ''
         self.stalker_addon.router(params)
-        self.assertEqual(mock_xbmcgui.ListItem.call_count, 3)
+        self.assertEqual(mock_xbmcgui.ListItem.call_count, 4)
 
     @patch('lib.addon.xbmcplugin')
     @patch('lib.addon.xbmcgui')
@@ -313,7 +364,7 @@ class TestStalkerAddon(unittest.TestCase):
         self.stalker_addon.router(params)
         mock_xbmcplugin.setPluginCategory.assert_called_with(1, 'SERIES FAVORITES')
         mock_xbmcplugin.setContent.assert_called()
-        mock_api.get_series_favorites.assert_called_with('0')
+        mock_api.get_series_favorites.assert_called_with('0', stream=True)
         self.assertEqual(mock_xbmcgui.ListItem.call_count, 0)
         self.assertEqual(mock_xbmc.Actor.call_count, 0)
 
@@ -328,7 +379,7 @@ class TestStalkerAddon(unittest.TestCase):
         self.stalker_addon.router(params)
         mock_xbmcplugin.setPluginCategory.assert_called_with(1, 'TV FAVORITES')
         mock_xbmcplugin.setContent.assert_called()
-        mock_api.get_tv_favorites.assert_called_with('0')
+        mock_api.get_tv_favorites.assert_called_with('0', stream=True)
         self.assertEqual(mock_xbmcgui.ListItem.call_count, 0)
         self.assertEqual(mock_xbmc.Actor.call_count, 0)
 
@@ -336,7 +387,8 @@ class TestStalkerAddon(unittest.TestCase):
     @patch('lib.addon.xbmcplugin')
     @patch('lib.addon.xbmcgui')
     @patch('lib.addon.Api')
-    def test_list_series(self, mock_api, mock_xbmcgui, mock_xbmcplugin, mock_xbmc):
+    @patch('lib.addon.Prefetcher')
+    def test_list_series(self, mock_prefetcher, mock_api, mock_xbmcgui, mock_xbmcplugin, mock_xbmc):  # pylint: disable=unused-argument
         """Test list_videos"""
         mock_api.get_series.return_value = {'total_items': 10, 'max_page_items': 2,
                                             'data': [
@@ -399,7 +451,7 @@ class TestStalkerAddon(unittest.TestCase):
         self.stalker_addon.router(params)
         mock_xbmcplugin.setPluginCategory.assert_called_with(1, 'SERIES - hindi series')
         mock_xbmcplugin.setContent.assert_called()
-        mock_api.get_series.assert_called_with('1', '0', '', 0)
+        mock_api.get_series.assert_called_with('1', '0', '', 0, stream=True)
         self.assertEqual(mock_xbmcgui.ListItem.call_count, 6)
         self.assertEqual(mock_xbmc.Actor.call_count, 4)
 
@@ -516,6 +568,24 @@ class TestStalkerAddon(unittest.TestCase):
         mock_api.get_videos.assert_called()
         mock_xbmcplugin.setPluginCategory.assert_called()
 
+    @patch('lib.addon.PortalSession')
+    @patch('lib.addon.xbmcplugin')
+    @patch('lib.addon.xbmcgui')
+    @patch('lib.addon.Api')
+    @patch('lib.addon.ask_for_input')
+    @patch('sys.argv', ['plugin://plugin.video.stalkervod/', '1'])
+    def test_search_deadline_after_input(self, mock_ask_for_input, mock_api, mock_xbmcgui, mock_xbmcplugin, mock_session):  # pylint: disable=unused-argument,too-many-positional-arguments
+        """Test the deadline of the listing starts once the user entered the search term"""
+        mock_ask_for_input.return_value = 'search_term'
+        mock_api.get_videos.return_value = {'total_items': 0, 'max_page_items': 2, 'data': []}
+        calls = Mock()
+        calls.attach_mock(mock_ask_for_input, 'ask_for_input')
+        calls.attach_mock(mock_session.set_deadline, 'set_deadline')
+        calls.attach_mock(mock_api.get_videos, 'get_videos')
+        run(['plugin://plugin.video.stalkervod/', '1', '?action=vod_search&category=English Movies&category_id=1&isContextMenuSearch=false'])
+        self.assertEqual([call[0] for call in calls.mock_calls], ['set_deadline', 'ask_for_input', 'set_deadline', 'get_videos'])
+        mock_session.set_deadline.assert_called_with(G.addon_config.action_deadline)
+
     @patch('lib.addon.xbmcplugin')
     @patch('lib.addon.xbmcgui')
     @patch('lib.addon.Api')
@@ -533,6 +603,40 @@ class TestStalkerAddon(unittest.TestCase):
         mock_api.get_tv_channels.assert_called()
         mock_xbmcplugin.setPluginCategory.assert_called()
 
+    @patch('lib.addon.xbmcplugin')
+    @patch('lib.addon.xbmcgui')
+    @patch('lib.addon.Api')
+    @patch('lib.addon.ask_for_input')
+    def test_search_all(self, mock_ask_for_input, mock_api, mock_xbmcgui, mock_xbmcplugin):
+        """Test results of all types are grouped and a search which did not complete is reported"""
+        mock_ask_for_input.return_value = 'news'
+        channels = {'total_items': 3, 'max_page_items': 2, 'data': [{'id': 123, 'name': 'News 1', 'cmd': 'ffrt http://localhost/ch/353'},
+                                                                   {'id': 124, 'name': 'News 2', 'cmd': 'ffrt http://localhost/ch/354'}]}
+        mock_api.search_all.return_value = iter([('itv', channels), ('vod', None), ('series', {'total_items': 0, 'max_page_items': 2, 'data': []})])
+        self.stalker_addon.router('action=search')
+        mock_api.search_all.assert_called_once_with('news', G.addon_config.search_deadline)
+        mock_xbmcplugin.setPluginCategory.assert_called_with(1, 'SEARCH - news')
+        mock_xbmcplugin.addDirectoryItems.assert_called_once()
+        directory_items = mock_xbmcplugin.addDirectoryItems.call_args[0][1]
+        self.assertEqual(len(directory_items), 3)
+        self.assertIn('action=tv_listing', directory_items[0][0])
+        self.assertIn('category_id=%2A', directory_items[0][0])
+        self.assertIn('search_term=news', directory_items[0][0])
+        mock_xbmcgui.ListItem.assert_any_call(label='[B]TV - 2 of 3 results[/B]')
+        mock_xbmcgui.Dialog.return_value.notification.assert_called_once_with(
+            G.addon_config.name, 'VOD search did not complete', mock_xbmcgui.NOTIFICATION_WARNING)
+        mock_xbmcplugin.endOfDirectory.assert_called_once()
+
+    @patch('lib.addon.xbmcplugin')
+    @patch('lib.addon.xbmcgui')
+    @patch('lib.addon.Api')
+    @patch('lib.addon.ask_for_input')
+    def test_search_all_cancelled(self, mock_ask_for_input, mock_api, mock_xbmcgui, mock_xbmcplugin):  # pylint: disable=unused-argument
+        """Test nothing is searched without a search term"""
+        mock_ask_for_input.return_value = None
+        self.stalker_addon.router('action=search')
+        mock_api.search_all.assert_not_called()
+
     @patch('lib.addon.Api.get_vod_categories')
     @patch('lib.addon.ask_for_category_selection')
     @patch('lib.addon.ask_for_input')
@@ -1,10 +1,21 @@
 """Test Module for api.py"""
+import re
 import json
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, Mock
 import logging
+import requests
 from lib.api import Api
+from lib.auth import TokenStore
+from lib.cache import ResponseCache
 from lib.globals import G
+from lib.metrics import Metrics
+from lib.session import PortalSession
+from tests.fake_portal import FakePortal
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -55,6 +66,7 @@ def mock_requests_factory(response_stub: str, status_code: int = 200):
     return Mock(**{
         'json.return_value': json.loads(response_stub),
         'text': response_stub,
+        'content': response_stub.encode('utf-8'),
         'status_code': status_code,
         'ok': status_code == 200
     })
@@ -115,7 +127,17 @@ class TestApi(unittest.TestCase):
         super().__init__(method_name)
         G.init_globals()
 
-    @patch('requests.get')
+    def setUp(self):
+        """Start every test with an empty response cache and no retry backoff"""
+        ResponseCache.clear_all()
+        self.original_retry_backoff = G.addon_config.retry_backoff
+        G.addon_config.retry_backoff = 0
+
+    def tearDown(self):
+        """Restore retry backoff"""
+        G.addon_config.retry_backoff = self.original_retry_backoff
+
+    @patch('requests.Session.get')
     def test_get_vod_categories(self, requests_get_mock):
         """Test get_vod_categories"""
         requests_get_mock.side_effect = mock_requests_get
@@ -129,7 +151,17 @@ class TestApi(unittest.TestCase):
         self.assertEqual(categories[2]['title'], 'ENGLISH TV SHOW')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
+    def test_get_vod_categories_cached(self, requests_get_mock):
+        """Test categories are served from cache on second call"""
+        requests_get_mock.side_effect = mock_requests_get
+        Api.get_vod_categories()
+        requests_get_mock.reset_mock()
+        categories = Api.get_vod_categories()
+        self.assertEqual(len(categories), 3)
+        self.assertFalse(requests_get_mock.called)
+
+    @patch('requests.Session.get')
     def test_get_tv_genres(self, requests_get_mock):
         """Test get_tv_genres"""
         requests_get_mock.side_effect = mock_requests_get
@@ -143,7 +175,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(genres[2]['title'], 'sports')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_vod_favorites(self, requests_get_mock):
         """Test get_vod_favorites"""
         requests_get_mock.side_effect = mock_requests_get
@@ -153,7 +185,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(favorites['data'][0]['name'], 'The Blacklist S10')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_videos(self, requests_get_mock):
         """Test get_videos"""
         requests_get_mock.side_effect = mock_requests_get
@@ -163,7 +195,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(videos['data'][0]['name'], 'The Blacklist S10')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_tv_channels(self, requests_get_mock):
         """Test get_tv_channels"""
         requests_get_mock.side_effect = mock_requests_get
@@ -173,7 +205,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(channels['data'][0]['name'], 'USA NETWORK')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_vod_stream_url(self, requests_get_mock):
         """Test get_vod_stream_url"""
         requests_get_mock.side_effect = mock_requests_get
@@ -181,7 +213,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(stream_url, 'http://video.cmd/ENGS/The.Blacklist.S10E03.mp4/playlist.m3u8?token=o832u4rkjsndfhoi348uyr3')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_tv_stream_url(self, requests_get_mock):
         """Test get_tv_stream_url"""
         requests_get_mock.side_effect = mock_requests_get
@@ -189,7 +221,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(stream_url, 'http://video.cmd/LoveNatureHDUSA/index.m3u8?token=o384uroiwkjsdnskfjs')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_tv_stream_url2(self, requests_get_mock):
         """Test get_tv_stream_url"""
         requests_get_mock.side_effect = mock_requests_get
@@ -197,7 +229,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(stream_url, 'http://video.cmd/LoveNatureHDUSA/index.m3u8?token=o384uroiwkjsdnskfjs')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_tv_stream_url3(self, requests_get_mock):
         """Test get_tv_stream_url"""
         requests_get_mock.side_effect = mock_requests_get
@@ -205,21 +237,21 @@ class TestApi(unittest.TestCase):
         self.assertEqual(stream_url, '3232')
         self.assertFalse(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_remove_favorites(self, requests_get_mock):
         """Test get_tv_genres"""
         requests_get_mock.side_effect = mock_requests_get
         Api.remove_favorites(122, 'vod')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_add_favorites(self, requests_get_mock):
         """Test add_favorites for vod"""
         requests_get_mock.side_effect = mock_requests_get
         Api.add_favorites(122, 'vod')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_series_categories(self, requests_get_mock):
         """Test get_series_categories"""
         requests_get_mock.side_effect = mock_requests_get
@@ -229,7 +261,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(categories[0]['title'], 'All')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_series_categories_no_js(self, requests_get_mock):
         """Test get_series_categories when js key is missing"""
         # Mock the auth handshake first, then the actual call without 'js' key
@@ -243,7 +275,7 @@ class TestApi(unittest.TestCase):
         result = Api.get_series_categories()
         self.assertFalse(result)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_series_favorites(self, requests_get_mock):
         """Test get_series_favorites"""
         requests_get_mock.side_effect = mock_requests_get
@@ -254,7 +286,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(favorites['data'][0]['title'], 'Season 1')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_tv_favorites(self, requests_get_mock):
         """Test get_tv_favorites"""
         requests_get_mock.side_effect = mock_requests_get
@@ -265,7 +297,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(favorites['data'][0]['name'], 'USA NETWORK')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_seasons(self, requests_get_mock):
         """Test get_seasons"""
         requests_get_mock.side_effect = mock_requests_get
@@ -274,7 +306,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(seasons['data'][0]['title'], 'Season 1')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_tv_channels_with_search(self, requests_get_mock):
         """Test get_tv_channels with search term"""
         requests_get_mock.side_effect = mock_requests_get
@@ -282,7 +314,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(channels['total_items'], '1')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_videos_with_search(self, requests_get_mock):
         """Test get_videos with search term"""
         requests_get_mock.side_effect = mock_requests_get
@@ -290,7 +322,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(videos['total_items'], '1')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_series_with_search(self, requests_get_mock):
         """Test get_series with search term"""
         requests_get_mock.side_effect = mock_requests_get
@@ -300,7 +332,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(len(series['data']), 2)
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_listing_multi_page(self, requests_get_mock):
         """Test get_listing with multiple pages"""
         # Set max_page_limit to allow multiple pages
@@ -321,24 +353,139 @@ class TestApi(unittest.TestCase):
         finally:
             G.addon_config.max_page_limit = original_limit
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
+    def test_get_listing_concurrent_page_order(self, requests_get_mock):
+        """Test pages fetched concurrently are merged in page order"""
+        original_limit = G.addon_config.max_page_limit
+        G.addon_config.max_page_limit = 5
+
+        def mock_side_effect(**kwargs):
+            params = kwargs['params']
+            if params['action'] == 'handshake':
+                return mock_requests_factory(json.dumps(TOKEN))
+            page = int(params['p'])
+            # Later pages answer first
+            time.sleep((5 - page) * 0.01)
+            return mock_requests_factory(json.dumps({"js": {"data": [{"name": "Video " + str(page)}], "total_items": "10", "max_page_items": "2"}}))
+
+        requests_get_mock.side_effect = mock_side_effect
+        try:
+            result = Api.get_listing({'type': 'vod', 'action': 'get_ordered_list'}, 1)
+            self.assertEqual([item['name'] for item in result['data']], ['Video 1', 'Video 2', 'Video 3', 'Video 4', 'Video 5'])
+        finally:
+            G.addon_config.max_page_limit = original_limit
+
+    @patch('requests.Session.get')
+    def test_get_listing_failed_page(self, requests_get_mock):
+        """Test a failed page is skipped without losing the listing"""
+        original_limit = G.addon_config.max_page_limit
+        G.addon_config.max_page_limit = 3
+
+        def mock_side_effect(**kwargs):
+            params = kwargs['params']
+            if params['action'] == 'handshake':
+                return mock_requests_factory(json.dumps(TOKEN))
+            page = int(params['p'])
+            if page == 2:
+                raise requests.ConnectionError('Connection reset')
+            return mock_requests_factory(json.dumps({"js": {"data": [{"name": "Video " + str(page)}], "total_items": "10", "max_page_items": "2"}}))
+
+        requests_get_mock.side_effect = mock_side_effect
+        try:
+            result = Api.get_listing({'type': 'vod', 'action': 'get_ordered_list'}, 1)
+            self.assertEqual([item['name'] for item in result['data']], ['Video 1', 'Video 3'])
+            self.assertEqual(result['total_items'], '10')
+        finally:
+            G.addon_config.max_page_limit = original_limit
+
+    @patch('requests.Session.get')
+    def test_get_listing_cached(self, requests_get_mock):
+        """Test equivalent listing requests are served from cache"""
+        requests_get_mock.side_effect = mock_requests_get
+        Api.get_videos('12', 1, '', 0)
+        requests_get_mock.reset_mock()
+        videos = Api.get_videos('12', '1', ' ', '0')
+        self.assertEqual(videos['data'][0]['name'], 'The Blacklist S10')
+        self.assertFalse(requests_get_mock.called)
+        Api.get_videos('12', 1, '', 1)
+        self.assertTrue(requests_get_mock.called)
+
+    @patch('requests.Session.get')
+    def test_get_listing_cache_invalidated_by_favorites(self, requests_get_mock):
+        """Test toggling a favorite invalidates only listings of its type"""
+        requests_get_mock.side_effect = mock_requests_get
+        Api.get_videos('12', 1, '', 0)
+        Api.get_tv_channels('1', 1, '', 0)
+        Api.add_favorites(122, 'vod')
+        requests_get_mock.reset_mock()
+        Api.get_tv_channels('1', 1, '', 0)
+        self.assertFalse(requests_get_mock.called)
+        Api.get_videos('12', 1, '', 0)
+        self.assertTrue(requests_get_mock.called)
+
+    @patch('requests.Session.get')
+    def test_get_listing_failed_page_not_cached(self, requests_get_mock):
+        """Test a listing with a failed page is not cached"""
+        original_limit = G.addon_config.max_page_limit
+        G.addon_config.max_page_limit = 2
+
+        def mock_side_effect(**kwargs):
+            params = kwargs['params']
+            if params['action'] == 'handshake':
+                return mock_requests_factory(json.dumps(TOKEN))
+            if params['p'] == '2':
+                raise requests.ConnectionError('Connection reset')
+            return mock_requests_factory(json.dumps(MULTI_PAGE_VIDEOS))
+
+        requests_get_mock.side_effect = mock_side_effect
+        try:
+            Api.get_listing({'type': 'vod', 'action': 'get_ordered_list'}, 1)
+            requests_get_mock.reset_mock()
+            Api.get_listing({'type': 'vod', 'action': 'get_ordered_list'}, 1)
+            self.assertTrue(requests_get_mock.called)
+        finally:
+            G.addon_config.max_page_limit = original_limit
+
+    def test_search_all(self):
+        """Test searches of all types are yielded as they complete, a late or failed one yields None"""
+        videos = {'total_items': 1, 'max_page_items': 2, 'data': [{'id': '1'}]}
+        release = threading.Event()
+
+        def get_series(*args):  # pylint: disable=unused-argument
+            release.wait(5)
+            return videos
+
+        with patch.object(Api, 'get_videos', return_value=videos) as mock_get_videos, \
+                patch.object(Api, 'get_series', side_effect=get_series), \
+                patch.object(Api, 'get_tv_channels', side_effect=requests.ConnectionError('Connection refused')):
+            try:
+                start = time.monotonic()
+                results = list(Api.search_all('paris', 0.2))
+                self.assertLess(time.monotonic() - start, 2)
+            finally:
+                release.set()
+        self.assertEqual(dict(results), {'vod': videos, 'itv': None, 'series': None})
+        self.assertEqual(results[-1], ('series', None))
+        mock_get_videos.assert_called_once_with('*', 1, 'paris', 0)
+
+    @patch('requests.Session.get')
     def test_add_tv_favorites(self, requests_get_mock):
         """Test add_favorites for itv type"""
         requests_get_mock.side_effect = mock_requests_get
         Api.add_favorites('789', 'itv')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_remove_tv_favorites(self, requests_get_mock):
         """Test remove_favorites for itv type"""
         requests_get_mock.side_effect = mock_requests_get
         Api.remove_favorites('123', 'itv')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
-    @patch('lib.auth.Auth.clear_cache')
+    @patch('requests.Session.get')
+    @patch('lib.auth.Auth.discard_token')
     @patch('lib.auth.Auth.get_token')
-    def test_authorization_failure_retry(self, mock_get_token, mock_clear_cache, requests_get_mock):
+    def test_authorization_failure_retry(self, mock_get_token, mock_discard_token, requests_get_mock):
         """Test authorization failure retry logic"""
         # Set max_retries to test retry logic
         original_retries = G.addon_config.max_retries
@@ -356,6 +503,7 @@ class TestApi(unittest.TestCase):
             if call_count <= 3:  # First 3 calls fail (retries 0, 1, 2)
                 mock_response = Mock()
                 mock_response.text = 'Authorization failed'  # This triggers the retry logic
+                mock_response.content = b'Authorization failed'
                 mock_response.status_code = 401
                 return mock_response
             # Fourth call succeeds (retry 3)
@@ -365,21 +513,25 @@ class TestApi(unittest.TestCase):
 
         try:
             Api.get_vod_categories()
-            # Should have called clear_cache when retries > 1 (i.e., on retry 2)
-            mock_clear_cache.assert_called()
+            # Should have discarded the rejected token when retries > 1 (i.e., on retry 2)
+            mock_discard_token.assert_called_with('78236487Y2WEUHE7Y278YDUHEDI')
         finally:
             G.addon_config.max_retries = original_retries
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_authorization_failure_max_retries(self, requests_get_mock):
         """Test authorization failure with max retries reached"""
         # Set max_retries to test retry logic
         original_retries = G.addon_config.max_retries
         G.addon_config.max_retries = 2
 
-        def mock_side_effect(**kwargs):  # pylint: disable=unused-argument
+        def mock_side_effect(**kwargs):
+            # New tokens are issued and activated, the portal still rejects them for the categories
+            if kwargs['params']['action'] in ('handshake', 'get_profile'):
+                return mock_requests_factory(json.dumps(TOKEN))
             mock_response = Mock()
             mock_response.text = 'Authorization failed'
+            mock_response.content = b'Authorization failed'
             mock_response.status_code = 401
             mock_response.json.return_value = {'js': []}  # Empty categories list for failed auth
             return mock_response
@@ -394,7 +546,7 @@ class TestApi(unittest.TestCase):
         finally:
             G.addon_config.max_retries = original_retries
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_vod_stream_url_with_cmd(self, requests_get_mock):
         """Test get_vod_stream_url using cmd parameter"""
         requests_get_mock.side_effect = mock_requests_get
@@ -402,7 +554,7 @@ class TestApi(unittest.TestCase):
         self.assertEqual(stream_url, 'http://video.cmd/ENGS/The.Blacklist.S10E03.mp4/playlist.m3u8?token=o832u4rkjsndfhoi348uyr3')
         self.assertTrue(requests_get_mock.called)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_vod_stream_url_video_id_failure(self, requests_get_mock):
         """Test get_vod_stream_url when video_id method fails"""
         # Mock to return 404 for video_id method, then success for cmd method
@@ -414,6 +566,7 @@ class TestApi(unittest.TestCase):
             if kwargs['params']['action'] == 'create_link' and '/media/' in kwargs['params']['cmd']:
                 mock_response = Mock()
                 mock_response.status_code = 404
+                mock_response.content = b'{"error": "Not found"}'
                 mock_response.json.return_value = {'error': 'Not found'}
                 return mock_response
             # This is the cmd method call (fallback) - succeeds
@@ -425,7 +578,7 @@ class TestApi(unittest.TestCase):
         stream_url = Api.get_vod_stream_url('3232', 1, 'cmd', '0')  # use_cmd = '0'
         self.assertEqual(stream_url, 'http://video.cmd/ENGS/The.Blacklist.S10E03.mp4/playlist.m3u8?token=o832u4rkjsndfhoi348uyr3')
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_vod_stream_url_video_id_500_error(self, requests_get_mock):
         """Test get_vod_stream_url when video_id method returns 500 error"""
         # Mock to return 500 for video_id method, then success for cmd method
@@ -437,6 +590,7 @@ class TestApi(unittest.TestCase):
             if kwargs['params']['action'] == 'create_link' and 'video_id' in kwargs['params']:
                 mock_response = Mock()
                 mock_response.status_code = 500
+                mock_response.content = b'{"error": "Server error"}'
                 mock_response.json.return_value = {'error': 'Server error'}
                 return mock_response
             # Third call is cmd method (create_link with cmd) - succeeds
@@ -448,7 +602,7 @@ class TestApi(unittest.TestCase):
         stream_url = Api.get_vod_stream_url('3232', 1, 'cmd', '0')  # use_cmd = '0'
         self.assertEqual(stream_url, 'http://video.cmd/ENGS/The.Blacklist.S10E03.mp4/playlist.m3u8?token=o832u4rkjsndfhoi348uyr3')
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_stream_url_space_trimming(self, requests_get_mock):
         """Test stream URL space trimming functionality"""
         # Mock response with space in the URL
@@ -469,7 +623,7 @@ class TestApi(unittest.TestCase):
         tv_url = Api.get_tv_stream_url({'cmd': 'cmd', 'use_load_balancing': 1})
         self.assertEqual(tv_url, 'http://video.cmd/stream.m3u8?token=abc123')
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_call_stalker_portal_return_response_only(self, requests_get_mock):
         """Test __call_stalker_portal with return_response_body=False"""
         requests_get_mock.side_effect = mock_requests_get
@@ -477,3 +631,102 @@ class TestApi(unittest.TestCase):
         # This should return None when return_response_body=False
         result = Api._Api__call_stalker_portal({'type': 'vod', 'action': 'get_categories'}, False)  # pylint: disable=protected-access
         self.assertIsNone(result)
+
+
+@patch('sys.argv', ['plugin://plugin.video.stalkervod/', '1'])
+class TestApiFakePortal(unittest.TestCase):
+    """Test Api against the local portal emulator"""
+
+    def setUp(self):
+        """Point the addon at a fresh emulator and profile directory"""
+        G.init_globals()
+        self.original_config = (G.portal_config.portal_url, G.addon_config.token_path, G.addon_config.max_page_limit, G.addon_config.retry_backoff)
+        G.addon_config.token_path = tempfile.mkdtemp()
+        G.addon_config.max_page_limit = 2
+        G.addon_config.retry_backoff = 0
+        self.portal = FakePortal(catalogue_size=100, page_size=10, token_ttl=3600).start()
+        G.portal_config.portal_url = self.portal.url
+
+    def tearDown(self):
+        """Stop the emulator and restore config"""
+        self.portal.stop()
+        PortalSession.close()
+        TokenStore.clear()
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+        G.portal_config.portal_url, G.addon_config.token_path, G.addon_config.max_page_limit, G.addon_config.retry_backoff = self.original_config
+
+    @staticmethod
+    def __get_summary_bytes():
+        """Decoded bytes of the portal calls recorded by Metrics"""
+        return int(re.search(r'(\d+) bytes', Metrics.get_summary()).group(1))
+
+    def test_get_videos(self):
+        """Test a listing is paged from the emulated catalogue"""
+        videos = Api.get_videos('*', 3, '', 0)
+        self.assertEqual(videos['total_items'], '100')
+        self.assertEqual([video['name'] for video in videos['data']], ['Movie {}'.format(number) for number in range(21, 41)])
+        actions = [params['action'] for params in self.portal.requests]
+        self.assertEqual(actions, ['handshake', 'get_profile', 'get_ordered_list', 'get_ordered_list'])
+
+    def test_search_and_favorites(self):
+        """Test search and favorites are honoured"""
+        self.assertEqual(Api.get_series('*', 1, 'Series 10', 0)['total_items'], '2')
+        Api.add_favorites('200005', 'series')
+        favorites = Api.get_series_favorites(1)
+        self.assertEqual([video['id'] for video in favorites['data']], ['200005'])
+        self.assertEqual(favorites['data'][0]['fav'], 1)
+        Api.add_favorites('300001', 'itv')
+        Api.add_favorites('300002', 'itv')
+        Api.remove_favorites('300001', 'itv')
+        self.assertEqual([channel['id'] for channel in Api.get_tv_favorites(1)['data']], ['300002'])
+
+    def test_token_expiry(self):
+        """Test an expired token is replaced by a new handshake"""
+        Api.get_vod_categories()
+        self.portal.expire_tokens()
+        self.portal.reset_stats()
+        self.assertEqual(len(Api.get_videos('*', 1, '', 0)['data']), 20)
+        # The rejected token is revalidated at once and replaced, not sent again
+        self.assertEqual([params['action'] for params in self.portal.requests],
+                         ['get_ordered_list', 'get_profile', 'handshake', 'get_profile', 'get_ordered_list', 'get_ordered_list'])
+
+    def test_injected_failures(self):
+        """Test transient faults are retried transparently"""
+        self.portal.faults = [503, 'reset']
+        self.assertEqual(len(Api.get_tv_channels('*', 1, '', 0)['data']), 20)
+
+    def test_stream_listing(self):
+        """Test a streamed listing yields the items and caches the listing once read"""
+        videos = Api.get_videos('*', 3, '', 0, stream=True)
+        self.assertEqual(videos['total_items'], '100')
+        self.assertNotIsInstance(videos['data'], list)
+        self.assertEqual([video['name'] for video in videos['data']], ['Movie {}'.format(number) for number in range(21, 41)])
+        self.portal.reset_stats()
+        self.assertEqual(len(Api.get_videos('*', 3, '', 0)['data']), 20)
+        self.assertEqual(self.portal.requests, [])
+
+    @patch.object(Api, '_Api__MAX_CACHED_ITEMS', 50)
+    def test_stream_listing_too_large_to_cache(self):
+        """Test a streamed listing with more items than are cached is not held in memory to be cached"""
+        self.portal.page_size = 1000
+        self.assertEqual(sum(1 for _ in Api.get_tv_channels('*', 1, '', 0, stream=True)['data']), 100)
+        self.portal.reset_stats()
+        self.assertEqual(len(Api.get_tv_channels('*', 1, '', 0)['data']), 100)
+        self.assertEqual([params['action'] for params in self.portal.requests], ['get_ordered_list'])
+
+    def test_stream_unpaged_listing(self):
+        """Test a portal returning the whole catalogue in one page is streamed in one request"""
+        self.portal.page_size = 1000
+        Api.get_vod_categories()
+        # The rejected token is detected from the start of the streamed body
+        self.portal.expire_tokens()
+        self.portal.reset_stats()
+        Metrics.start()
+        channels = Api.get_tv_channels('*', 1, '', 0, stream=True)
+        streamed_bytes = self.__get_summary_bytes()
+        self.assertEqual(sum(1 for _ in channels['data']), 100)
+        # The sizes of the streamed call are recorded once its body was read
+        self.assertGreater(self.__get_summary_bytes() - streamed_bytes, 100 * 100)
+        actions = [params['action'] for params in self.portal.requests]
+        self.assertEqual(actions.count('handshake'), 1)
+        self.assertEqual(len(set(params['p'] for params in self.portal.requests if params['action'] == 'get_ordered_list')), 1)
@@ -1,8 +1,15 @@
 """Test Module for auth.py"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 from unittest.mock import patch, Mock
 import logging
-from lib.auth import Auth, Token
+import xbmcvfs
+from lib.auth import Auth, AuthError, Token, TokenStore
 from lib.globals import G
 
 _LOGGER = logging.getLogger(__name__)
@@ -15,6 +22,8 @@ class TestToken(unittest.TestCase):
         """Test Token initialization"""
         token = Token()
         self.assertIsNone(token.value)
+        self.assertEqual(token.validated_at, 0)
+        self.assertEqual(token.expires_at, 0)
 
     def test_token_with_value(self):
         """Test Token with value"""
@@ -27,9 +36,11 @@ class TestAuth(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures"""
+        self.original_config = (G.addon_config, G.portal_config)
         # Mock G.addon_config and G.portal_config
         G.addon_config = Mock()
         G.addon_config.token_path = "/test/path"
+        G.addon_config.token_validity = 3600
 
         G.portal_config = Mock()
         G.portal_config.portal_url = "http://test.portal.com"
@@ -40,6 +51,10 @@ class TestAuth(unittest.TestCase):
         G.portal_config.device_id_2 = "device456"
         G.portal_config.signature = "test_signature"
 
+    def tearDown(self):
+        """Restore global config"""
+        G.addon_config, G.portal_config = self.original_config
+
     @patch('lib.auth.xbmcvfs')
     @patch('lib.auth.Logger')
     def test_auth_initialization(self, mock_logger, mock_xbmcvfs):  # pylint: disable=unused-argument
@@ -53,11 +68,10 @@ class TestAuth(unittest.TestCase):
         self.assertEqual(auth._Auth__mac_cookie, G.portal_config.mac_cookie)  # pylint: disable=protected-access
         self.assertEqual(auth._Auth__referrer, G.portal_config.server_address)  # pylint: disable=protected-access
 
-    @patch('lib.auth.requests')
+    @patch('lib.auth.PortalSession')
     @patch('lib.auth.xbmcvfs')
-    @patch('lib.auth.xbmcgui')
     @patch('lib.auth.Logger')
-    def test_get_token_success(self, mock_logger, mock_xbmcgui, mock_xbmcvfs, mock_requests):  # pylint: disable=unused-argument
+    def test_get_token_success(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
         """Test successful token retrieval"""
         # Mock file operations
         mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": null}'
@@ -68,7 +82,7 @@ class TestAuth(unittest.TestCase):
         mock_response.status_code = 200
         mock_response.text = '{"js": {"token": "new_token_123"}}'
         mock_response.json.return_value = {"js": {"token": "new_token_123"}}
-        mock_requests.get.return_value = mock_response
+        mock_session.get.return_value = mock_response
 
         auth = Auth()
         token = auth.get_token(refresh_token=False)
@@ -76,11 +90,10 @@ class TestAuth(unittest.TestCase):
         self.assertEqual(token, "new_token_123")
         self.assertEqual(auth._Auth__token.value, "new_token_123")  # pylint: disable=protected-access
 
-    @patch('lib.auth.requests')
+    @patch('lib.auth.PortalSession')
     @patch('lib.auth.xbmcvfs')
-    @patch('lib.auth.xbmcgui')
     @patch('lib.auth.Logger')
-    def test_get_token_authorization_failed(self, mock_logger, mock_xbmcgui, mock_xbmcvfs, mock_requests):  # pylint: disable=unused-argument
+    def test_get_token_authorization_failed(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
         """Test token retrieval with authorization failure"""
         # Mock file operations
         mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": null}'
@@ -89,24 +102,17 @@ class TestAuth(unittest.TestCase):
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.text = 'Authorization failed'
-        mock_requests.get.return_value = mock_response
-
-        # Mock dialog
-        mock_dialog = Mock()
-        mock_xbmcgui.Dialog.return_value = mock_dialog
+        mock_session.get.return_value = mock_response
 
         auth = Auth()
 
-        with self.assertRaises(Exception):
+        with self.assertRaises(AuthError):
             auth.get_token(refresh_token=False)
 
-        mock_dialog.ok.assert_called_once()
-
-    @patch('lib.auth.requests')
+    @patch('lib.auth.PortalSession')
     @patch('lib.auth.xbmcvfs')
-    @patch('lib.auth.xbmcgui')
     @patch('lib.auth.Logger')
-    def test_get_token_http_error(self, mock_logger, mock_xbmcgui, mock_xbmcvfs, mock_requests):  # pylint: disable=unused-argument
+    def test_get_token_http_error(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
         """Test token retrieval with HTTP error"""
         # Mock file operations
         mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": null}'
@@ -115,35 +121,29 @@ class TestAuth(unittest.TestCase):
         mock_response = Mock()
         mock_response.status_code = 500
         mock_response.text = 'Server Error'
-        mock_requests.get.return_value = mock_response
-
-        # Mock dialog
-        mock_dialog = Mock()
-        mock_xbmcgui.Dialog.return_value = mock_dialog
+        mock_session.get.return_value = mock_response
 
         auth = Auth()
 
-        with self.assertRaises(Exception):
+        with self.assertRaises(AuthError):
             auth.get_token(refresh_token=False)
 
-        mock_dialog.ok.assert_called_once()
-
     @patch('lib.auth.xbmcvfs')
     @patch('lib.auth.Logger')
     def test_get_token_with_cached_token(self, mock_logger, mock_xbmcvfs):  # pylint: disable=unused-argument
         """Test getting token when already cached"""
         # Mock file operations with existing token
-        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": "cached_token_123"}'
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": "cached_token_123", "expires_at": 9999999999}'
 
         auth = Auth()
         token = auth.get_token(refresh_token=False)
 
         self.assertEqual(token, "cached_token_123")
 
-    @patch('lib.auth.requests')
+    @patch('lib.auth.PortalSession')
     @patch('lib.auth.xbmcvfs')
     @patch('lib.auth.Logger')
-    def test_get_token_with_refresh(self, mock_logger, mock_xbmcvfs, mock_requests):  # pylint: disable=unused-argument
+    def test_get_token_with_refresh(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
         """Test getting token with refresh"""
         # Mock file operations with existing token
         mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": "cached_token_123"}'
@@ -151,14 +151,133 @@ class TestAuth(unittest.TestCase):
         # Mock refresh requests
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_requests.get.return_value = mock_response
+        mock_response.text = '{"js": {}}'
+        mock_session.get.return_value = mock_response
 
         auth = Auth()
         token = auth.get_token(refresh_token=True)
 
         self.assertEqual(token, "cached_token_123")
-        # Should make 2 refresh calls
-        self.assertEqual(mock_requests.get.call_count, 2)
+        # Should only revalidate with the profile call
+        self.assertEqual(mock_session.get.call_count, 1)
+        self.assertGreater(auth._Auth__token.expires_at, time.time())  # pylint: disable=protected-access
+
+    @patch('lib.auth.PortalSession')
+    @patch('lib.auth.xbmcvfs')
+    @patch('lib.auth.Logger')
+    def test_get_token_with_refresh_recently_validated(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
+        """Test a token rejected by the portal is revalidated even when it was just validated, and replaced when the portal rejects that too"""
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = json.dumps(
+            {'value': 'cached_token_123', 'validated_at': time.time(), 'expires_at': time.time() + 3600})
+        rejected = Mock(status_code=200, text='Authorization failed')
+        handshake = Mock(status_code=200, text='{"js": {"token": "new_token"}}')
+        handshake.json.return_value = {'js': {'token': 'new_token'}}
+        mock_session.get.side_effect = [rejected, handshake, Mock(status_code=200, text='{"js": {}}')]
+
+        auth = Auth()
+        with patch('lib.auth.TokenLock'), patch('lib.auth.TokenStore') as mock_store:
+            mock_store.load.return_value = auth._Auth__token  # pylint: disable=protected-access
+            mock_store.save.side_effect = lambda token, replace=True: token
+            token = auth.get_token(refresh_token=True)
+            # Only the new token is stored, not the rejected one
+            self.assertEqual([call[0][0].value for call in mock_store.save.call_args_list], ['new_token'])
+
+        self.assertEqual(token, 'new_token')
+        self.assertEqual([call[1]['params']['action'] for call in mock_session.get.call_args_list], ['get_profile', 'handshake', 'get_profile'])
+        self.assertGreater(auth._Auth__token.expires_at, time.time())  # pylint: disable=protected-access
+
+    @patch('lib.auth.PortalSession')
+    @patch('lib.auth.xbmcvfs')
+    @patch('lib.auth.Logger')
+    def test_get_token_expired_recently_validated(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
+        """Test an expired token is not revalidated again when that was just done"""
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = json.dumps(
+            {'value': 'cached_token_123', 'validated_at': time.time(), 'expires_at': time.time() - 1})
+
+        auth = Auth()
+        token = auth.get_token(refresh_token=False)
+
+        self.assertEqual(token, "cached_token_123")
+        mock_session.get.assert_not_called()
+
+    @patch('lib.auth.PortalSession')
+    @patch('lib.auth.xbmcvfs')
+    @patch('lib.auth.Logger')
+    def test_get_token_expired(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
+        """Test expired token is revalidated without a handshake"""
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = json.dumps(
+            {'value': 'cached_token_123', 'validated_at': time.time() - 7200, 'expires_at': time.time() - 3600})
+        mock_session.get.return_value = Mock(status_code=200, text='{"js": {}}')
+
+        auth = Auth()
+        token = auth.get_token(refresh_token=False)
+
+        self.assertEqual(token, "cached_token_123")
+        self.assertEqual(mock_session.get.call_count, 1)
+        self.assertEqual(mock_session.get.call_args[1]['params']['action'], 'get_profile')
+
+    @patch('lib.auth.PortalSession')
+    @patch('lib.auth.xbmcvfs')
+    @patch('lib.auth.Logger')
+    def test_send_watchdog(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
+        """Test watchdog is sent only with a cached token"""
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": "cached_token_123"}'
+        self.assertTrue(Auth().send_watchdog())
+        params = mock_session.get.call_args[1]['params']
+        self.assertEqual(params['type'], 'watchdog')
+        self.assertEqual(params['action'], 'get_events')
+
+        mock_session.get.reset_mock()
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": null}'
+        self.assertFalse(Auth().send_watchdog())
+        mock_session.get.assert_not_called()
+
+    @patch('lib.auth.PortalSession')
+    @patch('lib.auth.xbmcvfs')
+    @patch('lib.auth.Logger')
+    def test_refresh_ahead(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
+        """Test token is revalidated only when it expires within the margin"""
+        mock_session.get.return_value.status_code = 200
+        mock_session.get.return_value.text = '{"js": {}}'
+        token = {'value': 'cached_token_123', 'validated_at': time.time() - 3000, 'expires_at': time.time() + 600}
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = json.dumps(token)
+
+        self.assertTrue(Auth().refresh_ahead(300))
+        mock_session.get.assert_not_called()
+
+        auth = Auth()
+        self.assertTrue(auth.refresh_ahead(900))
+        self.assertEqual(mock_session.get.call_args[1]['params']['action'], 'get_profile')
+        self.assertGreater(auth._Auth__token.expires_at, time.time() + 3000)  # pylint: disable=protected-access
+
+    @patch('lib.auth.PortalSession')
+    @patch('lib.auth.xbmcvfs')
+    @patch('lib.auth.Logger')
+    def test_refresh_ahead_rejected(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
+        """Test a rejected token is replaced by a new handshake"""
+        rejected = Mock(status_code=200, text='Authorization failed.')
+        handshake = Mock(status_code=200, text='{"js": {"token": "new_token_123"}}')
+        handshake.json.return_value = {"js": {"token": "new_token_123"}}
+        mock_session.get.side_effect = [rejected, handshake, Mock()]
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": "cached_token_123"}'
+
+        auth = Auth()
+        self.assertTrue(auth.refresh_ahead(900))
+        self.assertEqual([call[1]['params']['action'] for call in mock_session.get.call_args_list], ['get_profile', 'handshake', 'get_profile'])
+        self.assertEqual(auth._Auth__token.value, 'new_token_123')  # pylint: disable=protected-access
+        self.assertEqual(auth._Auth__token.portal, 'http://test.portal.com mac=00:1A:79:XX:XX:XX')  # pylint: disable=protected-access
+
+        mock_session.get.side_effect = None
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": null}'
+        self.assertFalse(Auth().refresh_ahead(900))
+
+    @patch('lib.auth.xbmcvfs')
+    @patch('lib.auth.Logger')
+    def test_token_of_other_portal(self, mock_logger, mock_xbmcvfs):  # pylint: disable=unused-argument
+        """Test a token saved for another portal is not used"""
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = json.dumps(
+            {'value': 'cached_token_123', 'expires_at': time.time() + 600, 'portal': 'http://other.portal.com mac=00:1A:79:XX:XX:XX'})
+        self.assertIsNone(Auth()._Auth__token.value)  # pylint: disable=protected-access
 
     @patch('lib.auth.xbmcvfs')
     @patch('lib.auth.Logger')
@@ -212,10 +331,10 @@ class TestAuth(unittest.TestCase):
         # Should handle IO error gracefully
         self.assertIsNone(auth._Auth__token.value)  # pylint: disable=protected-access
 
-    @patch('lib.auth.requests')
+    @patch('lib.auth.PortalSession')
     @patch('lib.auth.xbmcvfs')
     @patch('lib.auth.Logger')
-    def test_save_cache(self, mock_logger, mock_xbmcvfs, mock_requests):  # pylint: disable=unused-argument
+    def test_save_cache(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
         """Test saving token to cache"""
         # Mock file operations
         mock_file = Mock()
@@ -227,7 +346,7 @@ class TestAuth(unittest.TestCase):
         mock_response.status_code = 200
         mock_response.text = '{"js": {"token": "new_token_123"}}'
         mock_response.json.return_value = {"js": {"token": "new_token_123"}}
-        mock_requests.get.return_value = mock_response
+        mock_session.get.return_value = mock_response
 
         auth = Auth()
         auth.get_token(refresh_token=False)
@@ -235,42 +354,33 @@ class TestAuth(unittest.TestCase):
         # Verify that json.dump was called to save the token
         self.assertTrue(mock_xbmcvfs.File.called)
 
-    @patch('lib.auth.requests')
+    @patch('lib.auth.PortalSession')
     @patch('lib.auth.xbmcvfs')
     @patch('lib.auth.Logger')
-    def test_refresh_token_calls(self, mock_logger, mock_xbmcvfs, mock_requests):  # pylint: disable=unused-argument
-        """Test that refresh token makes the correct API calls"""
-        # Mock file operations with existing token
-        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": "cached_token_123"}'
+    def test_handshake_calls(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
+        """Test that a new token makes the handshake and profile calls only"""
+        mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": null}'
 
-        # Mock refresh requests
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_requests.get.return_value = mock_response
+        mock_response.text = '{"js": {"token": "new_token_123"}}'
+        mock_response.json.return_value = {"js": {"token": "new_token_123"}}
+        mock_session.get.return_value = mock_response
 
         auth = Auth()
-        auth.get_token(refresh_token=True)
-
-        # Should make 2 refresh calls (get_profile and get_events)
-        self.assertEqual(mock_requests.get.call_count, 2)
-
-        # Verify the calls have correct parameters
-        calls = mock_requests.get.call_args_list
-
-        # First call should be get_profile
-        first_call_params = calls[0][1]['params']
-        self.assertEqual(first_call_params['action'], 'get_profile')
-        self.assertEqual(first_call_params['type'], 'stb')
+        auth.get_token(refresh_token=False)
 
-        # Second call should be get_events
-        second_call_params = calls[1][1]['params']
-        self.assertEqual(second_call_params['action'], 'get_events')
-        self.assertEqual(second_call_params['type'], 'watchdog')
+        # Should make 2 calls (handshake and get_profile), watchdog is left to the service
+        self.assertEqual(mock_session.get.call_count, 2)
+        calls = mock_session.get.call_args_list
+        self.assertEqual(calls[0][1]['params']['action'], 'handshake')
+        self.assertEqual(calls[1][1]['params']['action'], 'get_profile')
+        self.assertEqual(calls[1][1]['params']['type'], 'stb')
 
-    @patch('lib.auth.requests')
+    @patch('lib.auth.PortalSession')
     @patch('lib.auth.xbmcvfs')
     @patch('lib.auth.Logger')
-    def test_get_token_headers(self, mock_logger, mock_xbmcvfs, mock_requests):  # pylint: disable=unused-argument
+    def test_get_token_headers(self, mock_logger, mock_xbmcvfs, mock_session):  # pylint: disable=unused-argument
         """Test that get_token sends correct headers"""
         # Mock file operations
         mock_xbmcvfs.File.return_value.__enter__.return_value.read.return_value = '{"value": null}'
@@ -280,13 +390,13 @@ class TestAuth(unittest.TestCase):
         mock_response.status_code = 200
         mock_response.text = '{"js": {"token": "new_token_123"}}'
         mock_response.json.return_value = {"js": {"token": "new_token_123"}}
-        mock_requests.get.return_value = mock_response
+        mock_session.get.return_value = mock_response
 
         auth = Auth()
         auth.get_token(refresh_token=False)
 
         # Verify headers
-        call_args = mock_requests.get.call_args_list[0]
+        call_args = mock_session.get.call_args_list[0]
         headers = call_args[1]['headers']
 
         self.assertEqual(headers['Cookie'], G.portal_config.mac_cookie)
@@ -295,5 +405,119 @@ class TestAuth(unittest.TestCase):
         self.assertIn('Mozilla/5.0', headers['User-Agent'])
 
 
+class TestTokenStore(unittest.TestCase):
+    """Test TokenStore class"""
+
+    def setUp(self):
+        """Use a temporary profile directory"""
+        self.original_token_path = G.addon_config.token_path
+        G.addon_config.token_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Restore profile directory"""
+        TokenStore.clear()
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+        G.addon_config.token_path = self.original_token_path
+
+    def __write_file(self, value, mtime):
+        """Change token.json as another process would"""
+        with open(TokenStore.get_path(), 'w') as f:
+            json.dump({'value': value}, f)
+        os.utime(TokenStore.get_path(), (mtime, mtime))
+
+    def test_load_once(self):
+        """Test token.json is read only once while unchanged"""
+        self.__write_file('token_1', 1000)
+        with patch('lib.auth.xbmcvfs.File', wraps=xbmcvfs.File) as mock_file:
+            self.assertEqual(TokenStore.load().value, 'token_1')
+            self.assertIs(TokenStore.load(), TokenStore.load())
+            self.assertEqual(mock_file.call_count, 1)
+
+    def test_reload_on_change(self):
+        """Test token.json is read again when another process changed it"""
+        self.__write_file('token_1', 1000)
+        self.assertEqual(TokenStore.load().value, 'token_1')
+        self.__write_file('token_2', 2000)
+        self.assertEqual(TokenStore.load().value, 'token_2')
+
+    def test_save(self):
+        """Test saved token is kept in memory"""
+        token = Token(value='token_1')
+        self.assertIs(TokenStore.save(token), token)
+        self.assertIs(TokenStore.load(), token)
+        with open(TokenStore.get_path(), 'r') as f:
+            self.assertEqual(json.load(f)['value'], 'token_1')
+
+    def test_save_no_replace(self):
+        """Test a revalidated token does not overwrite a token saved by another process"""
+        self.__write_file('token_1', 1000)
+        token = TokenStore.load()
+        self.__write_file('token_2', 2000)
+        self.assertEqual(TokenStore.save(token, replace=False).value, 'token_2')
+        self.assertEqual(TokenStore.save(Token(value='token_3'), replace=False).value, 'token_3')
+
+    def test_clear(self):
+        """Test clear removes the token from memory and disk"""
+        TokenStore.save(Token(value='token_1'))
+        TokenStore.clear()
+        self.assertFalse(os.path.exists(TokenStore.get_path()))
+        self.assertIsNone(TokenStore.load().value)
+
+
+class TestSingleFlightHandshake(unittest.TestCase):
+    """Test handshakes are not repeated by concurrent invocations"""
+
+    def setUp(self):
+        """Use a temporary profile directory"""
+        self.original_token_path = G.addon_config.token_path
+        G.addon_config.token_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Restore profile directory"""
+        TokenStore.clear()
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+        G.addon_config.token_path = self.original_token_path
+
+    @staticmethod
+    def __portal_get(**kwargs):
+        """Slow portal issuing a new token on every handshake"""
+        time.sleep(0.05)
+        response = Mock(status_code=200, text='{"js": {}}')
+        if kwargs['params']['action'] == 'handshake':
+            response.json.return_value = {'js': {'token': 'token_{}'.format(time.time())}}
+        return response
+
+    @patch('lib.auth.PortalSession')
+    @patch('lib.auth.Logger')
+    def test_concurrent_get_token(self, mock_logger, mock_session):  # pylint: disable=unused-argument
+        """Test only one of several concurrent invocations makes the handshake"""
+        mock_session.get.side_effect = self.__portal_get
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(Auth().get_token(False))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        actions = [call[1]['params']['action'] for call in mock_session.get.call_args_list]
+        self.assertEqual(actions.count('handshake'), 1)
+        self.assertEqual(len(set(tokens)), 1)
+        self.assertTrue(os.path.exists(os.path.join(G.addon_config.token_path, 'token.lock')))
+
+    @patch('lib.auth.PortalSession')
+    @patch('lib.auth.Logger')
+    def test_discard_token(self, mock_logger, mock_session):  # pylint: disable=unused-argument
+        """Test a rejected token is replaced once, later invocations reuse the replacement"""
+        mock_session.get.side_effect = self.__portal_get
+        TokenStore.save(Token(value='rejected_token'))
+        first, second = Auth(), Auth()
+        first.discard_token('rejected_token')
+        second.discard_token('rejected_token')
+        new_token = first.get_token(False)
+        self.assertNotEqual(new_token, 'rejected_token')
+        self.assertEqual(second.get_token(False), new_token)
+        actions = [call[1]['params']['action'] for call in mock_session.get.call_args_list]
+        self.assertEqual(actions.count('handshake'), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
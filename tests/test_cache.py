@@ -0,0 +1,80 @@
+"""Test Module for cache.py"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from lib.cache import ResponseCache
+from lib.globals import G
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test ResponseCache class"""
+
+    def setUp(self):
+        """Use a temporary profile directory"""
+        self.original_token_path = G.addon_config.token_path
+        G.addon_config.token_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Restore profile directory"""
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+        G.addon_config.token_path = self.original_token_path
+
+    def test_put_get(self):
+        """Test stored value is returned"""
+        cache = ResponseCache('test', 10)
+        cache.put({'type': 'vod', 'action': 'get_categories'}, {'js': [1, 2]}, 60)
+        self.assertEqual(cache.get({'action': 'get_categories', 'type': 'vod'}), {'js': [1, 2]})
+        self.assertIsNone(cache.get({'type': 'itv', 'action': 'get_genres'}))
+
+    def test_expired(self):
+        """Test expired value is dropped"""
+        cache = ResponseCache('test', 10)
+        cache.put({'type': 'vod'}, {'js': []}, -1)
+        self.assertIsNone(cache.get({'type': 'vod'}))
+        self.assertEqual(os.listdir(os.path.join(G.addon_config.token_path, 'cache', 'test')), [])
+
+    def test_eviction(self):
+        """Test least recently used entries are evicted"""
+        cache = ResponseCache('test', 2)
+        cache.put({'type': 'vod', 'p': 1}, 1, 60)
+        time.sleep(0.01)
+        cache.put({'type': 'vod', 'p': 2}, 2, 60)
+        time.sleep(0.01)
+        self.assertEqual(cache.get({'type': 'vod', 'p': 1}), 1)
+        time.sleep(0.01)
+        cache.put({'type': 'vod', 'p': 3}, 3, 60)
+        self.assertEqual(cache.get({'type': 'vod', 'p': 1}), 1)
+        self.assertIsNone(cache.get({'type': 'vod', 'p': 2}))
+        self.assertEqual(cache.get({'type': 'vod', 'p': 3}), 3)
+
+    def test_invalidate(self):
+        """Test invalidate drops only the matching type"""
+        cache = ResponseCache('test', 10)
+        cache.put({'type': 'vod', 'p': 1}, 1, 60)
+        cache.put({'type': 'itv', 'p': 1}, 2, 60)
+        cache.invalidate('vod')
+        self.assertIsNone(cache.get({'type': 'vod', 'p': 1}))
+        self.assertEqual(cache.get({'type': 'itv', 'p': 1}), 2)
+
+    def test_clear_all(self):
+        """Test clear_all drops every cache"""
+        ResponseCache('one', 10).put({'type': 'vod'}, 1, 60)
+        ResponseCache('two', 10).put({'type': 'vod'}, 2, 60)
+        ResponseCache.clear_all()
+        self.assertIsNone(ResponseCache('one', 10).get({'type': 'vod'}))
+        self.assertIsNone(ResponseCache('two', 10).get({'type': 'vod'}))
+
+    def test_invalid_file(self):
+        """Test corrupt entry is ignored"""
+        cache = ResponseCache('test', 10)
+        cache.put({'type': 'vod'}, 1, 60)
+        cache_dir = os.path.join(G.addon_config.token_path, 'cache', 'test')
+        with open(os.path.join(cache_dir, os.listdir(cache_dir)[0]), 'w') as f:
+            f.write('invalid json')
+        self.assertIsNone(cache.get({'type': 'vod'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
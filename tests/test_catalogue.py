@@ -0,0 +1,239 @@
+"""Test Module for catalogue.py"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from lib.catalogue import Catalogue
+from lib.globals import G
+
+KEY = ('vod', '12', 0)
+
+
+def get_page(page, page_size=2, total_items=5, fav_ids=(), new_items=0):
+    """get_ordered_list response of a five item listing sorted by added, new_items are listed in front with ids -1, -2, ..."""
+    start = (page - 1) * page_size
+    data = [{'id': str(index), 'name': 'Movie {}'.format(index), 'fav': 1 if str(index) in fav_ids else 0, 'added': '2024-01-{:02d}'.format(20 - index)}
+            for index in range(-new_items, total_items)][start:start + page_size]
+    return {'total_items': str(total_items + new_items), 'max_page_items': page_size, 'data': data}
+
+
+class TestCatalogue(unittest.TestCase):
+    """Test Catalogue class"""
+
+    def setUp(self):
+        """Use a temporary profile directory"""
+        self.original_token_path = G.addon_config.token_path
+        G.addon_config.token_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Restore profile directory"""
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+        G.addon_config.token_path = self.original_token_path
+
+    def test_get_key(self):
+        """Test only whole categories and favorites listings are held, searches are keyed by the listing they search"""
+        self.assertEqual(Catalogue.get_key({'type': 'vod', 'action': 'get_ordered_list', 'category': '12', 'fav': 0, 'p': '1'}), KEY)
+        self.assertEqual(Catalogue.get_key({'type': 'itv', 'action': 'get_ordered_list', 'genre': '*', 'fav': '0'}), ('itv', '*', 0))
+        self.assertEqual(Catalogue.get_key({'type': 'series', 'action': 'get_ordered_list', 'fav': '1'}), ('series', '', 1))
+        self.assertEqual(Catalogue.get_key({'type': 'vod', 'action': 'get_ordered_list', 'category': '12', 'fav': 0, 'search': 'abc'}), KEY)
+        self.assertIsNone(Catalogue.get_key({'type': 'vod', 'action': 'get_ordered_list', 'category': '12', 'fav': '1'}))
+        self.assertIsNone(Catalogue.get_key({'type': 'series', 'action': 'get_ordered_list', 'movie_id': '1'}))
+        self.assertIsNone(Catalogue.get_key({'type': 'vod', 'action': 'get_categories'}))
+
+    def test_get_params(self):
+        """Test listing params match those of Api"""
+        self.assertEqual(Catalogue.get_params(('itv', '7', 0)), {'type': 'itv', 'action': 'get_ordered_list', 'sortby': 'number', 'genre': '7'})
+        self.assertEqual(Catalogue.get_params(('vod', '', 1)), {'type': 'vod', 'action': 'get_ordered_list', 'sortby': 'added', 'fav': '1'})
+
+    def test_sync(self):
+        """Test a listing is served once all its pages were stored"""
+        self.assertFalse(Catalogue.exists())
+        with Catalogue() as catalogue:
+            self.assertEqual(catalogue.get_sync_state(KEY), (None, None, 1))
+            self.assertFalse(catalogue.add_page(KEY, 1, get_page(1)))
+            self.assertFalse(catalogue.add_page(KEY, 2, get_page(2)))
+            self.assertIsNone(catalogue.get_listing(KEY, 1, 2, 3600))
+            self.assertEqual(catalogue.get_sync_state(KEY), (None, None, 3))
+            self.assertTrue(catalogue.add_page(KEY, 3, get_page(3)))
+            age, full_age, page = catalogue.get_sync_state(KEY)
+            self.assertLess(age, 60)
+            self.assertLess(full_age, 60)
+            self.assertEqual(page, 1)
+            listing = catalogue.get_listing(KEY, 1, 2, 3600)
+            self.assertEqual(listing['total_items'], 5)
+            self.assertEqual(listing['max_page_items'], 2)
+            self.assertEqual([item['id'] for item in listing['data']], ['0', '1', '2', '3'])
+            self.assertEqual([item['id'] for item in catalogue.get_listing(KEY, 3, 2, 3600)['data']], ['4'])
+        self.assertTrue(Catalogue.exists())
+
+    def test_portal_changed(self):
+        """Test the listings of another portal or MAC are dropped by the sync only"""
+        with Catalogue() as catalogue:
+            for page in (1, 2, 3):
+                catalogue.add_page(KEY, page, get_page(page))
+            catalogue.update_trigram_index()
+        with patch.object(G.portal_config, 'mac_cookie', 'mac=00:1A:79:00:00:01'):
+            # The plugin serves none of it and leaves it to the sync
+            with Catalogue() as catalogue:
+                self.assertIsNone(catalogue.get_listing(KEY, 1, 2, 3600))
+                self.assertIsNone(catalogue.search(KEY, 'movie', 1, 2, 3600))
+        with Catalogue() as catalogue:
+            self.assertEqual(catalogue.get_listing(KEY, 1, 2, 3600)['total_items'], 5)
+        with patch.object(G.portal_config, 'mac_cookie', 'mac=00:1A:79:00:00:01'):
+            with Catalogue(sync=True) as catalogue:
+                self.assertFalse(os.path.exists(Catalogue.get_trigram_path()))
+                self.assertIsNone(catalogue.get_listing(KEY, 1, 2, 3600))
+                catalogue.add_page(KEY, 1, get_page(1, page_size=5))
+            with Catalogue() as catalogue:
+                self.assertEqual(len(catalogue.get_listing(KEY, 1, 2, 3600)['data']), 5)
+
+    def test_resync(self):
+        """Test the previous generation is served until a new sync completes"""
+        with Catalogue() as catalogue:
+            for page in (1, 2, 3):
+                catalogue.add_page(KEY, page, get_page(page))
+            catalogue.add_page(KEY, 1, get_page(1, total_items=3))
+            self.assertEqual(catalogue.get_listing(KEY, 1, 5, 3600)['total_items'], 5)
+            catalogue.add_page(KEY, 2, get_page(2, total_items=3))
+            listing = catalogue.get_listing(KEY, 1, 5, 3600)
+            self.assertEqual(listing['total_items'], 3)
+            self.assertEqual([item['id'] for item in listing['data']], ['0', '1', '2'])
+
+    def test_incremental(self):
+        """Test an incremental sync stops at the watermark and puts new items in front"""
+        with Catalogue() as catalogue:
+            for page in (1, 2, 3):
+                catalogue.add_page(KEY, page, get_page(page))
+            with patch('lib.catalogue.time.time', return_value=time.time() + 60):
+                self.assertFalse(catalogue.add_page(KEY, 1, get_page(1, new_items=3), True))
+                self.assertEqual(catalogue.get_sync_state(KEY)[2], 2)
+                self.assertFalse(catalogue.add_page(KEY, 2, get_page(2, new_items=3), True))
+                # Item 0 has the watermark timestamp, its page also holds an older one
+                self.assertTrue(catalogue.add_page(KEY, 3, get_page(3, new_items=3), True))
+                age, full_age, _ = catalogue.get_sync_state(KEY)
+            self.assertLess(age, full_age)
+            listing = catalogue.get_listing(KEY, 1, 5, 3600)
+            self.assertEqual(listing['total_items'], 8)
+            self.assertEqual([item['id'] for item in listing['data']], ['-3', '-2', '-1', '0', '1', '2', '3', '4'])
+            # Nothing new, the first page reaches the watermark
+            self.assertTrue(catalogue.add_page(KEY, 1, get_page(1, new_items=3), True))
+            self.assertEqual(catalogue.get_listing(KEY, 1, 5, 3600)['total_items'], 8)
+
+    def test_incremental_without_watermark(self):
+        """Test a listing without added timestamps is synced in full"""
+        page = {'total_items': '1', 'max_page_items': 2, 'data': [{'id': '1'}]}
+        with Catalogue() as catalogue:
+            catalogue.add_page(KEY, 1, page)
+            catalogue.add_page(KEY, 1, dict(page, data=[{'id': '2'}]), True)
+            self.assertEqual([item['id'] for item in catalogue.get_listing(KEY, 1, 1, 3600)['data']], ['2'])
+
+    def test_search(self):
+        """Test search folds case and diacritics and ranks name matches first"""
+        data = [{'id': '1', 'name': 'Le Fabuleux Destin d\'Amélie Poulain', 'description': 'Paris', 'actors': 'Audrey Tautou', 'director': ''},
+                {'id': '2', 'name': 'Paris, Texas', 'description': 'A drifter', 'actors': 'Harry Dean Stanton', 'director': 'Wim Wenders'},
+                {'id': '3', 'name': 'Midnight', 'description': 'Nights in PARIS', 'actors': '', 'director': 'Woody Allen'}]
+        with Catalogue() as catalogue:
+            catalogue.add_page(KEY, 1, {'total_items': '3', 'max_page_items': 10, 'data': data})
+            catalogue.add_page(('vod', '*', 0), 1, {'total_items': '3', 'max_page_items': 10, 'data': data})
+            self.assertEqual([item['id'] for item in catalogue.search(KEY, 'AMELIE', 1, 1, 3600)['data']], ['1'])
+            self.assertEqual([item['id'] for item in catalogue.search(KEY, 'paris', 1, 1, 3600)['data']][0], '2')
+            self.assertEqual([item['id'] for item in catalogue.search(KEY, 'wend', 1, 1, 3600)['data']], ['2'])
+            self.assertEqual([item['id'] for item in catalogue.search(KEY, 'paris allen', 1, 1, 3600)['data']], ['3'])
+            self.assertEqual(catalogue.search(KEY, 'berlin', 1, 1, 3600)['total_items'], 0)
+            self.assertEqual(catalogue.search(KEY, '"*', 1, 1, 3600)['total_items'], 0)
+            self.assertIsNone(catalogue.search(('vod', '15', 0), 'paris', 1, 1, 3600))
+            # Item 1 is gone from both categories after a full sync
+            catalogue.add_page(KEY, 1, {'total_items': '2', 'max_page_items': 10, 'data': data[1:]})
+            catalogue.add_page(('vod', '*', 0), 1, {'total_items': '2', 'max_page_items': 10, 'data': data[1:]})
+            self.assertEqual([item['id'] for item in catalogue.search(('vod', '*', 0), 'paris', 1, 1, 3600)['data']], ['2', '3'])
+
+    def test_merge_listings(self):
+        """Test All is the union of the synced categories, merged again once one was synced"""
+        all_key = ('vod', '*', 0)
+        with Catalogue() as catalogue:
+            for page in (1, 2, 3):
+                catalogue.add_page(KEY, page, get_page(page))
+            self.assertFalse(catalogue.merge_listings('vod', ['12', '15']))
+            for page in (1, 2):
+                catalogue.add_page(('vod', '15', 0), page, get_page(page, total_items=2, new_items=2))
+            self.assertTrue(catalogue.merge_listings('vod', ['12', '15']))
+            self.assertFalse(catalogue.merge_listings('vod', ['12', '15']))
+            listing = catalogue.get_listing(all_key, 1, 2, 3600)
+            self.assertEqual(listing['total_items'], 7)
+            self.assertEqual([item['id'] for item in listing['data']], ['-2', '-1', '0', '1'])
+            self.assertEqual([item['id'] for item in catalogue.get_listing(all_key, 3, 2, 3600)['data']], ['2', '3', '4'])
+            with patch('lib.catalogue.time.time', return_value=time.time() + 60):
+                catalogue.add_page(('vod', '15', 0), 1, get_page(1, total_items=1))
+                self.assertTrue(catalogue.merge_listings('vod', ['12', '15']))
+            self.assertEqual(catalogue.get_listing(all_key, 1, 10, 3600)['total_items'], 5)
+
+    def test_search_trigrams(self):
+        """Test a search matching nothing lists completions and then similar titles of the listing"""
+        data = [{'id': '1', 'name': 'The Matrix'}, {'id': '2', 'name': 'The Matrix Reloaded'}, {'id': '3', 'name': 'Stargate'}]
+        with Catalogue() as catalogue:
+            catalogue.add_page(KEY, 1, {'total_items': '2', 'max_page_items': 10, 'data': data[1:]})
+            self.assertEqual(catalogue.search(KEY, 'matirx', 1, 1, 3600)['total_items'], 0)
+            self.assertTrue(catalogue.update_trigram_index())
+            self.assertFalse(catalogue.update_trigram_index())
+            self.assertEqual([item['id'] for item in catalogue.search(KEY, 'matirx', 1, 1, 3600)['data']], ['2'])
+            catalogue.add_page(('vod', '*', 0), 1, {'total_items': '3', 'max_page_items': 10, 'data': data})
+            with patch('lib.catalogue.time.time', return_value=time.time() + 60):
+                catalogue.add_page(('vod', '*', 0), 1, {'total_items': '3', 'max_page_items': 10, 'data': data})
+                self.assertTrue(catalogue.update_trigram_index())
+            self.assertEqual([item['id'] for item in catalogue.search(('vod', '*', 0), 'the matirx', 1, 1, 3600)['data']], ['1', '2'])
+        Catalogue.clear()
+        self.assertFalse(os.path.exists(Catalogue.get_trigram_path()))
+
+    @patch.object(Catalogue, '_Catalogue__SEARCH_LIMIT', 2)
+    def test_search_small_listing(self):
+        """Test matches of a listing are found when the best matches are all in other listings"""
+        with Catalogue() as catalogue:
+            catalogue.add_page(('vod', '*', 0), 1, {'total_items': '20', 'max_page_items': 20,
+                                                    'data': [{'id': str(index), 'name': 'Paris {}'.format(index)} for index in range(20)]})
+            catalogue.add_page(KEY, 1, {'total_items': '2', 'max_page_items': 20,
+                                        'data': [{'id': '30', 'name': 'Texas', 'description': 'Paris'}, {'id': '31', 'name': 'Paris Texas'}]})
+            self.assertEqual([item['id'] for item in catalogue.search(KEY, 'paris', 1, 1, 3600)['data']], ['31', '30'])
+            self.assertEqual(len(catalogue.search(('vod', '*', 0), 'paris', 1, 1, 3600)['data']), 2)
+
+    def test_get_match_query(self):
+        """Test words are quoted prefix terms"""
+        self.assertEqual(Catalogue.get_match_query('Amélie  "Poulain" OR'), '"Amélie"* "Poulain"* "OR"*')
+        self.assertEqual(Catalogue.get_match_query(' - '), '')
+
+    def test_expired(self):
+        """Test a listing older than max_age is not served"""
+        with Catalogue() as catalogue:
+            catalogue.add_page(KEY, 1, get_page(1, total_items=2))
+            with patch('lib.catalogue.time.time', return_value=time.time() + 7200):
+                self.assertIsNone(catalogue.get_listing(KEY, 1, 2, 3600))
+                self.assertGreater(catalogue.get_sync_state(KEY)[0], 3600)
+
+    def test_set_favorite(self):
+        """Test fav flags are updated and the favorites listing is dropped"""
+        fav_key = ('vod', '', 1)
+        with Catalogue() as catalogue:
+            catalogue.add_page(KEY, 1, get_page(1, total_items=2, fav_ids=('1',)))
+            catalogue.add_page(fav_key, 1, get_page(1, total_items=1))
+            catalogue.set_favorite('vod', '0', True)
+            catalogue.set_favorite('vod', '1', False)
+            self.assertEqual([item['fav'] for item in catalogue.get_listing(KEY, 1, 1, 3600)['data']], [1, 0])
+            self.assertIsNone(catalogue.get_listing(fav_key, 1, 1, 3600))
+            self.assertEqual(catalogue.get_sync_state(fav_key), (None, None, 1))
+
+    def test_is_incremental(self):
+        """Test only listings sorted by added are synced incrementally"""
+        self.assertTrue(Catalogue.is_incremental(KEY))
+        self.assertFalse(Catalogue.is_incremental(('itv', '*', 0)))
+        self.assertFalse(Catalogue.is_incremental(('series', '', 1)))
+
+    def test_clear(self):
+        """Test the database files are deleted"""
+        Catalogue().close()
+        Catalogue.clear()
+        self.assertFalse(Catalogue.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
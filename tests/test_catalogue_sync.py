@@ -0,0 +1,181 @@
+"""Test Module for catalogue_sync.py"""
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from lib.api import Api
+from lib.auth import TokenStore
+from lib.catalogue import Catalogue
+from lib.catalogue_sync import CatalogueSync
+from lib.globals import G
+from lib.session import PortalSession
+from tests.fake_portal import FakePortal
+
+
+class TestCatalogueSync(unittest.TestCase):
+    """Test CatalogueSync against the local portal emulator"""
+
+    @patch('sys.argv', ['plugin://plugin.video.stalkervod/', '1'])
+    def setUp(self):
+        """Point the addon at a fresh emulator and profile directory"""
+        G.init_globals()
+        self.original_config = (G.portal_config.portal_url, G.addon_config.token_path, G.addon_config.max_page_limit,
+                                G.addon_config.catalogue_max_age, G.addon_config.catalogue_pages_per_minute)
+        G.addon_config.token_path = tempfile.mkdtemp()
+        G.addon_config.max_page_limit = 2
+        G.addon_config.catalogue_max_age = 3600
+        G.addon_config.catalogue_pages_per_minute = 1000
+        self.portal = FakePortal(catalogue_size=30, page_size=10).start()
+        G.portal_config.portal_url = self.portal.url
+
+    def tearDown(self):
+        """Stop the emulator and restore config"""
+        self.portal.stop()
+        PortalSession.close()
+        TokenStore.clear()
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+        (G.portal_config.portal_url, G.addon_config.token_path, G.addon_config.max_page_limit,
+         G.addon_config.catalogue_max_age, G.addon_config.catalogue_pages_per_minute) = self.original_config
+
+    def __get_synced_pages(self):
+        """Listing pages requested from the portal"""
+        return [params for params in self.portal.requests if params['action'] == 'get_ordered_list']
+
+    @patch('lib.catalogue_sync.Logger')
+    def test_auth_failure(self, mock_logger):
+        """Test a portal refusing the handshake is retried later instead of failing the service"""
+        G.portal_config.portal_url = self.portal.url.replace('load.php', 'missing.php')
+        sync = CatalogueSync()
+        sync.run()
+        mock_logger.warn.assert_called_once()
+        requests = len(self.portal.requests)
+        sync.run()
+        self.assertEqual(len(self.portal.requests), requests)
+
+    def test_sync(self):
+        """Test listings are served from the catalogue once synced"""
+        sync = CatalogueSync()
+        for _ in range(10):
+            sync.run()
+        # 3 favorites listings of one page and 6 categories of 3 pages, All is merged from the categories
+        self.assertEqual(len(self.__get_synced_pages()), 21)
+        self.portal.reset_stats()
+        # Nothing is due, the catalogue is only checked again a few minutes later
+        with patch('lib.catalogue_sync.Catalogue') as mock_catalogue:
+            sync.run()
+            mock_catalogue.assert_not_called()
+        with patch('lib.catalogue_sync.time.time', return_value=time.time() + 601):
+            sync.run()
+        self.assertEqual(self.__get_synced_pages(), [])
+        videos = Api.get_videos('12', 3, '', 0, stream=True)
+        self.assertEqual(videos['total_items'], 30)
+        self.assertEqual([video['name'] for video in videos['data']], ['Movie {}'.format(number) for number in range(21, 31)])
+        self.assertEqual([channel['id'] for channel in Api.get_tv_channels('*', 1, '', 0)['data']][:2], ['300000', '300001'])
+        # Words match as prefixes
+        self.assertEqual([video['name'] for video in Api.get_videos('12', 1, 'movie 3', 0)['data']], ['Movie 3', 'Movie 30'])
+        # A typo matches by trigrams once all listings were synced
+        self.assertEqual([video['name'] for video in Api.get_videos('12', 1, 'Moive 3', 0)['data']], ['Movie 3'])
+        self.assertEqual(self.portal.requests, [])
+        # A search of a listing which was not synced goes to the portal
+        self.assertEqual(Api.get_videos('99', 1, 'Movie 3', 0)['total_items'], '2')
+
+    def test_resume(self):
+        """Test a sync continues at the page it stopped at"""
+        sync = CatalogueSync()
+        sync.run()
+        self.assertEqual(len(self.__get_synced_pages()), 4)
+        sync = CatalogueSync()
+        sync.run()
+        pages = self.__get_synced_pages()
+        self.assertEqual([(params['type'], params.get('category'), params['p']) for params in pages[4:]],
+                         [('vod', '12', '2'), ('vod', '12', '3'), ('vod', '15', '1'), ('vod', '15', '2')])
+
+    def test_incremental(self):
+        """Test a refresh fetches only new items and a full sync drops deleted ones"""
+        sync = CatalogueSync()
+        for _ in range(10):
+            sync.run()
+        self.portal.catalogues['vod'].add_items(3)
+        self.portal.catalogues['vod'].deleted.add('100005')
+        self.portal.reset_stats()
+        with patch('lib.catalogue.time.time', return_value=time.time() + 3600):
+            for _ in range(10):
+                sync.run()
+            # One page for each VOD and series category, TV and favorites are synced in full
+            self.assertEqual(len(self.__get_synced_pages()), 13)
+            videos = Api.get_videos('*', 1, '', 0)
+            self.assertEqual(videos['total_items'], 33)
+            self.assertEqual([video['id'] for video in videos['data']][:4], ['100032', '100031', '100030', '100000'])
+        self.portal.reset_stats()
+        with patch('lib.catalogue.time.time', return_value=time.time() + 8 * 24 * 3600):
+            for _ in range(10):
+                sync.run()
+            # VOD categories now hold 32 items in 4 pages
+            self.assertEqual(len(self.__get_synced_pages()), 3 + 2 * 4 + 4 * 3)
+            videos = Api.get_videos('*', 1, '', 0)
+            self.assertEqual(videos['total_items'], 32)
+            self.assertNotIn('100005', [video['id'] for video in videos['data']])
+
+    def test_favorites(self):
+        """Test toggling a favorite updates the catalogue"""
+        sync = CatalogueSync()
+        for _ in range(10):
+            sync.run()
+        Api.add_favorites('100003', 'vod')
+        self.assertEqual(Api.get_videos('*', 1, '', 0)['data'][3]['fav'], 1)
+        self.portal.reset_stats()
+        self.assertEqual([video['id'] for video in Api.get_vod_favorites(1)['data']], ['100003'])
+        self.assertEqual(len(self.__get_synced_pages()), 1)
+        sync.run()
+        self.portal.reset_stats()
+        self.assertEqual([video['id'] for video in Api.get_vod_favorites(1)['data']], ['100003'])
+        self.assertEqual(self.portal.requests, [])
+
+    def test_disabled(self):
+        """Test nothing is synced or served with catalogue_max_age 0"""
+        G.addon_config.catalogue_max_age = 0
+        CatalogueSync().run()
+        self.assertFalse(Catalogue.exists())
+        self.assertEqual(self.portal.requests, [])
+
+    @patch('lib.catalogue_sync.Logger')
+    def test_failing_listing(self, mock_logger):
+        """Test a listing which always fails is retried later while the others are synced and merged"""
+        get_ordered_list_page = Api.get_ordered_list_page
+
+        def get_page(params, page):
+            if (params['type'], params.get('category')) == ('vod', '12'):
+                raise ValueError('Malformed response')
+            return get_ordered_list_page(params, page)
+
+        sync = CatalogueSync()
+        with patch('lib.catalogue_sync.Api.get_ordered_list_page', side_effect=get_page) as mock_get_page:
+            for _ in range(10):
+                sync.run()
+            # 3 favorites listings of one page and 5 categories of 3 pages, the failing one was tried once
+            self.assertEqual(len(self.__get_synced_pages()), 18)
+            self.assertEqual([(call[0][0]['type'], call[0][0].get('category')) for call in mock_get_page.call_args_list].count(('vod', '12')), 1)
+            mock_logger.warn.assert_called_once()
+            self.assertIn('retrying in 60 seconds', mock_logger.warn.call_args[0][0])
+            with patch('lib.catalogue_sync.time.time', return_value=time.time() + 601):
+                sync.run()
+            self.assertIn('retrying in 120 seconds', mock_logger.warn.call_args[0][0])
+        self.portal.reset_stats()
+        self.assertEqual(Api.get_videos('*', 1, '', 0)['total_items'], 30)
+        self.assertEqual(self.portal.requests, [])
+
+    def test_failure(self):
+        """Test a failed sync is retried later"""
+        self.portal.faults = [500] * 10
+        sync = CatalogueSync()
+        with patch('lib.catalogue_sync.Logger') as mock_logger:
+            sync.run()
+            mock_logger.warn.assert_called_once()
+        self.portal.reset_stats()
+        sync.run()
+        self.assertEqual(self.portal.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -75,6 +75,27 @@ class TestGlobals(unittest.TestCase):
         self.assertEqual(G.portal_config.portal_base_url, 'http://xyz.com')
         self.assertEqual(G.portal_config.server_address, 'http://xyz.com/stalker_portal/c/')
         self.assertEqual(G.portal_config.portal_url, 'http://xyz.com/stalker_portal/server/load.php')
+        self.assertEqual(G.addon_config.pool_size, 4)
+
+    @patch('sys.argv', ['plugin://plugin.video.stalkervod/', '1'])
+    def test_1_init_globals_reloads_settings(self):
+        """Test settings changed since the first run are read again from a new Addon, unset ones fall back to defaults"""
+        original_addon = getattr(G, '_GlobalVariables__addon')
+        try:
+            G.init_globals()
+            token_path = G.addon_config.token_path
+            settings = {'mac_address': '00:1A:79:00:00:02', 'server_address': 'http://other.com/stalker_portal/c/', 'read_timeout': '30'}
+            with patch('lib.globals.xbmcaddon') as mock_xbmcaddon:
+                mock_xbmcaddon.Addon.return_value.getSetting.side_effect = lambda setting_id: settings.get(setting_id, '')
+                G.init_globals()
+            self.assertEqual(G.portal_config.mac_cookie, 'mac=00:1A:79:00:00:02')
+            self.assertEqual(G.portal_config.portal_url, 'http://other.com/stalker_portal/server/load.php')
+            self.assertEqual(G.addon_config.read_timeout, 30)
+            self.assertEqual(G.addon_config.pool_size, 4)
+            self.assertEqual(G.addon_config.token_path, token_path)
+        finally:
+            setattr(G, '_GlobalVariables__addon', original_addon)
+            G.init_globals()
 
     def test_2_get_handle(self):
         """Test get_handle"""
@@ -0,0 +1,71 @@
+"""Test Module for json_stream.py"""
+import json
+import unittest
+from lib.json_stream import ListingStream
+
+RESPONSE = {'js': {'total_items': '3', 'max_page_items': 14, 'data': [{'id': '1', 'name': 'Café'}, {'id': 2.5}, [1, 2]], 'cur_page': 12345},
+            'text': 'ok'}
+
+
+def get_chunks(body, size):
+    """Body split into chunks of size bytes"""
+    return [body[start:start + size] for start in range(0, len(body), size)]
+
+
+class TestListingStream(unittest.TestCase):
+    """Test ListingStream class"""
+
+    def test_iter_data(self):
+        """Test items and fields are parsed whatever the chunk boundaries"""
+        body = json.dumps(RESPONSE, ensure_ascii=False).encode('utf-8')
+        for size in (1, 2, 5, 64, len(body)):
+            stream = ListingStream(get_chunks(body, size))
+            self.assertEqual(stream.read_fields(), {'total_items': '3', 'max_page_items': 14})
+            self.assertEqual(list(stream.iter_data()), RESPONSE['js']['data'])
+            self.assertEqual(stream.fields['cur_page'], 12345)
+
+    def test_split_numbers(self):
+        """Test numbers split at any character, within the fraction or the exponent, are read whole"""
+        body = b'{"js": {"data": [1.5, -0.25e+3, 2E-2, 10, -7], "total_items": 1e2}}'
+        for size in range(1, len(body) + 1):
+            for start in range(size):
+                chunks = [body[:start]] + get_chunks(body[start:], size) if start else get_chunks(body, size)
+                stream = ListingStream(chunks)
+                self.assertEqual(list(stream.iter_data()), [1.5, -250.0, 0.02, 10, -7])
+                self.assertEqual(stream.fields, {'total_items': 100.0})
+        stream = ListingStream([b'{"js": {"data": [1.', b'5], "total_items": 1}}'])
+        self.assertEqual(list(stream.iter_data()), [1.5])
+
+    def test_iter_data_reads_body(self):
+        """Test the body is read to its end once all items were read"""
+        chunks = iter(get_chunks(json.dumps(RESPONSE).encode('utf-8'), 5))
+        self.assertEqual(len(list(ListingStream(chunks).iter_data())), 3)
+        self.assertIsNone(next(chunks, None))
+
+    def test_empty_and_missing_data(self):
+        """Test listings without items"""
+        stream = ListingStream([b'{"js": {"data": [], "total_items": 0}}'])
+        self.assertEqual(list(stream.iter_data()), [])
+        self.assertEqual(stream.fields, {'total_items': 0})
+        stream = ListingStream([b'{"js": {"total_items": 0}}'])
+        self.assertEqual(list(stream.iter_data()), [])
+
+    def test_get_head(self):
+        """Test the start of the body can be checked before parsing"""
+        stream = ListingStream(get_chunks(b'{"js": {"data": [1, 2]}}', 3))
+        self.assertEqual(stream.get_head(8), '{"js": {')
+        self.assertEqual(list(stream.iter_data()), [1, 2])
+        self.assertEqual(ListingStream([b'Authorization failed.']).get_head(), 'Authorization failed.')
+
+    def test_invalid(self):
+        """Test bodies which are not listings"""
+        with self.assertRaises(ValueError):
+            list(ListingStream([b'Authorization failed.']).iter_data())
+        with self.assertRaises(ValueError):
+            list(ListingStream([b'{"js": true}']).iter_data())
+        with self.assertRaises(ValueError):
+            list(ListingStream([b'{"js": {"data": [1, 2}}']).iter_data())
+
+
+if __name__ == '__main__':
+    unittest.main()
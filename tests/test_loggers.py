@@ -1,12 +1,20 @@
 """Test Module for addon.py"""
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from lib.loggers import Logger
 
 
 class TestLogger(unittest.TestCase):
     """TestLogger class"""
 
+    def setUp(self):
+        """Check the debug logging setting again"""
+        Logger.reset()
+
+    def tearDown(self):
+        """Do not leak a mocked debug logging setting"""
+        Logger.reset()
+
     @patch('lib.loggers.xbmc')
     def test_info(self, mock_xbmc):
         """Test run"""
@@ -34,3 +42,27 @@ class TestLogger(unittest.TestCase):
         with patch.object(mock_xbmc, 'LOGDEBUG', 0):
             Logger.debug('test')
             mock_xbmc.log.assert_called_with('plugin.video.stalkervod: test', 0)
+
+    @patch('lib.loggers.xbmc')
+    def test_args(self, mock_xbmc):
+        """Test deferred arguments are formatted into the message"""
+        with patch.object(mock_xbmc, 'LOGINFO', 1):
+            Logger.info('test %s %d', 'a', 1)
+            mock_xbmc.log.assert_called_with('plugin.video.stalkervod: test a 1', 1)
+            Logger.info('test %(name)s', {'name': 'a'})
+            mock_xbmc.log.assert_called_with('plugin.video.stalkervod: test a', 1)
+
+    @patch('lib.loggers.xbmc')
+    def test_debug_disabled(self, mock_xbmc):
+        """Test debug messages are not formatted while debug logging is off"""
+        mock_xbmc.executeJSONRPC.return_value = '{"id": 1, "jsonrpc": "2.0", "result": {"value": false}}'
+        params = MagicMock()
+        Logger.debug('test %s', params)
+        Logger.debug('test %s', params)
+        mock_xbmc.log.assert_not_called()
+        params.__str__.assert_not_called()  # pylint: disable=no-member
+        mock_xbmc.executeJSONRPC.assert_called_once()
+        Logger.reset()
+        mock_xbmc.executeJSONRPC.return_value = '{"id": 1, "jsonrpc": "2.0", "result": {"value": true}}'
+        Logger.debug('test %s', 'a')
+        mock_xbmc.log.assert_called_once_with('plugin.video.stalkervod: test a', mock_xbmc.LOGDEBUG)
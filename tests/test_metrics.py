@@ -0,0 +1,91 @@
+"""Test Module for metrics.py"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch, Mock, PropertyMock
+from lib.metrics import Metrics
+from lib.globals import G
+
+
+class TestMetrics(unittest.TestCase):
+    """Test Metrics class"""
+
+    def setUp(self):
+        """Use a temporary profile directory"""
+        self.original_config = (G.addon_config.token_path, G.addon_config.trace_requests)
+        G.addon_config.token_path = tempfile.mkdtemp()
+        Metrics.start()
+
+    def tearDown(self):
+        """Restore profile directory"""
+        shutil.rmtree(G.addon_config.token_path, ignore_errors=True)
+        G.addon_config.token_path, G.addon_config.trace_requests = self.original_config
+
+    @staticmethod
+    def __record_calls():
+        """Record a listing open"""
+        Metrics.increment('cache_miss')
+        Metrics.increment('handshake')
+        Metrics.record_call({'type': 'stb', 'action': 'handshake'}, 0.05, Mock(status_code=200, content=b'{"js": {}}', headers={}, raw=None), 0)
+        Metrics.record_call({'type': 'vod', 'action': 'get_ordered_list', 'p': '1'}, 0.25, Mock(status_code=200, content=b'x' * 100, headers={'Content-Encoding': 'gzip'},
+                                                                                                   raw=Mock(tell=Mock(return_value=30))), 1)
+        Metrics.record_call({'type': 'vod', 'action': 'get_ordered_list', 'p': '2'}, 0.1, None, 2)
+
+    def test_summary(self):
+        """Test summary line aggregates calls and counters"""
+        self.__record_calls()
+        summary = Metrics.get_summary()
+        self.assertIn('3 portal calls in 400 ms, 110 bytes (40 transferred), 3 retries', summary)
+        self.assertIn('cache 0 hits, 1 misses; 1 handshakes, 0 revalidations, 0 auth retries', summary)
+        self.assertIn('slowest vod/get_ordered_list 250 ms', summary)
+
+    def test_record_streamed_call(self):
+        """Test a streamed body is not read when the call is recorded, its sizes are once it was read to the end"""
+        response = Mock(status_code=200, headers={'Content-Encoding': 'gzip'}, raw=Mock(tell=Mock(return_value=12)))
+        type(response).content = PropertyMock(side_effect=AssertionError('Body read'))
+        response.iter_content.return_value = [b'x' * 10, b'x' * 20]
+        Metrics.record_call({'type': 'itv', 'action': 'get_ordered_list'}, 0.01, response, 0, streamed=True)
+        self.assertIn('0 bytes (0 transferred)', Metrics.get_summary())
+        chunks = Metrics.iter_content(response, 10)
+        next(chunks)
+        self.assertIn('0 bytes (0 transferred)', Metrics.get_summary())
+        self.assertEqual(len(list(chunks)), 1)
+        self.assertIn('30 bytes (12 transferred)', Metrics.get_summary())
+
+    def test_start_resets(self):
+        """Test a new invocation starts from zero"""
+        self.__record_calls()
+        Metrics.start()
+        self.assertTrue(Metrics.get_summary().startswith('0 portal calls in 0 ms, 0 bytes (0 transferred), 0 retries; cache 0 hits, 0 misses'))
+
+    @patch('lib.metrics.Logger')
+    def test_finish(self, mock_logger):
+        """Test summary is logged and no trace written by default"""
+        G.addon_config.trace_requests = False
+        self.__record_calls()
+        Metrics.finish('action=vod_listing')
+        self.assertTrue(mock_logger.info.call_args[0][0].startswith('action=vod_listing: 3 portal calls'))
+        self.assertFalse(os.path.exists(os.path.join(G.addon_config.token_path, 'trace.jsonl')))
+
+    @patch('lib.metrics.Logger')
+    def test_finish_trace(self, mock_logger):  # pylint: disable=unused-argument
+        """Test calls and counters are appended as JSON lines"""
+        G.addon_config.trace_requests = True
+        self.__record_calls()
+        Metrics.finish('action=vod_listing')
+        Metrics.finish('action=vod_listing')
+        with open(os.path.join(G.addon_config.token_path, 'trace.jsonl'), 'r') as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 8)
+        self.assertEqual(records[1]['action'], 'get_ordered_list')
+        self.assertEqual(records[1]['latency_ms'], 250)
+        self.assertEqual((records[1]['bytes'], records[1]['transferred'], records[1]['encoding']), (100, 30, 'gzip'))
+        self.assertEqual(records[2]['status'], None)
+        self.assertEqual(records[3], {'invocation': 'action=vod_listing', 'started': records[0]['started'], 'summary': True,
+                                      'cache_miss': 1, 'handshake': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Test Module for models.py"""
+import os
+import json
+import unittest
+from lib.models import VodItem, SeriesItem, Channel, get_poster_url
+from lib.globals import G
+
+RESPONSES_DIR = os.path.join(os.path.dirname(__file__), 'responses')
+
+
+def load_response(file_name):
+    """js of a fixture response"""
+    with open(os.path.join(RESPONSES_DIR, file_name), 'r') as f:
+        return json.load(f)['js']
+
+
+class TestModels(unittest.TestCase):
+    """Test listing item models"""
+
+    def setUp(self):
+        """Set the portal base url"""
+        self.original_base_url = G.portal_config.portal_base_url
+        G.portal_config.portal_base_url = 'http://portal.example'
+
+    def tearDown(self):
+        """Restore the portal base url"""
+        G.portal_config.portal_base_url = self.original_base_url
+
+    def test_vod_item(self):
+        """Test VOD records are normalised"""
+        video = next(VodItem.from_response(load_response('videos.json')))
+        self.assertEqual(video.id, '49831')
+        self.assertEqual(video.name, 'The Blacklist S10')
+        self.assertTrue(video.hd)
+        self.assertTrue(video.fav)
+        self.assertEqual(video.poster_url, 'http://portal.example/stalker_portal/screenshots/507/50628.jpg')
+        self.assertEqual(video.series[0], 1)
+        self.assertEqual(video.duration, 45)
+        self.assertEqual(video.year, 2023)
+        self.assertEqual(video.actors[:2], ('James Spader', ' Diego Klattenhoff'))
+        self.assertFalse(hasattr(video, '__dict__'))
+
+    def test_series_item(self):
+        """Test series keep the shared fields only"""
+        series = SeriesItem({'id': '1', 'name': 'Series', 'hd': 0, 'actors': '', 'year': 'unknown'})
+        self.assertFalse(series.hd)
+        self.assertFalse(series.fav)
+        self.assertIsNone(series.poster_url)
+        self.assertIsNone(series.country)
+        self.assertEqual(series.actors, ())
+        self.assertEqual(series.year, 0)
+        self.assertFalse(hasattr(series, 'cmd'))
+
+    def test_channel(self):
+        """Test channel records are normalised"""
+        channel = next(Channel.from_response(load_response('channels.json')))
+        self.assertEqual(channel.id, '153')
+        self.assertEqual(channel.cmd, 'ffrt http://localhost/ch/353')
+        self.assertEqual(channel.use_http_tmp_link, '1')
+        self.assertEqual(channel.logo, '')
+        self.assertFalse(channel.fav)
+
+    def test_get_poster_url(self):
+        """Test absolute screenshot urls are kept"""
+        self.assertEqual(get_poster_url({'screenshot_uri': 'https://cdn.example/a.jpg'}), 'https://cdn.example/a.jpg')
+        self.assertIsNone(get_poster_url({'screenshot_uri': None}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+"""Test Module for plugin_url.py"""
+import unittest
+from lib.plugin_url import PluginUrl
+from lib.globals import G
+
+
+class TestPluginUrl(unittest.TestCase):
+    """Test PluginUrl class"""
+
+    def setUp(self):
+        """Set the plugin base url"""
+        self.original_url = G.addon_config.url
+        G.addon_config.url = 'plugin://plugin.video.stalkervod/'
+
+    def tearDown(self):
+        """Restore the plugin base url"""
+        G.addon_config.url = self.original_url
+
+    def test_build(self):
+        """Test urls match G.get_plugin_url for the same params"""
+        url = PluginUrl({'action': 'play', 'video_id': PluginUrl.FIELD, 'series': 0, 'title': PluginUrl.FIELD, 'cmd': PluginUrl.FIELD})
+        for video_id, title, cmd in (('1', 'Title', ''), (2, 'Tïtle & more/?', 'ffrt http://host/movie.mp4?a=1&b=2'), ('3', None, 0)):
+            self.assertEqual(url.build(video_id, title, cmd),
+                             G.get_plugin_url({'action': 'play', 'video_id': video_id, 'series': 0, 'title': title, 'cmd': cmd}))
+
+    def test_build_static_tail(self):
+        """Test static params after the last field and templates without fields"""
+        url = PluginUrl({'action': 'play', 'series': PluginUrl.FIELD, 'season_no': 1, 'poster_url': 'http://host/a b.jpg'})
+        self.assertEqual(url.build(5), G.get_plugin_url({'action': 'play', 'series': 5, 'season_no': 1, 'poster_url': 'http://host/a b.jpg'}))
+        self.assertEqual(PluginUrl({'action': 'vod'}).build(), G.get_plugin_url({'action': 'vod'}))
+
+    def test_build_wrong_values(self):
+        """Test every field needs a value"""
+        url = PluginUrl({'action': 'add_fav', 'video_id': PluginUrl.FIELD, '_type': 'vod'})
+        with self.assertRaises(ValueError):
+            url.build()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Test Module for prefetch.py"""
+import json
+import unittest
+from unittest.mock import patch
+from lib.prefetch import Prefetcher
+from lib.globals import G
+
+LISTING = {'params': {'action': 'vod_listing', 'category': 'movies', 'category_id': '12', 'page': '1', 'update_listing': 'False'},
+           'total_pages': 10}
+
+
+class TestPrefetcher(unittest.TestCase):
+    """Test Prefetcher class"""
+
+    def setUp(self):
+        """Save prefetch settings"""
+        self.original_settings = (G.addon_config.prefetch_depth, G.addon_config.prefetch_pages_per_minute,
+                                  G.addon_config.max_page_limit, G.addon_config.listing_cache_ttl)
+        G.addon_config.prefetch_depth = 1
+        G.addon_config.prefetch_pages_per_minute = 10
+        G.addon_config.max_page_limit = 2
+        G.addon_config.listing_cache_ttl = 300
+
+    def tearDown(self):
+        """Restore prefetch settings"""
+        (G.addon_config.prefetch_depth, G.addon_config.prefetch_pages_per_minute,
+         G.addon_config.max_page_limit, G.addon_config.listing_cache_ttl) = self.original_settings
+
+    @patch('lib.prefetch.xbmcgui')
+    def test_publish(self, mock_xbmcgui):
+        """Test publish sets the window property"""
+        Prefetcher.publish(LISTING['params'], 10)
+        mock_xbmcgui.Window.assert_called_with(10000)
+        key, value = mock_xbmcgui.Window.return_value.setProperty.call_args[0]
+        self.assertEqual(key, 'plugin.video.stalkervod.last_listing')
+        self.assertEqual(json.loads(value), LISTING)
+
+    @patch('lib.prefetch.xbmcgui')
+    def test_publish_unknown_action(self, mock_xbmcgui):
+        """Test listings that cannot be prefetched are not published"""
+        Prefetcher.publish({'action': 'season_listing', 'page': '1'}, 10)
+        mock_xbmcgui.Window.assert_not_called()
+
+    def test_get_next_page(self):
+        """Test next page block"""
+        self.assertEqual(Prefetcher.get_next_page(1, 10, 2), 3)
+        self.assertEqual(Prefetcher.get_next_page(9, 10, 2), 1)
+
+    @patch('lib.prefetch.Api')
+    @patch('lib.prefetch.xbmcgui')
+    def test_run(self, mock_xbmcgui, mock_api):
+        """Test next block is fetched once per published listing"""
+        mock_xbmcgui.Window.return_value.getProperty.return_value = json.dumps(LISTING)
+        G.addon_config.prefetch_depth = 2
+        prefetcher = Prefetcher()
+        prefetcher.run()
+        self.assertEqual(mock_api.get_videos.call_count, 2)
+        mock_api.get_videos.assert_any_call('12', 3, '', 0)
+        mock_api.get_videos.assert_any_call('12', 5, '', 0)
+        prefetcher.run()
+        self.assertEqual(mock_api.get_videos.call_count, 2)
+
+    @patch('lib.prefetch.Api')
+    @patch('lib.prefetch.xbmcgui')
+    def test_run_disabled(self, mock_xbmcgui, mock_api):
+        """Test depth 0 disables prefetch"""
+        mock_xbmcgui.Window.return_value.getProperty.return_value = json.dumps(LISTING)
+        G.addon_config.prefetch_depth = 0
+        Prefetcher().run()
+        mock_api.get_videos.assert_not_called()
+
+    @patch('lib.prefetch.Api')
+    @patch('lib.prefetch.xbmcgui')
+    def test_run_budget(self, mock_xbmcgui, mock_api):
+        """Test prefetch stops when the per minute page budget is used up"""
+        mock_xbmcgui.Window.return_value.getProperty.return_value = json.dumps(LISTING)
+        G.addon_config.prefetch_depth = 5
+        G.addon_config.prefetch_pages_per_minute = 4
+        prefetcher = Prefetcher()
+        prefetcher.run()
+        self.assertEqual(mock_api.get_videos.call_count, 2)
+        # Listing is retried on next run since it was not completed
+        prefetcher.run()
+        self.assertEqual(mock_api.get_videos.call_count, 2)
+
+    @patch('lib.prefetch.Api')
+    @patch('lib.prefetch.xbmcgui')
+    def test_run_failure(self, mock_xbmcgui, mock_api):
+        """Test a failed prefetch does not raise"""
+        mock_xbmcgui.Window.return_value.getProperty.return_value = json.dumps(LISTING)
+        mock_api.get_videos.side_effect = IOError('Connection reset')
+        Prefetcher().run()
+        mock_api.get_videos.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,9 +21,12 @@ class TestBackgroundService(unittest.TestCase):
         self.assertIsNotNone(service._player)  # pylint: disable=protected-access
         mock_player_monitor.assert_called_once()
 
+    @patch('lib.service.CatalogueSync')
+    @patch('lib.service.Prefetcher')
+    @patch('lib.service.G.init_globals')
     @patch('lib.service.PlayerMonitor')
     @patch('lib.service.Logger')
-    def test_background_service_run_normal_exit(self, mock_logger, mock_player_monitor):  # pylint: disable=unused-argument,invalid-name
+    def test_background_service_run_normal_exit(self, mock_logger, mock_player_monitor, mock_g, mock_prefetcher, mock_catalogue_sync):  # pylint: disable=unused-argument,invalid-name
         """Test BackgroundService run method with normal exit"""
         service = BackgroundService()
 
@@ -40,9 +43,13 @@ class TestBackgroundService(unittest.TestCase):
         mock_logger.debug.assert_any_call('Service started')
         mock_logger.debug.assert_any_call('Service stopped')
 
+    @patch('lib.service.Auth')
+    @patch('lib.service.CatalogueSync')
+    @patch('lib.service.Prefetcher')
+    @patch('lib.service.G.init_globals')
     @patch('lib.service.PlayerMonitor')
     @patch('lib.service.Logger')
-    def test_background_service_run_with_wait_cycles(self, mock_logger, mock_player_monitor):  # pylint: disable=unused-argument,invalid-name
+    def test_background_service_run_with_wait_cycles(self, mock_logger, mock_player_monitor, mock_g, mock_prefetcher, mock_catalogue_sync, mock_auth):  # pylint: disable=unused-argument,invalid-name,too-many-positional-arguments
         """Test BackgroundService run method with wait cycles"""
         service = BackgroundService()
 
@@ -59,9 +66,62 @@ class TestBackgroundService(unittest.TestCase):
         mock_logger.debug.assert_any_call('Service started')
         mock_logger.debug.assert_any_call('Service stopped')
 
+    @patch('lib.service.Auth')
+    @patch('lib.service.CatalogueSync')
+    @patch('lib.service.Prefetcher')
+    @patch('lib.service.G.init_globals')
     @patch('lib.service.PlayerMonitor')
     @patch('lib.service.Logger')
-    def test_background_service_run_wait_for_abort_break(self, mock_logger, mock_player_monitor):  # pylint: disable=unused-argument,invalid-name
+    def test_background_service_run_task_error(self, mock_logger, mock_player_monitor, mock_g, mock_prefetcher, mock_catalogue_sync, mock_auth):  # pylint: disable=unused-argument,invalid-name,too-many-positional-arguments
+        """Test BackgroundService keeps running when a task fails unexpectedly"""
+        service = BackgroundService()
+        mock_player_monitor.return_value.isPlaying.return_value = False
+        mock_catalogue_sync.return_value.run.side_effect = Exception('Error getting token')
+        setattr(service, 'abortRequested', Mock(side_effect=[False, False, True]))
+        setattr(service, 'waitForAbort', Mock(return_value=False))
+
+        service.run()
+
+        self.assertEqual(mock_catalogue_sync.return_value.run.call_count, 2)
+        self.assertEqual(mock_prefetcher.return_value.run.call_count, 2)
+        mock_logger.error.assert_called_with("Catalogue sync failed: Exception('Error getting token')")
+        mock_logger.debug.assert_any_call('Service stopped')
+
+    @patch('lib.service.PortalSession')
+    @patch('lib.service.Auth')
+    @patch('lib.service.CatalogueSync')
+    @patch('lib.service.Prefetcher')
+    @patch('lib.service.G.init_globals')
+    @patch('lib.service.PlayerMonitor')
+    @patch('lib.service.Logger')
+    def test_background_service_settings_changed(self, mock_logger, mock_player_monitor, mock_g, mock_prefetcher, mock_catalogue_sync, mock_auth, mock_session):  # pylint: disable=unused-argument,invalid-name,too-many-positional-arguments
+        """Test changed settings are reloaded and the tasks start over with them"""
+        service = BackgroundService()
+        mock_player_monitor.return_value.isPlaying.return_value = False
+        setattr(service, 'abortRequested', Mock(side_effect=[False, False, False, True]))
+
+        def wait_for_abort(timeout):  # pylint: disable=unused-argument
+            if mock_prefetcher.return_value.run.call_count == 1:
+                service.onSettingsChanged()
+            return False
+
+        setattr(service, 'waitForAbort', wait_for_abort)
+
+        service.run()
+
+        self.assertEqual(mock_g.call_count, 2)
+        mock_session.close.assert_called_once()
+        self.assertEqual(mock_prefetcher.call_count, 2)
+        self.assertEqual(mock_catalogue_sync.call_count, 2)
+        # Keep alive runs at once with the new settings
+        self.assertEqual(mock_auth.return_value.send_watchdog.call_count, 2)
+
+    @patch('lib.service.CatalogueSync')
+    @patch('lib.service.Prefetcher')
+    @patch('lib.service.G.init_globals')
+    @patch('lib.service.PlayerMonitor')
+    @patch('lib.service.Logger')
+    def test_background_service_run_wait_for_abort_break(self, mock_logger, mock_player_monitor, mock_g, mock_prefetcher, mock_catalogue_sync):  # pylint: disable=unused-argument,invalid-name
         """Test BackgroundService run method when waitForAbort returns True (covers line 27)"""
         service = BackgroundService()
 
@@ -76,11 +136,69 @@ class TestBackgroundService(unittest.TestCase):
 
         # Should have called waitForAbort once and then broken out of the loop
         self.assertEqual(wait_for_abort_mock.call_count, 1)
-        wait_for_abort_mock.assert_called_with(10)
+        wait_for_abort_mock.assert_called_with(1)
         mock_logger.debug.assert_any_call('Service started')
         mock_logger.debug.assert_any_call('Service stopped')
 
 
+    @patch('lib.service.Auth')
+    @patch('lib.service.CatalogueSync')
+    @patch('lib.service.Prefetcher')
+    @patch('lib.service.G.init_globals')
+    @patch('lib.service.PlayerMonitor')
+    @patch('lib.service.Logger')
+    def test_background_service_run_prefetch(self, mock_logger, mock_player_monitor, mock_g, mock_prefetcher, mock_catalogue_sync, mock_auth):  # pylint: disable=unused-argument,too-many-positional-arguments
+        """Test BackgroundService prefetches and syncs the catalogue only while nothing is playing"""
+        mock_player_monitor.return_value.isPlaying.side_effect = [False, True]
+        service = BackgroundService()
+        setattr(service, 'abortRequested', Mock(side_effect=[False, False, True]))
+        setattr(service, 'waitForAbort', Mock(return_value=False))
+
+        service.run()
+
+        mock_g.assert_called_once()
+        mock_prefetcher.return_value.run.assert_called_once()
+        mock_catalogue_sync.return_value.run.assert_called_once()
+
+    @patch('lib.service.time')
+    @patch('lib.service.Auth')
+    @patch('lib.service.CatalogueSync')
+    @patch('lib.service.Prefetcher')
+    @patch('lib.service.G.init_globals')
+    @patch('lib.service.PlayerMonitor')
+    @patch('lib.service.Logger')
+    def test_background_service_run_watchdog(self, mock_logger, mock_player_monitor, mock_g, mock_prefetcher, mock_catalogue_sync,  # pylint: disable=unused-argument,too-many-positional-arguments
+                                             mock_auth, mock_time):
+        """Test BackgroundService refreshes the token at start and then on the watchdog interval"""
+        mock_time.time.side_effect = [0, 10, 10, 20, 130, 130]
+        service = BackgroundService()
+        setattr(service, 'abortRequested', Mock(side_effect=[False, False, False, True]))
+        setattr(service, 'waitForAbort', Mock(return_value=False))
+
+        service.run()
+
+        self.assertEqual(mock_auth.return_value.send_watchdog.call_count, 2)
+        mock_auth.return_value.refresh_ahead.assert_called_with(15 * 60)
+
+    @patch('lib.service.Auth')
+    @patch('lib.service.CatalogueSync')
+    @patch('lib.service.Prefetcher')
+    @patch('lib.service.G.init_globals')
+    @patch('lib.service.PlayerMonitor')
+    @patch('lib.service.Logger')
+    def test_background_service_keep_alive_failure(self, mock_logger, mock_player_monitor, mock_g, mock_prefetcher, mock_catalogue_sync,  # pylint: disable=unused-argument,too-many-positional-arguments
+                                                   mock_auth):
+        """Test a failed token refresh does not stop the service"""
+        mock_auth.return_value.refresh_ahead.side_effect = IOError('Connection reset')
+        service = BackgroundService()
+        setattr(service, 'abortRequested', Mock(side_effect=[False, False, True]))
+        setattr(service, 'waitForAbort', Mock(return_value=False))
+
+        service.run()
+
+        self.assertEqual(mock_auth.return_value.refresh_ahead.call_count, 1)
+        mock_logger.warn.assert_called_once()
+
 class TestPlayerMonitor(unittest.TestCase):
     """Test PlayerMonitor class"""
 
@@ -0,0 +1,160 @@
+"""Test Module for session.py"""
+import time
+import unittest
+from unittest.mock import patch, Mock
+import requests
+from lib.session import PortalSession
+from lib.globals import G
+from tests.fake_portal import FakePortal
+
+
+class TestPortalSession(unittest.TestCase):
+    """Test PortalSession class"""
+
+    def setUp(self):
+        """Start every test with a fresh session"""
+        PortalSession.close()
+
+    def tearDown(self):
+        """Drop the session created by the test"""
+        PortalSession.close()
+
+    def test_session_is_shared(self):
+        """Test the same session is reused across calls"""
+        session = PortalSession.get_session()
+        self.assertIs(session, PortalSession.get_session())
+
+    def test_pool_size(self):
+        """Test adapters are mounted with configured pool size"""
+        original_pool_size = G.addon_config.pool_size
+        G.addon_config.pool_size = 7
+        try:
+            session = PortalSession.get_session()
+            for prefix in ('http://', 'https://'):
+                adapter = session.get_adapter(prefix + 'xyz.com')
+                self.assertEqual(adapter._pool_maxsize, 7)  # pylint: disable=protected-access
+                self.assertEqual(adapter._pool_connections, 7)  # pylint: disable=protected-access
+        finally:
+            G.addon_config.pool_size = original_pool_size
+
+    @patch('requests.Session.get')
+    def test_get(self, mock_get):
+        """Test get delegates to the pooled session"""
+        mock_get.return_value = Mock(status_code=200, content=b'{}')
+        response = PortalSession.get(url='http://xyz.com/load.php', headers={'Cookie': 'mac=1'}, params={'type': 'stb'})
+        self.assertEqual(response.status_code, 200)
+        mock_get.assert_called_once_with(url='http://xyz.com/load.php', headers={'Cookie': 'mac=1'}, params={'type': 'stb'}, timeout=(5, 15), stream=False)
+
+    def test_close(self):
+        """Test close drops the session"""
+        session = PortalSession.get_session()
+        PortalSession.close()
+        self.assertIsNot(session, PortalSession.get_session())
+
+
+class TestPortalSessionRetry(unittest.TestCase):
+    """Test retry policy against the fake portal"""
+
+    def setUp(self):
+        """Start the fake portal with short timeouts and backoff"""
+        self.original_config = (G.addon_config.network_retries, G.addon_config.connect_timeout, G.addon_config.read_timeout,
+                                G.addon_config.retry_backoff)
+        G.addon_config.network_retries = 2
+        G.addon_config.connect_timeout = 1
+        G.addon_config.read_timeout = 0.2
+        G.addon_config.retry_backoff = 0.01
+        PortalSession.set_deadline(None)
+        PortalSession.close()
+        self.portal = FakePortal().start()
+
+    def tearDown(self):
+        """Stop the fake portal and restore config"""
+        PortalSession.set_deadline(None)
+        PortalSession.close()
+        self.portal.stop()
+        (G.addon_config.network_retries, G.addon_config.connect_timeout, G.addon_config.read_timeout,
+         G.addon_config.retry_backoff) = self.original_config
+
+    def __get_profile(self):
+        """Call the fake portal"""
+        return PortalSession.get(url=self.portal.url, headers={}, params={'type': 'stb', 'action': 'get_profile'})
+
+    def test_retry_server_error(self):
+        """Test 5xx responses are retried"""
+        self.portal.faults = [503, 502]
+        response = self.__get_profile()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['js']['id'], '122342')
+        self.assertEqual(len(self.portal.requests), 3)
+
+    def test_retry_connection_reset(self):
+        """Test dropped connections are retried"""
+        self.portal.faults = ['reset']
+        self.assertEqual(self.__get_profile().status_code, 200)
+        self.assertEqual(len(self.portal.requests), 2)
+
+    def test_retry_read_timeout(self):
+        """Test a hanging portal is abandoned after the read timeout and retried"""
+        self.portal.hang_time = 1
+        self.portal.faults = ['hang']
+        start = time.monotonic()
+        self.assertEqual(self.__get_profile().status_code, 200)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_retries_exhausted(self):
+        """Test the last error is raised or returned when retries are used up"""
+        self.portal.faults = ['reset'] * 3
+        self.assertRaises(requests.ConnectionError, self.__get_profile)
+        self.portal.faults = [500] * 3
+        self.assertEqual(self.__get_profile().status_code, 500)
+
+    def test_client_error_not_retried(self):
+        """Test non transient errors are returned right away"""
+        self.portal.faults = [404]
+        self.assertEqual(self.__get_profile().status_code, 404)
+        self.assertEqual(len(self.portal.requests), 1)
+
+    def test_deadline(self):
+        """Test retries stop at the deadline of the user action"""
+        G.addon_config.network_retries = 5
+        G.addon_config.read_timeout = 5
+        self.portal.hang_time = 1
+        self.portal.faults = ['hang'] * 5
+        PortalSession.set_deadline(0.3)
+        start = time.monotonic()
+        self.assertRaises(requests.Timeout, self.__get_profile)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertRaises(requests.Timeout, self.__get_profile)
+
+
+
+class TestPortalSessionCompression(unittest.TestCase):
+    """Test content encoding negotiation against the fake portal"""
+
+    def setUp(self):
+        """Start a fake portal which gzips responses"""
+        PortalSession.close()
+        self.portal = FakePortal(catalogue_size=100, page_size=50, compress=True).start()
+
+    def tearDown(self):
+        """Stop the fake portal"""
+        PortalSession.close()
+        self.portal.stop()
+
+    def test_accept_encoding(self):
+        """Test only encodings which can be decoded are offered, most compact first"""
+        accept_encoding = PortalSession.get_accept_encoding()
+        self.assertTrue(accept_encoding.endswith('gzip, deflate'))
+        self.assertEqual(PortalSession.get_session().headers['Accept-Encoding'], accept_encoding)
+
+    def test_compressed_listing(self):
+        """Test a listing is transferred compressed and decoded transparently"""
+        response = PortalSession.get(url=self.portal.url, headers={}, params={'type': 'vod', 'action': 'get_ordered_list', 'p': '1'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(response.json()['js']['data']), 50)
+        self.assertEqual(response.raw.tell(), self.portal.bytes_sent)
+        self.assertLess(response.raw.tell() * 5, len(response.content))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Test Module for trigram.py"""
+import os
+import shutil
+import tempfile
+import unittest
+from lib.trigram import TrigramIndex
+
+TITLES = [(10, 'The Matrix'), (11, 'The Matrix Reloaded'), (12, 'Le Fabuleux Destin d\'Amélie Poulain'),
+          (13, 'Star Wars: The Empire Strikes Back'), (14, 'Stargate'), (15, 'Paris, Texas')]
+
+
+class TestTrigramIndex(unittest.TestCase):
+    """Test TrigramIndex class"""
+
+    def setUp(self):
+        """Index the titles"""
+        self.index = TrigramIndex.build(TITLES)
+
+    def test_get_trigrams(self):
+        """Test words are folded and padded, prefixes are not padded behind"""
+        self.assertEqual(TrigramIndex.get_trigrams('Ré!'), {'  r', ' re', 're '})
+        self.assertEqual(TrigramIndex.get_trigrams('Ré', prefixes=True), {'  r', ' re'})
+        self.assertEqual(TrigramIndex.get_trigrams(' - '), set())
+
+    def test_search(self):
+        """Test typos match and the title closest as a whole comes first"""
+        self.assertEqual([_id for _id, _ in self.index.search('matirx', 5)], [10, 11])
+        self.assertEqual(self.index.search('AMELIE', 5), [(12, 1.0)])
+        self.assertEqual(self.index.search('star wors', 1)[0][0], 13)
+        self.assertEqual(self.index.search('berlin', 5), [])
+        self.assertEqual(self.index.search('', 5), [])
+
+    def test_complete(self):
+        """Test titles with words starting with every word are completed shortest first"""
+        self.assertEqual(self.index.complete('sta', 5), [(14, 'Stargate'), (13, 'Star Wars: The Empire Strikes Back')])
+        self.assertEqual(self.index.complete('the ma', 5), [(10, 'The Matrix'), (11, 'The Matrix Reloaded')])
+        self.assertEqual(self.index.complete('ma the', 1), [(10, 'The Matrix')])
+        # The trigrams of "rix" are all in "Matrix" but no word starts with it
+        self.assertEqual(self.index.complete('rix', 5), [])
+        self.assertEqual(self.index.complete('', 5), [])
+
+    def test_save(self):
+        """Test an index is read back as saved and a damaged file is rejected"""
+        path = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(path, 'index')
+            self.index.save(file_path)
+            index = TrigramIndex.load(file_path)
+            self.assertEqual(len(index), len(TITLES))
+            self.assertEqual(index.get_title(2), 'Le Fabuleux Destin d\'Amélie Poulain')
+            self.assertEqual(index.search('paris texsa', 5), self.index.search('paris texsa', 5))
+            self.assertEqual(os.listdir(path), ['index'])
+            with open(file_path, 'r+b') as f:
+                f.truncate(os.path.getsize(file_path) - 1)
+            with self.assertRaises(ValueError):
+                TrigramIndex.load(file_path)
+            TrigramIndex.build([]).save(file_path)
+            self.assertEqual(TrigramIndex.load(file_path).search('matrix', 5), [])
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()